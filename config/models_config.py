@@ -51,7 +51,8 @@ MODEL_CONFIGS = {
         'description': 'Customer Spending Level Prediction',
         'category': 'customer_insights',
         'icon': 'fas fa-wallet',
-        'color': 'success'
+        'color': 'success',
+        'result_cache': {'max_entries': 4096, 'ttl': 600}
     },
 
     'classification_high_risk_cancelling': {
@@ -64,7 +65,8 @@ MODEL_CONFIGS = {
         'description': 'High Risk Cancelling Customer Classification',
         'category': 'risk_operations',
         'icon': 'fas fa-user-times',
-        'color': 'danger'
+        'color': 'danger',
+        'micro_batch': {'max_batch_size': 32, 'max_wait_ms': 2}
     },
 
     'classification_potential_region': {
@@ -116,7 +118,8 @@ MODEL_CONFIGS = {
         'description': 'Recommended Product Price Prediction',
         'category': 'sales_revenue',
         'icon': 'fas fa-dollar-sign',
-        'color': 'success'
+        'color': 'success',
+        'result_cache': {'max_entries': 4096, 'ttl': 600}
     },
 
     'regression_state_revenue': {
@@ -129,7 +132,8 @@ MODEL_CONFIGS = {
         'description': 'State Revenue Regression',
         'category': 'sales_revenue',
         'icon': 'fas fa-chart-line',
-        'color': 'info'
+        'color': 'info',
+        'micro_batch': {'max_batch_size': 32, 'max_wait_ms': 2}
     },
 
     'regression_failed_orders': {
@@ -188,6 +192,28 @@ MODEL_CONFIGS = {
             3: 'VIP Shoppers',
             4: 'Problem Customers'
         }
+    },
+
+    'regional_clustering': {
+        'model_file': 'regional_clustering_model.pkl',
+        'encoders_file': None,
+        'scaler_file': 'regional_clustering_scaler.pkl',
+        'pca_file': 'regional_clustering_pca.pkl',
+        'features_file': 'regional_clustering_features.pkl',
+        'features': ['age', 'overall_review', 'previous_purchases', 'frequency_of_purchases', 'subscription_status', 'gender'],
+        'cat_features': ['subscription_status', 'gender', 'frequency_of_purchases'],
+        'type': 'clustering',
+        'description': 'Regional Clustering',
+        'category': 'risk_operations',
+        'icon': 'fas fa-globe',
+        'color': 'dark',
+        'cluster_names': {
+            0: 'Urban High-Value Customers',
+            1: 'Suburban Frequent Shoppers',
+            2: 'Rural Occasional Buyers',
+            3: 'Young Trend Followers',
+            4: 'Senior Loyal Patrons'
+        }
     }
 }
 
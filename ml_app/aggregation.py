@@ -0,0 +1,354 @@
+"""Out-of-core grouped aggregation over the Sales fact table.
+
+``Aggregation(by, aggs).run(source)`` returns what
+``sales.groupby(by).agg(**aggs)`` would, without ever holding the whole
+table. Each chunk of rows is reduced to a partial state per group, partial
+states are merged, and the result is finalized at the end. Memory is bounded
+by the chunk size and the number of groups (plus the distinct values per
+group for ``nunique``), not by the number of rows. With ``workers > 1``,
+chunks are read and reduced on a pool of worker processes and only their
+partial states come back.
+
+Partial state kept per function:
+
+    count, size, sum, min, max   the same function, merged with itself (size and count by sum)
+    mean                         sum and count
+    std, var                     count, sum and sum of squared deviations from the
+                                 chunk mean, merged with Chan et al.'s pairwise update
+    nunique                      the distinct (group, value) pairs
+
+Groups are columns, or ``Period``/``Lookup`` keys derived per chunk (month
+of ``sale_date``, state of ``code_customer``...). Sources are
+``SqliteChunks`` (rowid ranges of a ``warehouse_db`` table), ``FrameChunks``,
+or, in-process, any iterable of frames such as ``pd.read_csv(path, chunksize=...)``::
+
+    from ml_app.aggregation import Aggregation, Period, SqliteChunks
+    monthly = Aggregation(Period('sale_date', 'M'), {'revenue': ('Estimated_Unit_Price', 'sum'),
+                                                     'customers': ('code_customer', 'nunique')})
+    monthly.run(SqliteChunks(rows=50_000), workers=4)
+
+``customer_features`` streams the per-customer aggregates declared in
+``features`` the same way.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from . import features
+
+FUNCTIONS = ('count', 'size', 'sum', 'mean', 'std', 'var', 'min', 'max', 'nunique')
+
+# Partial states merged at a time; bounds the memory held by unmerged states
+MERGE_EVERY = 8
+
+
+class AggregationError(Exception):
+    """An aggregation function or source the engine does not support."""
+
+
+# Group keys derived from a chunk
+
+class Period:
+    """``column`` as a period of ``freq`` (``'M'``, ``'W'``, ``'D'``...)."""
+
+    def __init__(self, column, freq, name=None):
+        self.column = column
+        self.freq = freq
+        self.name = name or column
+        self.columns = (column,)
+
+    def __call__(self, chunk):
+        return pd.to_datetime(chunk[self.column]).dt.to_period(self.freq).rename(self.name)
+
+
+class Lookup:
+    """``column`` mapped through ``mapping`` (a Series), e.g. customer code -> state."""
+
+    def __init__(self, column, mapping, name=None):
+        self.column = column
+        self.mapping = mapping
+        self.name = name or mapping.name or column
+        self.columns = (column,)
+
+    def __call__(self, chunk):
+        return chunk[self.column].map(self.mapping).rename(self.name)
+
+
+def state_of_customer(customers, locations):
+    """``Lookup`` key for the state of each customer, from Customers_f and Locations."""
+    locations = locations.rename(columns=str.strip)
+    state = customers['Zip_code'].map(locations.drop_duplicates('zip_code').set_index('zip_code')['state'])
+    return Lookup('code_customer', pd.Series(state.to_numpy(), index=customers['code_customer'], name='state'))
+
+
+# Sources
+
+class FrameChunks:
+    """An in-memory frame, ``rows`` at a time."""
+
+    def __init__(self, frame, rows=100_000):
+        self.frame = frame
+        self.rows = rows
+
+    def tasks(self):
+        return [(start, start + self.rows) for start in range(0, len(self.frame), self.rows)]
+
+    def read(self, task, columns=None):
+        chunk = self.frame.iloc[task[0]:task[1]]
+        return chunk if columns is None else chunk[list(columns)]
+
+    def __iter__(self):
+        return (self.read(task) for task in self.tasks())
+
+
+class SqliteChunks:
+    """A table of the warehouse database (``warehouse_db``), ``rows`` rowids at a time.
+
+    Each chunk is one indexed range read, so workers read their chunks
+    themselves and nothing but the rowid bounds crosses processes.
+    """
+
+    def __init__(self, path=None, table='Sales', rows=100_000):
+        from .warehouse_db import SCHEMA
+
+        if table not in SCHEMA:
+            raise AggregationError(f"Unknown warehouse table '{table}'")
+        self.path = path
+        self.table = table
+        self.rows = rows
+        self._database = None
+
+    @property
+    def database(self):
+        if self._database is None:
+            from .warehouse_db import WarehouseDatabase
+
+            self._database = WarehouseDatabase(self.path)
+        return self._database
+
+    def __getstate__(self):
+        # Workers open their own connection
+        return {**self.__dict__, '_database': None}
+
+    def tasks(self):
+        low, high = self.database._conn().execute(f'SELECT MIN(rowid), MAX(rowid) FROM "{self.table}"').fetchone()
+        if low is None:
+            return []
+        return [(start, min(start + self.rows - 1, high)) for start in range(low, high + 1, self.rows)]
+
+    def read(self, task, columns=None):
+        selected = ', '.join(f'"{column}"' for column in columns) if columns else '*'
+        return self.database.query(f'SELECT {selected} FROM "{self.table}" WHERE rowid BETWEEN ? AND ?', task)
+
+    def __iter__(self):
+        return (self.read(task) for task in self.tasks())
+
+
+# Partial states
+
+class State:
+    """Partial aggregates of some rows: ``frame`` has one row per group, ``pairs`` the distinct values."""
+
+    def __init__(self, frame, pairs):
+        self.frame = frame
+        self.pairs = pairs
+
+
+def _merge_deviations(frame, level, column):
+    # Chan et al.: M2 = sum(M2_i) + sum(n_i * (mean_i - mean)^2)
+    count, total = frame[f'count|{column}'], frame[f'sum|{column}']
+    grouped = frame.groupby(level=level, sort=False)
+    mean = grouped[f'sum|{column}'].transform('sum') / grouped[f'count|{column}'].transform('sum')
+    shift = (count * (total / count - mean) ** 2).where(count > 0, 0.0)
+    return (frame[f'm2|{column}'] + shift).groupby(level=level, sort=False).sum()
+
+
+class Aggregation:
+    """``groupby(by).agg(**aggs)``, computed chunk by chunk.
+
+    ``by`` is a column name, a derived key (``Period``, ``Lookup``) or a list
+    of them; ``aggs`` maps output names to ``(column, func)`` with ``func``
+    in ``FUNCTIONS``. ``transform(chunk)``, when given, turns each chunk
+    into the frame the keys and aggregates read (e.g. joins with small
+    dimension tables); it must be picklable to run on workers.
+    """
+
+    def __init__(self, by, aggs, transform=None):
+        self.keys = list(by) if isinstance(by, (list, tuple)) else [by]
+        self.aggs = dict(aggs)
+        self.transform = transform
+        for name, (column, func) in self.aggs.items():
+            if func not in FUNCTIONS:
+                raise AggregationError(f"Unsupported function '{func}' for '{name}'; use one of {', '.join(FUNCTIONS)}")
+        # Partial columns: (kind, column) in a stable order
+        parts = {}
+        for column, func in self.aggs.values():
+            kinds = {'count': ['count'], 'size': [], 'sum': ['sum'], 'mean': ['sum', 'count'],
+                     'std': ['sum', 'count', 'm2'], 'var': ['sum', 'count', 'm2'],
+                     'min': ['min'], 'max': ['max'], 'nunique': []}[func]
+            for kind in kinds:
+                parts[(kind, column)] = None
+        self.parts = list(parts)
+        self.distinct = list(dict.fromkeys(column for column, func in self.aggs.values() if func == 'nunique'))
+
+    @property
+    def columns(self):
+        """Columns read from the source, or None when a ``transform`` decides."""
+        if self.transform is not None:
+            return getattr(self.transform, 'columns', None)
+        columns = [c for key in self.keys for c in (key.columns if hasattr(key, 'columns') else (key,))]
+        columns += [column for column, _ in self.aggs.values()]
+        return list(dict.fromkeys(columns))
+
+    def _group_keys(self, chunk):
+        return [key(chunk) if callable(key) else chunk[key] for key in self.keys]
+
+    def partial(self, chunk):
+        """The partial state of one chunk of rows."""
+        if self.transform is not None:
+            chunk = self.transform(chunk)
+        keys = self._group_keys(chunk)
+        grouped = chunk.groupby(keys, sort=False)
+        named = {'size': grouped.size()}
+        for kind, column in self.parts:
+            label = f'{kind}|{column}'
+            if kind == 'm2':
+                named[label] = (grouped[column].var(ddof=0) * grouped[column].count()).fillna(0.0)
+            else:
+                named[label] = grouped[column].agg(kind)
+        frame = pd.DataFrame(named)
+        pairs = {}
+        for column in self.distinct:
+            values = pd.DataFrame({f'k{i}': key.to_numpy() for i, key in enumerate(keys)})
+            values['value'] = chunk[column].to_numpy()
+            pairs[column] = values.dropna().drop_duplicates()
+        return State(frame, pairs)
+
+    def merge(self, states):
+        """One state equivalent to all of ``states``; None when there are none."""
+        states = [state for state in states if state is not None]
+        if not states:
+            return None
+        if len(states) == 1:
+            return states[0]
+        frame = pd.concat([state.frame for state in states])
+        level = list(range(frame.index.nlevels))
+        how = {'size': 'sum'}
+        for kind, column in self.parts:
+            how[f'{kind}|{column}'] = {'count': 'sum', 'sum': 'sum', 'min': 'min', 'max': 'max', 'm2': 'sum'}[kind]
+        merged = frame.groupby(level=level, sort=False).agg(how)
+        for kind, column in self.parts:
+            if kind == 'm2':
+                merged[f'm2|{column}'] = _merge_deviations(frame, level, column)
+        pairs = {
+            column: pd.concat([state.pairs[column] for state in states], ignore_index=True).drop_duplicates()
+            for column in self.distinct
+        }
+        return State(merged, pairs)
+
+    def finalize(self, state):
+        """The ``groupby(by).agg(**aggs)`` frame of a merged state, sorted by group."""
+        frame = state.frame
+        result = {}
+        for name, (column, func) in self.aggs.items():
+            if func == 'size':
+                values = frame['size']
+            elif func in ('count', 'sum', 'min', 'max'):
+                values = frame[f'{func}|{column}']
+            elif func == 'mean':
+                values = frame[f'sum|{column}'] / frame[f'count|{column}'].where(frame[f'count|{column}'] > 0)
+            elif func in ('std', 'var'):
+                count = frame[f'count|{column}']
+                values = (frame[f'm2|{column}'] / (count - 1)).where(count > 1)
+                if func == 'std':
+                    values = np.sqrt(values)
+            else:
+                pairs = state.pairs[column]
+                keys = [pairs[f'k{i}'] for i in range(len(self.keys))]
+                counts = pairs.groupby(keys, sort=False).size()
+                counts.index = counts.index.set_names(frame.index.names)
+                values = counts.reindex(frame.index, fill_value=0)
+            result[name] = values
+        return pd.DataFrame(result, index=frame.index).sort_index()
+
+    def run(self, source, workers=1):
+        """Aggregate every chunk of ``source``; parallel when ``workers > 1`` and ``source`` has ``tasks()``."""
+        if workers > 1 and not hasattr(source, 'tasks'):
+            raise AggregationError('Parallel runs need a source with tasks() (SqliteChunks, FrameChunks)')
+        if workers > 1:
+            states = _run_parallel(self, source, workers)
+        elif hasattr(source, 'tasks'):
+            states = (self.partial(source.read(task, self.columns)) for task in source.tasks())
+        else:
+            states = (self.partial(chunk) for chunk in source)
+
+        merged = None
+        pending = []
+        for state in states:
+            pending.append(state)
+            if len(pending) >= MERGE_EVERY:
+                merged = self.merge([merged, *pending])
+                pending = []
+        merged = self.merge([merged, *pending])
+        if merged is None:
+            return pd.DataFrame(columns=list(self.aggs))
+        return self.finalize(merged)
+
+
+def _reduce(aggregation, source, task):
+    return aggregation.partial(source.read(task, aggregation.columns))
+
+
+def _run_parallel(aggregation, source, workers):
+    tasks = source.tasks()
+    with ProcessPoolExecutor(max_workers=min(workers, max(len(tasks), 1))) as pool:
+        futures = [pool.submit(_reduce, aggregation, source, task) for task in tasks]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+# Per-customer features
+
+# Sales column each join of ``features.JOINS`` matches on
+JOIN_KEYS = {'orders': 'code_order', 'products': 'SKU'}
+
+
+class FeatureInputs:
+    """Chunk transform: the joins and window masks of some ``features`` aggregates."""
+
+    def __init__(self, inputs, joins, tables, as_of, history_end):
+        self.inputs = inputs
+        self.joins = joins
+        # The Sales columns read: the rest come from the joins
+        needed = ['code_customer', *(JOIN_KEYS[name] for name in joins)]
+        for column, where in inputs.values():
+            needed += [column, features.WINDOWS[where][0]] if where else [column]
+        self.columns = [column for column in dict.fromkeys(needed) if not features.joins_for([column])]
+        # Only the small dimension tables the joins read travel to workers
+        self.tables = {name: tables[name] for name in ('Orders', 'Products_f', 'Sections') if name in tables}
+        self.as_of = pd.Timestamp(as_of)
+        self.history_end = pd.Timestamp(history_end)
+
+    def __call__(self, chunk):
+        for name, (join, _) in features.JOINS.items():
+            if name in self.joins:
+                chunk = join(chunk, self.tables)
+        return features.aggregate_inputs(chunk, self.inputs, self)
+
+
+def customer_features(source, names, tables, as_of, history_end, workers=1):
+    """The aggregate features ``names`` per customer seen in ``source``, streamed.
+
+    Matches ``FeatureContext(...).compute(names)`` for those customers.
+    ``tables`` holds the dimension tables joins need (Orders, Products_f,
+    Sections); ``as_of`` and ``history_end`` are the window bounds, e.g. the
+    ones ``warehouse_db`` records at build time.
+    """
+    unknown = [name for name in names if not isinstance(features.FEATURES.get(name), features.Aggregate)]
+    if unknown:
+        raise AggregationError(f"Not per-customer aggregates: {', '.join(unknown)}")
+    inputs, spec = features.aggregate_spec(names)
+    joins = features.joins_for(c for name in names for c in features.FEATURES[name].columns)
+    aggregation = Aggregation('code_customer', spec, FeatureInputs(inputs, joins, tables, as_of, history_end))
+    return features.fill_aggregates(aggregation.run(source, workers))
@@ -0,0 +1,267 @@
+"""JSON prediction API for every model in MODEL_CONFIGS.
+
+    GET  /ml/api/models                 model catalogue, expected inputs and registry stats
+    POST /ml/api/<model>/predict        one JSON object -> one prediction
+    POST /ml/api/<model>/batch          CSV body or JSON array -> all predictions
+    GET  /ml/health/ready               200 once this worker's models are warm, 503 before
+    GET  /metrics                       Prometheus metrics of this worker (see ``metrics``)
+
+Inputs are keyed by the model's feature names, with categorical columns given
+as raw labels (see ``inference.required_columns``). Scoring goes through the
+same compiled pipelines as the HTML views. Customer-level models also accept
+``{"code_customer": 17}`` alone (or batch rows with only that column): the
+prediction then comes from the materialized table when it has a row for the
+loaded version, and is computed live from the warehouse otherwise (see
+``prediction_table``).
+"""
+import io
+import json
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+from django.http import Http404, HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from . import metrics, warmup
+from .bundle import BundleError
+from .inference import predict_frame, required_columns
+from .registry import get_model, registry
+from .timing import stage, timed
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Upper bound on rows accepted by a single batch request
+BATCH_MAX_ROWS = 100000
+
+
+def dumps(data):
+    """Serialize plain Python data to JSON bytes.
+
+    Views convert model output with ``tolist()`` before building the
+    response, so no value needs a per-object fallback here. Without orjson
+    the output is the same compact UTF-8 that orjson writes.
+    """
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def loads(body):
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def json_response(data, status=200):
+    with stage('serialize'):
+        body = dumps(data)
+    return HttpResponse(body, status=status, content_type='application/json')
+
+
+def _error(message, status, **extra):
+    return json_response({'error': message, **extra}, status=status)
+
+
+def _get_model_or_error(model_name):
+    try:
+        return get_model(model_name), None
+    except KeyError:
+        return None, _error(f"Unknown model '{model_name}'", 404)
+    except (FileNotFoundError, BundleError) as e:
+        return None, _error(f'Model not available: {e}', 503)
+
+
+def _labels(config, preds):
+    cluster_names = config.get('cluster_names')
+    if not cluster_names:
+        return None
+    return [cluster_names.get(int(p), f'Cluster {int(p)}') for p in preds]
+
+
+def validate_input(config, payload):
+    """Return {column: message} for missing or wrongly typed inputs."""
+    categorical = set(config.get('cat_features', []))
+    errors = {}
+    for col in required_columns(config):
+        if col not in payload:
+            errors[col] = 'required'
+            continue
+        value = payload[col]
+        if col in categorical:
+            if not isinstance(value, (str, int)) or isinstance(value, bool):
+                errors[col] = 'expected a string label'
+        elif not isinstance(value, (int, float)) or isinstance(value, bool):
+            errors[col] = 'expected a number'
+    return errors
+
+
+@require_GET
+def models_api_view(request):
+    stats = registry.stats()
+    models = []
+    for name, config in registry.configs.items():
+        resident = stats['models'].get(name, {})
+        models.append({
+            'name': name,
+            'type': config['type'],
+            'description': config['description'],
+            'inputs': required_columns(config),
+            'categorical_inputs': config.get('cat_features', []),
+            'loaded': name in stats['models'],
+            'version': resident.get('version'),
+            'resident_bytes': resident.get('resident_bytes'),
+        })
+    del stats['models']
+    return json_response({'models': models, 'registry': stats})
+
+
+@require_GET
+def metrics_view(request):
+    if not metrics.metrics_enabled():
+        raise Http404('Metrics are disabled')
+    return HttpResponse(metrics.exposition(), content_type=metrics.CONTENT_TYPE)
+
+
+@require_GET
+def readiness_view(request):
+    state = warmup.state()
+    ready = warmup.is_ready()
+    return json_response({
+        'ready': ready,
+        'warmup': state['status'] if warmup.warmup_enabled() else 'disabled',
+        'seconds': None if state['finished'] is None else round(state['finished'] - state['started'], 3),
+        'models': state['models'],
+    }, status=200 if ready else 503)
+
+
+@csrf_exempt
+@require_POST
+def predict_api_view(request, model_name):
+    model_data, error = _get_model_or_error(model_name)
+    if error:
+        return error
+    config = model_data['config']
+
+    try:
+        with stage('parse'):
+            payload = loads(request.body or b'{}')
+    except ValueError:
+        return _error('Invalid JSON body', 400)
+    if not isinstance(payload, dict):
+        return _error('Expected a JSON object of features', 400)
+    if set(payload) == {'code_customer'}:
+        return _customer_response(model_name, model_data, [payload['code_customer']], single=True)
+    errors = validate_input(config, payload)
+    if errors:
+        return _error('Invalid input', 400, fields=errors)
+
+    try:
+        pred = np.asarray(model_data['pipeline'].predict_one(payload)).tolist()
+    except ValueError as e:
+        return _error(str(e), 400)
+
+    response = {
+        'model': model_name,
+        'version': model_data.get('version'),
+        'type': config['type'],
+        'prediction': pred,
+    }
+    labels = _labels(config, [pred])
+    if labels:
+        response['label'] = labels[0]
+    return json_response(response)
+
+
+def _customer_response(model_name, model_data, codes, single=False):
+    # Imported here: the prediction table pulls in pandas and the warehouse code
+    from .prediction_table import UnknownCustomerError, predict_customers
+    from .warehouse_db import WarehouseError
+
+    try:
+        preds, sources = predict_customers(model_data, codes)
+    except UnknownCustomerError as e:
+        return _error(str(e), 404)
+    except WarehouseError as e:
+        return _error(f'Live predictions not available: {e}', 503)
+    except LookupError as e:
+        return _error(str(e), 400)
+    config = model_data['config']
+    response = {
+        'model': model_name,
+        'version': model_data.get('version'),
+        'type': config['type'],
+    }
+    labels = _labels(config, preds)
+    if single:
+        response.update(code_customer=codes[0], prediction=preds[0], source=sources[0])
+        if labels:
+            response['label'] = labels[0]
+    else:
+        response.update(count=len(preds), predictions=preds, sources=sources)
+        if labels:
+            response['labels'] = labels
+    return json_response(response)
+
+
+@timed('parse')
+def _parse_batch_rows(request):
+    """Read a CSV body or a JSON array (optionally under "rows") into a DataFrame.
+
+    Raises ValueError for more than BATCH_MAX_ROWS rows before building the
+    whole frame; the body itself is capped by DATA_UPLOAD_MAX_MEMORY_SIZE.
+    """
+    import pandas as pd
+
+    if request.content_type in ('text/csv', 'application/csv'):
+        # Stops parsing one row past the limit
+        rows = pd.read_csv(io.BytesIO(request.body), nrows=BATCH_MAX_ROWS + 1)
+        _check_row_count(len(rows))
+        return rows
+    payload = loads(request.body or b'[]')
+    if isinstance(payload, dict):
+        payload = payload.get('rows', [])
+    if not isinstance(payload, list):
+        raise ValueError('Expected a JSON array of rows')
+    _check_row_count(len(payload))
+    return pd.DataFrame.from_records(payload)
+
+
+def _check_row_count(count):
+    if count > BATCH_MAX_ROWS:
+        raise ValueError(f'Too many rows: more than {BATCH_MAX_ROWS}')
+
+
+@csrf_exempt
+@require_POST
+def batch_predict_view(request, model_name):
+    model_data, error = _get_model_or_error(model_name)
+    if error:
+        return error
+
+    try:
+        rows = _parse_batch_rows(request)
+        if list(rows.columns) == ['code_customer']:
+            return _customer_response(model_name, model_data, rows['code_customer'].tolist())
+        preds = predict_frame(model_data, rows).tolist()
+    except RequestDataTooBig:
+        return _error(f'Request body larger than {settings.DATA_UPLOAD_MAX_MEMORY_SIZE} bytes', 413)
+    except (ValueError, TypeError) as e:  # pandas' ParserError is a ValueError
+        return _error(str(e), 400)
+
+    config = model_data['config']
+    response = {
+        'model': model_name,
+        'version': model_data.get('version'),
+        'type': config['type'],
+        'count': len(preds),
+        'predictions': preds,
+    }
+    labels = _labels(config, preds)
+    if labels:
+        response['labels'] = labels
+    return json_response(response)
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.core.signals import request_started
 
 
 class MlAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ml_app'
+
+    def ready(self):
+        from . import checks  # noqa: F401  (registers the model artifact checks)
+        from .warmup import on_request_started
+
+        # Warmup starts with a worker's first request, never at import time
+        request_started.connect(on_request_started, dispatch_uid='ml_warmup')
@@ -0,0 +1,167 @@
+"""Dynamic micro-batching of concurrent single-row predictions.
+
+A model opts in with a ``micro_batch`` entry in ``MODEL_CONFIGS``::
+
+    'micro_batch': {'max_batch_size': 32, 'max_wait_ms': 2},
+
+Requests hand their encoded row to the model's batcher and block. A worker
+thread takes the first queued row, keeps collecting until the batch is full
+or ``max_wait_ms`` has passed, runs one vectorized ``predict`` and scatters
+the results back. For tree ensembles most of a single-row call is fixed
+overhead, so one call for N rows costs about the same as one call for one.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT_MS = 2.0
+
+# Upper bounds of the batch-size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+_STOP = object()
+
+
+class MicroBatcher:
+    def __init__(self, predict, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        self.predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.size_counts = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+
+    def _ensure_worker(self):
+        # Called with self._lock held. Threads do not survive a fork
+        # (gunicorn --preload); restart per process
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='ml-microbatch', daemon=True)
+            self._thread.start()
+
+    def submit(self, X):
+        """Predict one encoded (1, n_features) row; blocks until its batch ran."""
+        with self._lock:
+            if self._closed:
+                future = None
+            else:
+                self._ensure_worker()
+                future = Future()
+                self._queue.put((X, future, time.perf_counter()))
+        if future is None:
+            return self.predict(X)[0]
+        return future.result()
+
+    def close(self):
+        """Stop the worker once the rows already queued are served.
+
+        Requests still holding a closed batcher (e.g. the previous version of
+        a hot-reloaded model) predict their row directly.
+        """
+        with self._lock:
+            self._closed = True
+            if self._thread is not None and self._thread.is_alive():
+                self._queue.put(_STOP)
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = self._collect(first)
+            started = time.perf_counter()
+            X = np.vstack([item[0] for item in batch])
+            try:
+                preds = self.predict(X)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future, _), pred in zip(batch, preds):
+                    future.set_result(pred)
+            self._record(batch, started)
+
+    def _record(self, batch, started):
+        waits = [started - enqueued for _, _, enqueued in batch]
+        size = len(batch)
+        bucket = next((i for i, bound in enumerate(BATCH_SIZE_BUCKETS) if size <= bound), len(BATCH_SIZE_BUCKETS))
+        with self._stats_lock:
+            self.batches += 1
+            self.rows += size
+            self.wait_total += sum(waits)
+            self.wait_max = max(self.wait_max, max(waits))
+            self.size_counts[bucket] += 1
+
+    def stats(self):
+        with self._stats_lock:
+            labels = [str(bound) for bound in BATCH_SIZE_BUCKETS] + ['+Inf']
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'batches': self.batches,
+                'rows': self.rows,
+                'mean_batch_size': self.rows / self.batches if self.batches else 0.0,
+                'batch_size_histogram': dict(zip(labels, self.size_counts)),
+                'mean_queue_wait_ms': 1000.0 * self.wait_total / self.rows if self.rows else 0.0,
+                'max_queue_wait_ms': 1000.0 * self.wait_max,
+                'queued': self._queue.qsize(),
+            }
+
+
+def batcher_for(name, config, predict):
+    """A new batcher for model ``name``, or None when its config does not opt in.
+
+    The batcher belongs to the pipeline it is made for: the registry closes it
+    with that pipeline (``CompiledPipeline.close``) once a reloaded version has
+    been swapped in or the model is evicted, never when another pipeline of the
+    same name is merely built.
+    """
+    options = config.get('micro_batch')
+    if not options:
+        return None
+    return MicroBatcher(
+        predict,
+        max_batch_size=options.get('max_batch_size', DEFAULT_MAX_BATCH_SIZE),
+        max_wait_ms=options.get('max_wait_ms', DEFAULT_MAX_WAIT_MS),
+    )
+
+
+def stats():
+    """Stats of the batchers of the models loaded in the registry."""
+    from .registry import registry
+
+    return {
+        name: entry['pipeline'].batcher.stats()
+        for name, entry in registry.loaded().items()
+        if entry['pipeline'].batcher is not None
+    }
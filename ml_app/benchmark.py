@@ -0,0 +1,254 @@
+"""In-process benchmarks of every prediction path, with a JSON baseline.
+
+Two kinds of paths are timed:
+
+* ``view:<url name>``, ``api:predict:<model>``, ``api:batch:<model>`` and
+  ``metrics`` drive the URLs of ``ml_app/urls.py`` through the Django test
+  client, with the full middleware stack, using representative form and JSON
+  inputs;
+* ``stage:<stage>:<model>`` times each step of a prediction in isolation:
+  ``load`` (a cold load into a fresh registry), ``encode``, ``scale``,
+  ``predict`` (the compiled predict function on one row) and ``render`` (the
+  model's result page).
+
+The models are warmed first (see ``warmup``), then each path is run a few
+times untimed and then ``iterations`` times;
+the report gives mean/p50/p99 latency and single-threaded throughput. Run by
+``manage.py benchmark``, which can save the results as a baseline and fail
+when a later run is slower than the baseline by more than a threshold.
+"""
+import datetime
+import gc
+import json
+import platform
+import time
+
+import numpy as np
+from django.conf import settings
+from django.test import Client, RequestFactory, override_settings
+from django.urls import reverse
+
+from . import api
+from .bundle import BundleError, installed_version
+from .registry import ModelRegistry, registry
+from .views import render
+from .warmup import run_warmup
+
+BASELINE_FORMAT = 1
+
+# URL name -> (model it serves, representative form input); the views fill
+# every other field with their defaults
+VIEW_INPUTS = {
+    'women_preference': ('women_preference', {'age': '30', 'gender': 'Female', 'preferred_size': 'M'}),
+    'future_avg_basket': ('future_avg_basket', {'code_customer': 'C0001'}),
+    'potential_region': ('classification_potential_region', {'age_mean': '40', 'n_customers': '10'}),
+    'recommended_price': ('recommended_price', {
+        'sku_encoded': '3', 'num_purchases': '4', 'quantity': '2', 'date_flexibility': '1',
+        'estimated_unit_price': '50',
+    }),
+    'spending_level': ('spending_level', {
+        'gender': 'Male', 'age': '30', 'frequency_of_purchases': 'Rarely', 'payment_method': 'Cash',
+        'original_price': '100', 'discount_amount': '10',
+    }),
+    'regression_failed_orders': ('regression_failed_orders', {'year': '2026'}),
+    'classification_high_risk_cancelling': ('classification_high_risk_cancelling', {
+        'total_orders': '10', 'total_cancelled': '3', 'avg_unit_price': '40', 'unique_products': '5',
+    }),
+    'regression_state_revenue': ('regression_state_revenue', {
+        'nb_orders': '100', 'nb_customers': '40', 'avg_basket': '80', 'avg_age': '40', 'pct_male': '50',
+        'total_qty_sold': '300',
+    }),
+    'classification_customer_behavior': ('classification_customer_behavior', {
+        'total_purchases': '5', 'gender': 'Male', 'preferred_size': 'M', 'payment_method': 'Cash',
+        'frequency_of_purchases': 'Weekly',
+    }),
+    'future_purchases': ('future_purchases', {'total_spent': '300'}),
+    'customer_clustering': ('customer_clustering', {'total_purchases': '5', 'total_spent': '300'}),
+    'regional_clustering': ('regional_clustering', {'age': '30'}),
+}
+
+# GET-only pages without a model behind them
+STATIC_VIEWS = ('power_bi_dashboard', 'api_models', 'health_ready')
+
+LOAD_ITERATIONS = 3
+
+
+class Case:
+    """One benchmarked path; ``run`` is called once per iteration."""
+
+    def __init__(self, name, run, iterations=None):
+        self.name = name
+        self.run = run
+        self.iterations = iterations
+
+
+def summarize(samples):
+    """Latency statistics in milliseconds for a list of durations in seconds."""
+    ms = np.asarray(samples) * 1000.0
+    total = float(np.sum(samples))
+    return {
+        'iterations': len(samples),
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'min_ms': float(ms.min()),
+        'ops_per_sec': len(samples) / total if total else None,
+    }
+
+
+def _client_paths(client, batch_rows):
+    def get(url):
+        return lambda: client.get(url)
+
+    def post(url, data, content_type=None):
+        if content_type is None:
+            return lambda: client.post(url, data)
+        return lambda: client.post(url, data, content_type=content_type)
+
+    paths = []
+    for url_name, (model, form) in VIEW_INPUTS.items():
+        paths.append((f'view:{url_name}', post(reverse(url_name), form)))
+    for url_name in STATIC_VIEWS:
+        paths.append((f'view:{url_name}', get(reverse(url_name))))
+    paths.append(('metrics', get(reverse('metrics'))))
+
+    for name in registry.names():
+        try:
+            row = registry.get(name)['pipeline'].synthetic_row()
+        except (FileNotFoundError, BundleError):
+            continue
+        paths.append((f'api:predict:{name}', post(
+            reverse('api_predict', args=[name]), api.dumps(row), 'application/json')))
+        paths.append((f'api:batch:{name}', post(
+            reverse('batch_predict', args=[name]), api.dumps([row] * batch_rows), 'application/json')))
+    return paths
+
+
+def _stage_cases(name, request):
+    try:
+        entry = registry.get(name)
+    except (FileNotFoundError, BundleError):
+        return []
+    pipeline = entry['pipeline']
+    config = entry['config']
+    values = pipeline.synthetic_row()
+    encoded = pipeline.encode_row(values)
+    scaled = pipeline.finish(encoded.copy())
+    template = next((f'ml_app/{url}.html' for url, (model, _) in VIEW_INPUTS.items() if model == name), None)
+
+    def load():
+        ModelRegistry({name: config}).get(name)['pipeline'].close()
+
+    cases = [
+        Case(f'stage:load:{name}', load, LOAD_ITERATIONS),
+        Case(f'stage:encode:{name}', lambda: pipeline.encode_row(values)),
+        Case(f'stage:scale:{name}', lambda: pipeline.finish(encoded.copy())),
+        Case(f'stage:predict:{name}', lambda: pipeline.predict_fn(scaled)),
+    ]
+    if template is not None:
+        pred = pipeline.predict_fn(scaled)[0]
+        context = {'predictions': {name: {
+            'result': pred, 'description': config['description'], 'type': config['type'],
+        }}}
+        cases.append(Case(f'stage:render:{name}', lambda: render(request, template, context)))
+    return cases
+
+
+def build_cases(batch_rows=1000):
+    """Every benchmark case, in report order; cases of unavailable models are left out."""
+    client = Client(raise_request_exception=False)
+    cases = [Case(name, run) for name, run in _client_paths(client, batch_rows)]
+    request = RequestFactory().get('/')
+    for name in registry.names():
+        cases.extend(_stage_cases(name, request))
+    return cases
+
+
+def run_case(case, iterations, warmup=5):
+    """Time ``case``; returns its summary, or None when it does not succeed."""
+    iterations = case.iterations or iterations
+    for _ in range(min(warmup, iterations)):
+        result = case.run()
+        if getattr(result, 'status_code', 200) >= 500:
+            return None
+    samples = []
+    clock = time.perf_counter
+    # As timeit does: no collector pauses landing in random samples
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(iterations):
+            start = clock()
+            case.run()
+            samples.append(clock() - start)
+    finally:
+        gc.enable()
+    return summarize(samples)
+
+
+def run(iterations=200, warmup=5, batch_rows=1000, select=None, progress=None):
+    """Run the suite; returns a baseline document (see ``compare``)."""
+    # The test client talks to 'testserver'; the throwaway registries of the
+    # load cases must not start reload watchers
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], ML_RELOAD_INTERVAL=0):
+        # Measure warm paths only, and keep a background warmup from competing with them
+        run_warmup()
+        cases = [case for case in build_cases(batch_rows) if select is None or select(case.name)]
+        results = {}
+        skipped = []
+        for case in cases:
+            summary = run_case(case, iterations, warmup)
+            if summary is None:
+                skipped.append(case.name)
+            else:
+                results[case.name] = summary
+            if progress is not None:
+                progress(case.name, summary)
+    return {
+        'format': BASELINE_FORMAT,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'libraries': {module: installed_version(module) for module in ('django', 'numpy', 'pandas', 'sklearn', 'xgboost')},
+            'tree_engine': getattr(settings, 'ML_TREE_ENGINE', False),
+        },
+        'settings': {'iterations': iterations, 'warmup': warmup, 'batch_rows': batch_rows},
+        'results': results,
+        'skipped': skipped,
+    }
+
+
+def compare(baseline, current, threshold=0.25, metric='p50_ms', min_delta_ms=0.05):
+    """Compare two runs path by path.
+
+    A path regresses when ``metric`` grew by more than ``threshold`` (a
+    fraction) and by more than ``min_delta_ms``, so microsecond-scale paths do
+    not fail on timer noise. Returns ``[(path, old, new, ratio, regressed)]``
+    for the paths present in both runs.
+    """
+    rows = []
+    for name, new in current['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        before, after = old[metric], new[metric]
+        ratio = after / before if before else float('inf')
+        regressed = ratio > 1 + threshold and after - before > min_delta_ms
+        rows.append((name, before, after, ratio, regressed))
+    return rows
+
+
+def load_baseline(path):
+    with open(path) as f:
+        baseline = json.load(f)
+    if baseline.get('format') != BASELINE_FORMAT:
+        raise ValueError(f"{path}: baseline format {baseline.get('format')!r}, expected {BASELINE_FORMAT}")
+    return baseline
+
+
+def save_baseline(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+        f.write('\n')
@@ -0,0 +1,227 @@
+"""Single-file model bundles.
+
+A bundle holds everything one model needs (the estimator, its encoders,
+scaler, PCA and feature list) behind a JSON manifest, so the registry opens
+one file per model and can check it against ``MODEL_CONFIGS`` before
+serving anything. Layout::
+
+    b'MLBUNDLE' | uint32 manifest length | manifest JSON | artifacts pickle | model pickle
+
+The manifest records the offsets of both pickles and the SHA-256 of their
+bytes. Bundles are built from the legacy per-artifact pickles with
+``manage.py package_models``; the manifest keeps the SHA-256 of each of those
+source files too, so a pickle retrained after packaging shows up as a stale
+bundle instead of being silently shadowed by it.
+"""
+import datetime
+import hashlib
+import importlib.metadata
+import io
+import json
+import os
+import struct
+
+from .inference import categorical_sources, label_encoders
+
+BUNDLE_FORMAT = 1
+BUNDLE_SUFFIX = '.bundle'
+
+_MAGIC = b'MLBUNDLE'
+_HEADER = struct.Struct('<8sI')
+
+
+class BundleError(Exception):
+    """A bundle is unreadable, corrupt or does not match its model config."""
+
+
+# Import name -> distribution name, where they differ
+_DISTRIBUTIONS = {'sklearn': 'scikit-learn'}
+
+# Libraries whose pickles do not load across minor releases; the others only
+# have to agree on the major version
+_MINOR_PINNED = {'sklearn'}
+
+
+def installed_version(module):
+    """Installed version of ``module``'s distribution, or None; never imports it."""
+    try:
+        return importlib.metadata.version(_DISTRIBUTIONS.get(module, module))
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+
+def _library_versions(model):
+    """Versions of the libraries needed to unpickle ``model``."""
+    modules = ['numpy', 'sklearn']
+    root = type(model).__module__.split('.')[0]
+    if root not in modules:
+        modules.append(root)
+    versions = {}
+    for module in modules:
+        version = installed_version(module)
+        if version is not None:
+            versions[module] = version
+    return versions
+
+
+def source_digests(paths):
+    """{file name: SHA-256} of the source pickles a bundle is built from."""
+    digests = {}
+    for path in paths:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        digests[os.path.basename(path)] = digest.hexdigest()
+    return digests
+
+
+def _scaler_params(scaler):
+    if scaler is None:
+        return None
+    params = {'class': type(scaler).__name__}
+    if params['class'] == 'StandardScaler':
+        params['mean'] = None if scaler.mean_ is None else scaler.mean_.tolist()
+        params['scale'] = None if scaler.scale_ is None else scaler.scale_.tolist()
+    return params
+
+
+def build_manifest(name, config, artifacts, training_data=None, sources=None):
+    """Describe ``artifacts`` (model + side artifacts of one model) for its bundle."""
+    model = artifacts['model']
+    names = getattr(model, 'feature_names_in_', None)
+    vocabularies = {
+        str(col): [str(label) for label in le.classes_]
+        for col, le in label_encoders(artifacts).items()
+        if hasattr(le, 'classes_')
+    }
+    cluster_names = config.get('cluster_names')
+    return {
+        'format': BUNDLE_FORMAT,
+        'name': name,
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'type': config['type'],
+        'model_class': f'{type(model).__module__}.{type(model).__name__}',
+        'features': list(config['features']),
+        'feature_names_in': None if names is None else [str(n) for n in names],
+        'categorical': vocabularies,
+        'scaler': _scaler_params(artifacts.get('scaler')),
+        'cluster_names': None if not cluster_names else {str(k): v for k, v in cluster_names.items()},
+        'training_data': training_data,
+        'sources': sources,
+        'libraries': _library_versions(model),
+    }
+
+
+def _dump(obj):
+    import joblib
+
+    buffer = io.BytesIO()
+    joblib.dump(obj, buffer)
+    return buffer.getvalue()
+
+
+def write_bundle(path, manifest, artifacts):
+    """Write ``artifacts`` to ``path`` atomically; returns the final manifest."""
+    side = {key: value for key, value in artifacts.items() if key != 'model'}
+    sections = {'artifacts': _dump(side), 'model': _dump(artifacts['model'])}
+
+    digest = hashlib.sha256()
+    layout = {}
+    offset = 0
+    for key, data in sections.items():
+        layout[key] = [offset, len(data)]
+        offset += len(data)
+        digest.update(data)
+    manifest = dict(manifest, sections=layout, sha256=digest.hexdigest(), version=digest.hexdigest()[:12])
+
+    header = json.dumps(manifest).encode()
+    tmp = f'{path}.tmp-{os.getpid()}'
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, len(header)))
+        f.write(header)
+        for data in sections.values():
+            f.write(data)
+    os.replace(tmp, path)
+    return manifest
+
+
+def _parse_header(head, path):
+    if len(head) < _HEADER.size:
+        raise BundleError(f'{path}: truncated bundle')
+    magic, length = _HEADER.unpack_from(head)
+    if magic != _MAGIC:
+        raise BundleError(f'{path}: not a model bundle')
+    start = _HEADER.size + length
+    try:
+        manifest = json.loads(bytes(head[_HEADER.size:start]))
+    except ValueError as e:
+        raise BundleError(f'{path}: unreadable manifest ({e})') from e
+    if manifest.get('format') != BUNDLE_FORMAT:
+        raise BundleError(f"{path}: bundle format {manifest.get('format')!r}, expected {BUNDLE_FORMAT}")
+    return manifest, start
+
+
+def read_manifest(path):
+    """Just the manifest, without reading the pickled payload."""
+    with open(path, 'rb') as f:
+        head = f.read(_HEADER.size)
+        if len(head) == _HEADER.size:
+            head += f.read(_HEADER.unpack_from(head)[1])
+    return _parse_header(head, path)[0]
+
+
+def read_bundle(path):
+    """Read ``path`` in one go; returns (manifest, {section: bytes}) once its checksum matches."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    manifest, start = _parse_header(data, path)
+    payload = memoryview(data)[start:]
+    if hashlib.sha256(payload).hexdigest() != manifest.get('sha256'):
+        raise BundleError(f'{path}: checksum mismatch, the bundle is corrupt')
+    sections = {key: payload[offset:offset + length] for key, (offset, length) in manifest['sections'].items()}
+    return manifest, sections
+
+
+def load_section(sections, key):
+    import joblib
+
+    return joblib.load(io.BytesIO(sections[key]))
+
+
+def _release(version, module):
+    parts = version.split('.')
+    return tuple(parts[:2] if module in _MINOR_PINNED else parts[:1])
+
+
+def validate_manifest(manifest, name, config, source_paths=()):
+    """List the ways a bundle's manifest disagrees with the model's config.
+
+    ``source_paths`` are the model's source pickles; any of them still on disk
+    must be the file the bundle was packaged from.
+    """
+    problems = []
+    if manifest.get('name') != name:
+        problems.append(f"built for model {manifest.get('name')!r}")
+    if manifest.get('features') != list(config['features']):
+        problems.append('feature list differs from MODEL_CONFIGS')
+    names = manifest.get('feature_names_in')
+    if names is not None and set(names) != set(config['features']):
+        problems.append('estimator was fitted on other features')
+    if manifest.get('categorical'):
+        missing = [col for col in categorical_sources(config).values() if col not in manifest['categorical']]
+        if missing:
+            problems.append(f"no vocabulary for {', '.join(missing)}")
+    for module, built in (manifest.get('libraries') or {}).items():
+        current = installed_version(module)
+        if current is None:
+            problems.append(f'needs {module} {built}, which is not installed')
+            continue
+        if _release(built, module) != _release(current, module):
+            problems.append(f'built with {module} {built}, running {current}')
+    recorded = manifest.get('sources') or {}
+    present = [path for path in source_paths if os.path.basename(path) in recorded and os.path.exists(path)]
+    changed = [file for file, digest in source_digests(present).items() if digest != recorded[file]]
+    if changed:
+        problems.append(f"{', '.join(changed)} changed since the bundle was built")
+    return problems
@@ -0,0 +1,42 @@
+"""System checks run by runserver, migrate, test and ``manage.py check``.
+
+A bundle that cannot be read, no longer matches ``MODEL_CONFIGS`` or was
+packaged from other pickles than the ones now in ``models/`` is an error,
+so a bad deploy stops at startup instead of failing the first request for
+that model. Bundles are read and checksummed here but not unpickled.
+"""
+import os
+
+from django.core.checks import Error, Warning, register
+
+
+@register()
+def check_model_artifacts(app_configs, **kwargs):
+    # Imported here so loading the app (every manage.py command) stays light
+    from .bundle import BundleError, read_bundle, validate_manifest
+    from .registry import registry
+
+    messages = []
+    for name, config in registry.configs.items():
+        path = registry.bundle_path(name)
+        if os.path.exists(path):
+            try:
+                problems = validate_manifest(read_bundle(path)[0], name, config, registry.artifact_paths(name))
+            except (OSError, BundleError) as e:
+                problems = [str(e)]
+            if problems:
+                messages.append(Error(
+                    f"Model bundle for '{name}' is not usable: {'; '.join(problems)}",
+                    hint='Rebuild it with `manage.py package_models`.',
+                    id='ml_app.E001',
+                ))
+            continue
+
+        missing = [os.path.basename(p) for p in registry.artifact_paths(name) if not os.path.exists(p)]
+        if missing:
+            messages.append(Warning(
+                f"Model '{name}' has no bundle and is missing {', '.join(missing)}",
+                hint='Its views will answer with an error until the artifacts are added.',
+                id='ml_app.W001',
+            ))
+    return messages
@@ -0,0 +1,451 @@
+"""Bulk scoring of every customer with the customer-level models.
+
+``manage.py score_customers`` splits the customers of ``Customers_f`` into
+chunks of consecutive codes. For each chunk it computes the features of every
+model in one pass over the chunk's sales (the declarations in ``features``,
+shared with the training notebooks) and scores them with one vectorised
+``predict_many`` call per model. Chunks run on a pool of worker processes;
+the parent writes each finished chunk, together with its progress record,
+in one transaction, so an interrupted run resumes where it stopped.
+
+Output is one row per customer with a column per model, in SQLite (the
+default, ``settings.CUSTOMER_SCORES``) or Parquet when pyarrow is installed.
+"""
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .data_loader import load_table, resolve_source
+from .features import JOINS, TABLES, FeatureContext, joins_for, model_features, uses_as_of
+from .registry import registry
+
+CUSTOMER_MODELS = (
+    'spending_level',
+    'classification_customer_behavior',
+    'classification_high_risk_cancelling',
+    'customer_clustering',
+    'future_purchases',
+    'women_preference',
+)
+
+# Bump when the output layout changes
+SCORES_FORMAT = 1
+
+
+class ScoringError(Exception):
+    """The run cannot start: no model to score, or an output that cannot be written."""
+
+
+# Warehouse
+
+class Warehouse:
+    """The feature context scoring reads, with the joins of every customer model made up front.
+
+    Chunks and selections are ``FeatureContext``s over a slice of the
+    customers that share those joins, so workers never join again.
+    """
+
+    def __init__(self, tables):
+        self.context = FeatureContext(tables)
+        self.context.prepare([feature for name in CUSTOMER_MODELS for feature in model_features(name)])
+        self._facts = self.context.facts(joins_for(column for _, columns in JOINS.values() for column in columns))
+
+    @classmethod
+    def load(cls):
+        return cls({name: load_table(name) for name in TABLES})
+
+    @property
+    def customers(self):
+        return self.context.customers
+
+    def codes(self):
+        return self.context.codes
+
+    def last_sale_date(self):
+        return self._facts['sale_date'].max()
+
+    def chunk(self, first, last, as_of=None):
+        """Feature context of the customers with ``first <= code <= last``."""
+        return self.context.restrict(first, last, as_of)
+
+    def select(self, codes, as_of=None):
+        """Feature context of the customers in ``codes``; unknown codes are left out."""
+        return self.context.select(codes, as_of)
+
+    def source_digests(self):
+        """64-bit digest per customer of their Customers_f row and every sale row joined to it.
+
+        Sales rows carry their order status and product, so a changed status
+        or product changes the digest of every customer who bought it.
+        """
+        customer_codes = self.codes()
+        sale_codes = self._facts['code_customer'].to_numpy()
+        customer_hash = pd.util.hash_pandas_object(self.customers, index=False).to_numpy()
+        sale_hash = pd.util.hash_pandas_object(self._facts, index=False).to_numpy()
+        sales_xor = np.zeros(len(customer_codes), dtype=np.uint64)
+        if len(sale_codes):
+            # Sales are sorted by customer: XOR each customer's run of rows
+            starts = np.flatnonzero(np.r_[True, sale_codes[1:] != sale_codes[:-1]])
+            run_codes = sale_codes[starts]
+            positions = np.searchsorted(customer_codes, run_codes)
+            known = (positions < len(customer_codes)) & \
+                (customer_codes[np.minimum(positions, len(customer_codes) - 1)] == run_codes)
+            sales_xor[positions[known]] = np.bitwise_xor.reduceat(sale_hash, starts)[known]
+        digests = pd.util.hash_pandas_object(pd.DataFrame({'customer': customer_hash, 'sales': sales_xor}), index=False)
+        # SQLite integers are signed
+        return pd.Series(digests.to_numpy().view(np.int64), index=customer_codes)
+
+
+def source_fingerprint():
+    """(name, size, mtime) of every workbook scoring reads; part of the run key."""
+    stamp = []
+    for name in TABLES:
+        st = resolve_source(name).stat()
+        stamp.append((name, st.st_size, st.st_mtime_ns))
+    return stamp
+
+
+def data_version():
+    """Short digest of ``source_fingerprint``; the export a stored prediction was computed from."""
+    return hashlib.sha256(json.dumps(source_fingerprint()).encode()).hexdigest()[:12]
+
+
+# Models whose features are measured relative to the scoring date
+AS_OF_MODELS = frozenset(name for name in CUSTOMER_MODELS if uses_as_of(model_features(name)))
+
+
+# Workers
+
+_warehouse = None
+
+
+def _get_warehouse():
+    # Forked workers inherit the parent's; others load it once per process
+    global _warehouse
+    if _warehouse is None:
+        _warehouse = Warehouse.load()
+    return _warehouse
+
+
+def _init_worker():
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def predict_customers(pipeline, name, context):
+    """``name``'s predictions for the customers of the feature ``context``."""
+    features = context.model_frame(name)
+    # Labels unseen in training (new zip codes, sizes...) score as the first class
+    return pipeline.predict_many(features[pipeline.columns], handle_unknown='first')
+
+
+def _score(context, models):
+    scores = pd.DataFrame({'code_customer': context.codes})
+    seconds = {}
+    # Every model's aggregates in one grouped pass; the model frames below reuse them
+    context.compute([feature for name in models for feature in model_features(name)])
+    for name in models:
+        start = time.perf_counter()
+        preds = predict_customers(registry.get(name)['pipeline'], name, context)
+        scores[name] = preds.tolist()
+        seconds[name] = time.perf_counter() - start
+    return scores, seconds
+
+
+def score_chunk(index, first, last, models, as_of):
+    """Score the customers with codes in ``[first, last]``.
+
+    Returns ``(index, scores, seconds)``: a frame with ``code_customer`` and
+    one column per model, and the time spent per model.
+    """
+    return (index, *_score(_get_warehouse().chunk(first, last, as_of), models))
+
+
+def score_codes(codes, models, as_of):
+    """``score_chunk`` for an arbitrary list of customer codes; returns ``(scores, seconds)``."""
+    return _score(_get_warehouse().select(codes, as_of), models)
+
+
+# Output
+
+def _column_type(values):
+    if pd.api.types.is_integer_dtype(values) or pd.api.types.is_bool_dtype(values):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(values):
+        return 'REAL'
+    return 'TEXT'
+
+
+class SqliteSink:
+    """``customer_scores`` plus the run and per-chunk progress records, in one SQLite file."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS score_runs (
+                key TEXT PRIMARY KEY, format INTEGER, as_of TEXT, models TEXT, versions TEXT,
+                chunks INTEGER, started TEXT, finished TEXT
+            );
+            CREATE TABLE IF NOT EXISTS score_progress (
+                run TEXT, chunk INTEGER, first_code INTEGER, last_code INTEGER, customers INTEGER,
+                seconds REAL, PRIMARY KEY (run, chunk)
+            );
+        ''')
+
+    def run(self, key):
+        row = self.conn.execute('SELECT finished FROM score_runs WHERE key = ?', (key,)).fetchone()
+        return None if row is None else {'finished': row[0]}
+
+    def done_chunks(self, key):
+        return {row[0] for row in self.conn.execute('SELECT chunk FROM score_progress WHERE run = ?', (key,))}
+
+    def start(self, key, info):
+        # A new run replaces the previous one's scores and progress
+        with self.conn:
+            self.conn.execute('DELETE FROM score_progress')
+            self.conn.execute('DELETE FROM score_runs')
+            self.conn.execute('DROP TABLE IF EXISTS customer_scores')
+            self.conn.execute(
+                'INSERT INTO score_runs VALUES (?, ?, ?, ?, ?, ?, ?, NULL)',
+                (key, SCORES_FORMAT, info['as_of'], json.dumps(info['models']), json.dumps(info['versions']),
+                 info['chunks'], _now()),
+            )
+
+    def write(self, key, index, first, last, scores, seconds):
+        with self.conn:
+            if not self._has_table():
+                columns = ', '.join(f'"{name}" {_column_type(scores[name])}' for name in scores.columns[1:])
+                self.conn.execute(f'CREATE TABLE customer_scores (code_customer INTEGER PRIMARY KEY, {columns})')
+            placeholders = ', '.join('?' * len(scores.columns))
+            self.conn.executemany(
+                f'INSERT OR REPLACE INTO customer_scores VALUES ({placeholders})',
+                scores.itertuples(index=False, name=None),
+            )
+            self.conn.execute(
+                'INSERT OR REPLACE INTO score_progress VALUES (?, ?, ?, ?, ?, ?)',
+                (key, index, first, last, len(scores), seconds),
+            )
+
+    def finish(self, key):
+        with self.conn:
+            self.conn.execute('UPDATE score_runs SET finished = ? WHERE key = ?', (_now(), key))
+
+    def close(self):
+        self.conn.close()
+
+    def _has_table(self):
+        return self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'customer_scores'"
+        ).fetchone() is not None
+
+
+class ParquetSink:
+    """Per-chunk part files and a progress manifest, concatenated into ``path`` at the end."""
+
+    def __init__(self, path):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ScoringError('Parquet output needs pyarrow (pip install pyarrow); use a .sqlite3 output instead')
+        self.path = Path(path)
+        self.parts = self.path.with_name(self.path.name + '.parts')
+        self.manifest_path = self.parts / 'progress.json'
+        self.manifest = None
+        if self.manifest_path.exists():
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+
+    def run(self, key):
+        if self.manifest is None or self.manifest['key'] != key:
+            return None
+        return {'finished': self.manifest['finished']}
+
+    def done_chunks(self, key):
+        return set(self.manifest['chunks']) if self.run(key) else set()
+
+    def start(self, key, info):
+        if self.parts.exists():
+            for part in self.parts.iterdir():
+                part.unlink()
+        self.parts.mkdir(parents=True, exist_ok=True)
+        self.manifest = {'key': key, 'format': SCORES_FORMAT, **info, 'started': _now(), 'finished': None,
+                         'chunks': []}
+        self._save()
+
+    def write(self, key, index, first, last, scores, seconds):
+        part = self.parts / f'part-{index:05d}.parquet'
+        tmp = part.with_name(part.name + '.tmp')
+        scores.to_parquet(tmp, index=False)
+        os.replace(tmp, part)
+        self.manifest['chunks'].append(index)
+        self._save()
+
+    def finish(self, key):
+        parts = sorted(self.parts.glob('part-*.parquet'))
+        frame = pd.concat([pd.read_parquet(part) for part in parts], ignore_index=True)
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        frame.sort_values('code_customer').to_parquet(tmp, index=False)
+        os.replace(tmp, self.path)
+        self.manifest['finished'] = _now()
+        self._save()
+
+    def close(self):
+        pass
+
+    def _save(self):
+        tmp = self.manifest_path.with_name('progress.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp, self.manifest_path)
+
+
+def open_sink(path):
+    if Path(path).suffix == '.parquet':
+        return ParquetSink(path)
+    return SqliteSink(path)
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+
+
+# Runs
+
+def default_workers():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def make_chunks(codes, chunk_size):
+    """[(index, first code, last code)] over the sorted customer codes."""
+    return [
+        (i, int(codes[start]), int(codes[min(start + chunk_size, len(codes)) - 1]))
+        for i, start in enumerate(range(0, len(codes), chunk_size))
+    ]
+
+
+def run_key(models, versions, as_of, chunk_size, fingerprint):
+    """Identifies a run: resuming is only allowed into a run with the same key."""
+    payload = json.dumps({
+        'format': SCORES_FORMAT, 'models': list(models), 'versions': versions, 'as_of': str(as_of),
+        'chunk_size': chunk_size, 'sources': fingerprint,
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def run_tasks(func, tasks, workers):
+    """Yield ``(args, func(*args))`` for each tuple in ``tasks`` as it finishes.
+
+    Runs in-process for one worker or task, on a process pool otherwise; the
+    warehouse must be loaded first (see ``use_warehouse``) so forked workers
+    share it.
+    """
+    if workers == 1 or len(tasks) <= 1:
+        for args in tasks:
+            yield args, func(*args)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), initializer=_init_worker) as pool:
+        futures = {pool.submit(func, *args): args for args in tasks}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def use_warehouse(warehouse=None):
+    """Make ``warehouse`` (default: freshly loaded) the one this process and its workers score from."""
+    global _warehouse
+    _warehouse = warehouse if warehouse is not None else Warehouse.load()
+    return _warehouse
+
+
+def default_as_of(warehouse):
+    """The day after the last sale."""
+    return warehouse.last_sale_date().normalize() + pd.Timedelta(days=1)
+
+
+def score_customers(output, models=None, workers=None, chunk_size=500, as_of=None, restart=False, progress=None):
+    """Score every customer into ``output``; returns a summary of the run.
+
+    ``models`` defaults to the available ``CUSTOMER_MODELS``. ``as_of`` is the
+    date recency features are measured from (default: the day after the last
+    sale). Chunks already written by an interrupted run with the same models,
+    versions, data and settings are skipped unless ``restart`` is set.
+    ``progress(done, total, customers, elapsed)`` is called after each chunk.
+    """
+    if models is None:
+        models = [name for name in CUSTOMER_MODELS if registry.available(name)]
+    if not models:
+        raise ScoringError('None of the customer models is available')
+    workers = workers or default_workers()
+
+    # Loaded before the pool starts so forked workers share them
+    versions = {name: registry.get(name)['version'] for name in models}
+    warehouse = use_warehouse()
+    as_of = pd.Timestamp(as_of) if as_of is not None else default_as_of(warehouse)
+
+    chunks = make_chunks(warehouse.codes(), chunk_size)
+    key = run_key(models, versions, as_of, chunk_size, source_fingerprint())
+    sink = open_sink(output)
+    try:
+        previous = None if restart else sink.run(key)
+        if previous is not None and previous['finished']:
+            return {'key': key, 'up_to_date': True, 'models': models, 'versions': versions,
+                    'customers': len(warehouse.codes()), 'chunks': len(chunks), 'skipped_chunks': len(chunks)}
+        if previous is None:
+            sink.start(key, {'as_of': as_of.isoformat(), 'models': models, 'versions': versions,
+                             'chunks': len(chunks)})
+            done = set()
+        else:
+            done = sink.done_chunks(key)
+        todo = [chunk for chunk in chunks if chunk[0] not in done]
+
+        model_seconds = dict.fromkeys(models, 0.0)
+        scored = 0
+        written = len(chunks) - len(todo)
+        start = time.perf_counter()
+        cpu = time.process_time()
+        tasks = [(*chunk, models, as_of) for chunk in todo]
+        for (index, first, last, *_), (_, scores, seconds) in run_tasks(score_chunk, tasks, workers):
+            sink.write(key, index, first, last, scores, sum(seconds.values()))
+            for name, value in seconds.items():
+                model_seconds[name] += value
+            scored += len(scores)
+            written += 1
+            if progress is not None:
+                progress(written, len(chunks), scored, time.perf_counter() - start)
+        sink.finish(key)
+    finally:
+        sink.close()
+
+    elapsed = time.perf_counter() - start
+    return {
+        'key': key,
+        'up_to_date': False,
+        'output': str(output),
+        'as_of': as_of.isoformat(),
+        'models': models,
+        'versions': versions,
+        'workers': workers,
+        'customers': scored,
+        'chunks': len(chunks),
+        'skipped_chunks': len(chunks) - len(todo),
+        'seconds': elapsed,
+        'customers_per_sec': scored / elapsed if elapsed else None,
+        'parent_cpu_seconds': time.process_time() - cpu,
+        # Summed over workers: more than the wall time when chunks ran in parallel
+        'model_seconds': model_seconds,
+    }
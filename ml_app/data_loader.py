@@ -0,0 +1,173 @@
+"""Cached access to the warehouse workbooks in ``data/``.
+
+``read_excel`` is by far the slowest tabular reader in pandas, so every
+workbook is converted once into a columnar cache (Parquet when pyarrow is
+installed, a pandas pickle otherwise) next to a small JSON manifest. The
+cache is reused as long as the source file's size and mtime are unchanged;
+if only the mtime moved, the content hash decides.
+
+    from ml_app.data_loader import load_table
+    sales = load_table('Sales')          # or load_table('sales_data')
+
+Works inside Django (``settings.DATA_DIR``) and from the training notebooks.
+"""
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path, PureWindowsPath
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    CACHE_FORMAT = 'parquet'
+except ImportError:
+    CACHE_FORMAT = 'pickle'
+
+# Columns parsed as datetimes when a workbook is cached
+DATE_COLUMNS = {
+    'Sales': ['sale_date'],
+}
+
+# Bump when the cached representation changes
+CACHE_VERSION = 1
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _setting(name):
+    try:
+        from django.conf import settings
+        from django.core.exceptions import ImproperlyConfigured
+    except ImportError:
+        return None
+    try:
+        return getattr(settings, name, None)
+    except ImproperlyConfigured:
+        # Outside Django (notebooks, scripts)
+        return None
+
+
+def data_dir():
+    path = _setting('DATA_DIR')
+    return Path(path) if path else Path(__file__).resolve().parent.parent / 'data'
+
+
+def cache_dir():
+    path = _setting('DATA_CACHE_DIR')
+    return Path(path) if path else data_dir() / '.cache'
+
+
+def resolve_source(name):
+    """Path of the workbook for a table name or a ``DATA_SOURCES`` key."""
+    from config.models_config import DATA_SOURCES
+
+    if name in DATA_SOURCES:
+        path = DATA_SOURCES[name]
+        if os.path.exists(path):
+            return Path(path)
+        # The configured paths point at a Windows machine; use the local copy
+        name = PureWindowsPath(path).stem
+    path = Path(name)
+    if path.suffix:
+        return path if path.is_absolute() else data_dir() / path
+    return data_dir() / f'{name}.xlsx'
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_paths(source):
+    base = cache_dir() / source.stem
+    ext = 'parquet' if CACHE_FORMAT == 'parquet' else 'pkl'
+    return Path(f'{base}.{ext}'), Path(f'{base}.json')
+
+
+def _read_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _is_fresh(manifest, source, stat, manifest_path):
+    if not manifest or manifest.get('version') != CACHE_VERSION or manifest.get('format') != CACHE_FORMAT:
+        return False
+    if manifest.get('source') != str(source) or manifest.get('size') != stat.st_size:
+        return False
+    if manifest.get('mtime') == stat.st_mtime:
+        return True
+    # Touched but possibly unchanged: compare contents
+    if manifest.get('sha256') != file_hash(source):
+        return False
+    manifest['mtime'] = stat.st_mtime
+    _write_manifest(manifest, manifest_path)
+    return True
+
+
+def read_source(source):
+    df = pd.read_excel(source)
+    for col in DATE_COLUMNS.get(source.stem, []):
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col])
+    return df
+
+
+def _write_cache(df, source, stat, data_path, manifest_path):
+    data_path.parent.mkdir(parents=True, exist_ok=True)
+    # Per-process temporary name: workers sharing the cache never write the same file
+    tmp = f'{data_path}.tmp-{os.getpid()}'
+    if CACHE_FORMAT == 'parquet':
+        df.to_parquet(tmp, index=False)
+    else:
+        df.to_pickle(tmp)
+    os.replace(tmp, data_path)
+    manifest = {
+        'version': CACHE_VERSION,
+        'format': CACHE_FORMAT,
+        'source': str(source),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'sha256': file_hash(source),
+        'rows': len(df),
+    }
+    _write_manifest(manifest, manifest_path)
+
+
+def _write_manifest(manifest, path):
+    tmp = f'{path}.tmp-{os.getpid()}'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+
+
+def _lock_for(key):
+    with _locks_guard:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def load_table(name, refresh=False):
+    """Return the workbook ``name`` as a DataFrame, through the cache."""
+    source = resolve_source(name)
+    stat = source.stat()
+    data_path, manifest_path = _cache_paths(source)
+    with _lock_for(str(source)):
+        if not refresh and data_path.exists() and _is_fresh(_read_manifest(manifest_path), source, stat, manifest_path):
+            if CACHE_FORMAT == 'parquet':
+                return pd.read_parquet(data_path)
+            return pd.read_pickle(data_path)
+        df = read_source(source)
+        _write_cache(df, source, stat, data_path, manifest_path)
+        return df
+
+
+def available_tables():
+    return sorted(p.stem for p in data_dir().glob('*.xlsx') if not p.name.startswith('~$'))
@@ -0,0 +1,118 @@
+"""Precomputed per-customer features for the future_avg_basket model.
+
+The store is built once from the warehouse exports in ``settings.DATA_DIR``
+(``manage.py build_feature_store``) and saved as a compact ``.npz`` file:
+a sorted ``int64`` array of customer codes and a ``float64`` matrix with one
+row per customer. Lookups are a binary search on the key array, so a
+request no longer reads or scans the Sales table.
+"""
+import os
+import threading
+
+import numpy as np
+from django.conf import settings
+
+CUSTOMER_FEATURES = [
+    'hist_total_amount', 'hist_n_purchases', 'hist_avg_basket',
+    'avg_original_price', 'avg_quantity',
+]
+
+# Values used for customers without any historical sale
+DEFAULT_CUSTOMER_FEATURES = {
+    'hist_total_amount': 0.0,
+    'hist_n_purchases': 0,
+    'hist_avg_basket': 0.0,
+    'avg_original_price': 50.0,
+    'avg_quantity': 1.0,
+}
+
+# Store column -> feature (see ``features``)
+STORE_INPUTS = {
+    'hist_total_amount': 'hist_total_amount',
+    'hist_n_purchases': 'hist_n_purchases',
+    'hist_avg_basket': 'hist_avg_basket',
+    'avg_original_price': 'avg_original_price',
+    'avg_quantity': 'hist_avg_quantity',
+}
+
+
+def compute_customer_features(sales):
+    """Aggregate the historical part of ``sales`` into one row per customer with history."""
+    from .features import FeatureContext
+
+    features = FeatureContext({'Sales': sales}).compute(list(STORE_INPUTS.values()))
+    features = features[features['hist_n_purchases'] > 0].set_axis(list(STORE_INPUTS), axis='columns')
+    return features[CUSTOMER_FEATURES]
+
+
+def build_feature_store(sales, path=None):
+    """Compute the features from ``sales`` and write them to ``path``."""
+    path = path or settings.CUSTOMER_FEATURE_STORE
+    features = compute_customer_features(sales).sort_index()
+    tmp_path = f'{path}.tmp.npz'
+    np.savez(
+        tmp_path,
+        keys=features.index.to_numpy(dtype=np.int64),
+        values=features.to_numpy(dtype=np.float64),
+        columns=np.array(CUSTOMER_FEATURES),
+    )
+    os.replace(tmp_path, path)
+    return len(features)
+
+
+class CustomerFeatureStore:
+    def __init__(self, path=None):
+        self._path = path
+        # (keys, values), swapped as one attribute so a reload never pairs
+        # the keys of one store with the values of another
+        self._arrays = None
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return self._path or settings.CUSTOMER_FEATURE_STORE
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _loaded(self):
+        arrays = self._arrays
+        if arrays is not None:
+            return arrays
+        with self._lock:
+            if self._arrays is None:
+                with np.load(self.path) as data:
+                    columns = list(data['columns'])
+                    if columns != CUSTOMER_FEATURES:
+                        raise ValueError(f'Feature store {self.path} has columns {columns}, expected {CUSTOMER_FEATURES}')
+                    self._arrays = (data['keys'], data['values'])
+            return self._arrays
+
+    def lookup(self, code_customer):
+        """Return the feature dict for ``code_customer``, or None if unknown."""
+        try:
+            key = int(code_customer)
+        except (TypeError, ValueError):
+            return None
+        keys, values = self._loaded()
+        idx = int(np.searchsorted(keys, key))
+        if idx >= len(keys) or keys[idx] != key:
+            return None
+        row = values[idx]
+        features = dict(zip(CUSTOMER_FEATURES, row.tolist()))
+        features['hist_n_purchases'] = int(features['hist_n_purchases'])
+        return features
+
+    def reload(self):
+        self._arrays = None
+
+
+customer_features = CustomerFeatureStore()
+
+
+def get_customer_features(code_customer):
+    """Features for ``code_customer``, falling back to the defaults."""
+    features = customer_features.lookup(code_customer)
+    if features is None:
+        return dict(DEFAULT_CUSTOMER_FEATURES)
+    return features
@@ -0,0 +1,601 @@
+"""Per-customer features, declared once with their dependencies.
+
+Every feature the customer-level models and their training notebooks use is
+declared here as one of:
+
+* ``Attribute``: a column of ``Customers_f``;
+* ``Aggregate``: a per-customer ``count``/``sum``/``mean``/``std``/``min``/
+  ``max``/``nunique`` of a column of the Sales fact table, optionally over a
+  window of its rows (``past``, ``recent``, ``history``, ``women``);
+* ``Derived``: a function of other features.
+
+``FeatureContext.compute(names)`` resolves the dependencies of ``names`` and
+computes every aggregate they need in a single ``groupby`` pass over the fact
+table: a windowed aggregate runs over its column masked with NaN outside the
+window, which every aggregate function skips. Sales is joined with Orders
+(status) or Products_f/Sections (style, colour, section) only when a needed
+column comes from there, once per context, and computed features are
+memoized, so asking for several models' inputs costs one pass.
+
+Serving (``customer_scoring``, ``feature_store``) and the training notebooks
+use the same declarations::
+
+    from ml_app.features import FeatureContext
+    context = FeatureContext.load(as_of='2023-07-01')
+    X = context.model_frame('future_purchases')
+"""
+import numpy as np
+import pandas as pd
+
+# future_purchases: purchases per month by declared frequency (ghada_regression.ipynb)
+FREQ_PER_MONTH = {'Weekly': 4.0, 'Fortnightly': 2.0, 'Monthly': 1.0, 'Quarterly': 1 / 3, 'Occasional': 0.25}
+RECENT_DAYS = 30
+
+# future_avg_basket: share of the sales timeline treated as history (future_avg_basket.ipynb)
+HISTORY_QUANTILE = 0.7
+
+# women_preference: sections counted as womenswear (women_preference_model.ipynb)
+WOMEN_SECTIONS = (
+    'Womens Everyday Basics', 'Womens Lingerie', 'Womens Nightwear, Socks & Tigh',
+    'Womens Small accessories', 'Womens Big accessories', 'Womens Swimwear, beachwear',
+    'Womens Everyday Collection', 'Womens Trend', 'Womens Shoes', 'Womens Tailoring',
+    'Womens Casual', 'Womens Premium', 'Womens Jackets', 'Ladies Denim',
+    'Ladies H&M Sport', 'Ladies Other', 'Contemporary Street', 'Contemporary Casual', 'Contemporary Smart',
+)
+
+# spending_level was trained on label codes; categories are numbered in sorted order
+SPENDING_CODES = {
+    'Frequency of Purchases': ('Annually', 'Bi-Weekly', 'Every 3 Months', 'Fortnightly', 'Monthly', 'Quarterly', 'Weekly'),
+    'Payment Method': ('Bank Transfer', 'Cash', 'Credit Card', 'Debit Card', 'PayPal', 'Venmo'),
+}
+
+TABLES = ('Customers_f', 'Sales', 'Orders', 'Products_f', 'Sections')
+
+
+# Joins of the fact table
+
+def _join_orders(sales, tables):
+    orders = tables['Orders'][['order_code', 'status_label']].drop_duplicates('order_code')
+    facts = sales.merge(orders, left_on='code_order', right_on='order_code', how='left').drop(columns='order_code')
+    status = facts['status_label'].fillna('').str.lower()
+    facts['is_cancelled'] = (status == 'cancelled').astype(np.int64)
+    facts['is_returned_or_cancelled'] = status.isin(['returned', 'cancelled']).astype(np.int64)
+    return facts
+
+
+def _join_products(sales, tables):
+    products = tables['Products_f'][['SKU', 'Style_code', 'code_color', 'section_no']].drop_duplicates('SKU')
+    products = products.merge(tables['Sections'], on='section_no', how='left')
+    return sales.merge(products, on='SKU', how='left')
+
+
+# name -> (function(sales, tables) -> joined frame, columns it adds); applied in this order
+JOINS = {
+    'orders': (_join_orders, ('status_label', 'is_cancelled', 'is_returned_or_cancelled')),
+    'products': (_join_products, ('Style_code', 'code_color', 'section_no', 'section_name')),
+}
+_JOIN_OF_COLUMN = {column: join for join, (_, columns) in JOINS.items() for column in columns}
+
+
+def joins_for(columns):
+    return frozenset(_JOIN_OF_COLUMN[c] for c in columns if c in _JOIN_OF_COLUMN)
+
+
+# Windows: row subsets of the fact table, given as (column, test(column, context))
+
+WINDOWS = {
+    'past': ('sale_date', lambda d, ctx: d < ctx.as_of),
+    'recent': ('sale_date', lambda d, ctx: (d >= ctx.as_of - pd.Timedelta(days=RECENT_DAYS)) & (d < ctx.as_of)),
+    'history': ('sale_date', lambda d, ctx: d <= ctx.history_end),
+    'women': ('section_name', lambda s, ctx: s.isin(WOMEN_SECTIONS)),
+}
+# Windows measured from the scoring date
+AS_OF_WINDOWS = frozenset({'past', 'recent'})
+
+
+# Declarations
+
+class Attribute:
+    def __init__(self, column):
+        self.column = column
+        self.deps = ()
+
+
+class Aggregate:
+    """``func`` of ``column`` per customer, over the rows in ``where``; ``fill`` for customers without any."""
+
+    def __init__(self, column, func, where=None, fill=0):
+        self.column = column
+        self.func = func
+        self.where = where
+        self.fill = fill
+        self.deps = ()
+
+    @property
+    def columns(self):
+        return (self.column, WINDOWS[self.where][0]) if self.where else (self.column,)
+
+
+class Derived:
+    """``func(*deps)``, or ``func(context, *deps)`` when ``uses_context``."""
+
+    def __init__(self, func, deps, uses_context=False, fill=None):
+        self.func = func
+        self.deps = deps
+        self.uses_context = uses_context
+        self.fill = fill
+
+
+FEATURES = {}
+
+
+def attribute(name, column=None):
+    FEATURES[name] = Attribute(column or name)
+
+
+def aggregate(name, column, func, where=None, fill=0):
+    FEATURES[name] = Aggregate(column, func, where, fill)
+
+
+def derived(*deps, uses_context=False, fill=None):
+    def register(func):
+        FEATURES[func.__name__] = Derived(func, deps, uses_context, fill)
+        return func
+    return register
+
+
+for _column in ('Age', 'Gender', 'Zip_code', 'Preferred_size', 'Overall_review', 'Subscription Status',
+                'Previous Purchases', 'Payment Method', 'Frequency of Purchases'):
+    attribute(_column)
+
+# Whole history (customer_clustering.ipynb, islem_classification.ipynb, maryem_classification.ipynb)
+aggregate('total_purchases', 'code_sale', 'count')
+aggregate('total_quantity', 'quantity', 'sum')
+aggregate('avg_quantity', 'quantity', 'mean')
+aggregate('avg_unit_price', 'Estimated_Unit_Price', 'mean')
+aggregate('total_spent', 'Estimated_Unit_Price', 'sum')
+aggregate('discount_rate', 'is_discounted', 'mean')
+aggregate('first_purchase', 'sale_date', 'min', fill=None)
+aggregate('last_purchase', 'sale_date', 'max', fill=None)
+aggregate('unique_products', 'SKU', 'nunique')
+aggregate('total_cancelled', 'is_cancelled', 'sum')
+aggregate('returned_cancelled', 'is_returned_or_cancelled', 'sum')
+
+# Before the scoring date (ghada_regression.ipynb)
+aggregate('past_purchases', 'code_sale', 'count', where='past')
+aggregate('past_spent', 'Estimated_Unit_Price', 'sum', where='past')
+aggregate('past_unique_products', 'SKU', 'nunique', where='past')
+aggregate('past_discount_rate', 'is_discounted', 'mean', where='past')
+aggregate('past_first_sale', 'sale_date', 'min', where='past', fill=None)
+aggregate('past_last_sale', 'sale_date', 'max', where='past', fill=None)
+aggregate('recent_purchases', 'code_sale', 'count', where='recent')
+aggregate('recent_spent', 'Estimated_Unit_Price', 'sum', where='recent')
+aggregate('recent_unique_products', 'SKU', 'nunique', where='recent')
+
+# Up to the history cutoff (future_avg_basket.ipynb); left empty for customers without history
+aggregate('hist_total_amount', 'Estimated_Unit_Price', 'sum', where='history', fill=None)
+aggregate('hist_n_purchases', 'code_order', 'nunique', where='history', fill=None)
+aggregate('hist_avg_basket', 'Estimated_Unit_Price', 'mean', where='history', fill=None)
+aggregate('hist_avg_quantity', 'quantity', 'mean', where='history', fill=None)
+
+# Womenswear purchases (women_preference_model.ipynb)
+aggregate('n_women_purchases', 'code_sale', 'count', where='women')
+aggregate('n_orders', 'code_order', 'nunique', where='women')
+aggregate('n_unique_sku', 'SKU', 'nunique', where='women')
+aggregate('avg_price', 'Estimated_Unit_Price', 'mean', where='women')
+aggregate('std_price', 'Estimated_Unit_Price', 'std', where='women')
+aggregate('min_price', 'Estimated_Unit_Price', 'min', where='women')
+aggregate('max_price', 'Estimated_Unit_Price', 'max', where='women')
+aggregate('women_avg_quantity', 'quantity', 'mean', where='women')
+aggregate('n_unique_style', 'Style_code', 'nunique', where='women')
+aggregate('n_unique_color', 'code_color', 'nunique', where='women')
+
+
+@derived('first_purchase', 'last_purchase', fill=0)
+def customer_lifetime_days(first_purchase, last_purchase):
+    return (last_purchase - first_purchase).dt.days
+
+
+@derived('total_purchases', 'customer_lifetime_days')
+def purchase_frequency(total_purchases, customer_lifetime_days):
+    return total_purchases / (customer_lifetime_days / 30 + 1)
+
+
+@derived('total_spent', 'total_purchases')
+def avg_order_value(total_spent, total_purchases):
+    return total_spent / total_purchases.replace(0, 1)
+
+
+@derived('returned_cancelled', 'total_purchases')
+def return_cancel_rate(returned_cancelled, total_purchases):
+    return returned_cancelled / total_purchases.replace(0, 1)
+
+
+@derived('total_purchases', 'total_cancelled')
+def total_not_cancelled(total_purchases, total_cancelled):
+    return total_purchases - total_cancelled
+
+
+@derived('total_cancelled', 'total_purchases')
+def cancel_rate(total_cancelled, total_purchases):
+    return total_cancelled / total_purchases.replace(0, 1)
+
+
+@derived('Gender')
+def gender_male(gender):
+    return (gender == 'Male').astype(np.int64)
+
+
+@derived('Subscription Status')
+def is_subscribed(subscription_status):
+    return subscription_status.map({'Yes': 1, 'No': 0}).fillna(0).astype(np.int64)
+
+
+@derived('Frequency of Purchases')
+def freq_per_month(frequency):
+    return frequency.map(FREQ_PER_MONTH).fillna(0.5)
+
+
+@derived('past_last_sale', uses_context=True, fill=0)
+def recency_days(context, past_last_sale):
+    return (context.as_of - past_last_sale).dt.days
+
+
+@derived('past_first_sale', uses_context=True, fill=0)
+def tenure_days(context, past_first_sale):
+    return (context.as_of - past_first_sale).dt.days
+
+
+@derived('past_purchases', 'tenure_days')
+def purchases_per_month(past_purchases, tenure_days):
+    return past_purchases / (tenure_days / 30).clip(lower=1)
+
+
+@derived('past_discount_rate')
+def discount_sensitivity(past_discount_rate):
+    return past_discount_rate
+
+
+@derived('past_unique_products', 'past_purchases')
+def variety_index(past_unique_products, past_purchases):
+    return past_unique_products / past_purchases.replace(0, 1)
+
+
+@derived('past_spent', 'past_purchases')
+def monetary_intensity(past_spent, past_purchases):
+    return past_spent / past_purchases.replace(0, 1)
+
+
+@derived('recency_days', 'tenure_days')
+def recency_ratio(recency_days, tenure_days):
+    return recency_days / tenure_days.replace(0, 1)
+
+
+@derived('past_spent', 'past_unique_products')
+def spend_per_product(past_spent, past_unique_products):
+    return past_spent / past_unique_products.replace(0, 1)
+
+
+@derived('past_discount_rate', 'past_purchases')
+def discount_ratio(past_discount_rate, past_purchases):
+    return past_discount_rate * past_purchases
+
+
+@derived('past_purchases', 'recency_days')
+def activity_intensity(past_purchases, recency_days):
+    return past_purchases / recency_days.replace(0, 1)
+
+
+@derived('hist_avg_basket')
+def avg_original_price(hist_avg_basket):
+    return hist_avg_basket
+
+
+# spending_level: per-customer averages stand in for the single purchase its form describes
+
+@derived('Gender')
+def spending_gender(gender):
+    return pd.Series(np.where(gender == 'Male', '0', '1'), index=gender.index)
+
+
+def _spending_code(column):
+    codes = {label: i for i, label in enumerate(SPENDING_CODES[column])}
+    return lambda values: values.map(codes).fillna(0).astype(np.int64)
+
+
+@derived('Frequency of Purchases')
+def spending_frequency_code(frequency):
+    return _spending_code('Frequency of Purchases')(frequency)
+
+
+@derived('spending_frequency_code')
+def spending_frequency(code):
+    return code.astype(str)
+
+
+@derived('Payment Method')
+def spending_payment_method(payment_method):
+    return _spending_code('Payment Method')(payment_method).astype(str)
+
+
+@derived('avg_quantity')
+def log_quantity(avg_quantity):
+    return np.log1p(avg_quantity)
+
+
+@derived('Age', 'spending_frequency_code')
+def age_freq(age, code):
+    return age * code
+
+
+@derived('discount_rate', 'avg_quantity')
+def discount_qty(discount_rate, avg_quantity):
+    return discount_rate * avg_quantity
+
+
+@derived('Previous Purchases', 'Age')
+def avg_prev_per_age(previous, age):
+    return (previous / age.where(age > 0, 1)).where(age > 0, 0.0)
+
+
+@derived('Previous Purchases', 'spending_frequency_code')
+def avg_prev_by_freq(previous, code):
+    return (previous / code.where(code > 0, 1)).where(code > 0, 0.0)
+
+
+@derived('Previous Purchases', 'Age')
+def prev_per_age(previous, age):
+    return previous / (age + 1)
+
+
+def _identity(*names):
+    return {name: name for name in names}
+
+
+BEHAVIOR_FEATURES = (
+    'total_purchases', 'total_quantity', 'avg_unit_price', 'total_spent', 'discount_rate',
+    'customer_lifetime_days', 'purchase_frequency', 'avg_order_value', 'return_cancel_rate',
+)
+
+# Model input column -> feature, for every model scored per customer
+MODEL_INPUTS = {
+    'spending_level': {
+        'Gender': 'spending_gender', 'Age': 'Age', 'Frequency of Purchases': 'spending_frequency',
+        'Payment Method': 'spending_payment_method', 'discount_rate': 'discount_rate', 'log_quantity': 'log_quantity',
+        'age_freq': 'age_freq', 'discount_qty': 'discount_qty', 'Subscription_Status': 'is_subscribed',
+        'avg_prev_per_age': 'avg_prev_per_age', 'avg_prev_by_freq': 'avg_prev_by_freq', 'prev_per_age': 'prev_per_age',
+    },
+    'classification_customer_behavior': _identity(
+        *BEHAVIOR_FEATURES, 'Age', 'Overall_review', 'Previous Purchases', 'Gender', 'Preferred_size',
+        'Payment Method', 'Frequency of Purchases',
+    ),
+    'classification_high_risk_cancelling': {
+        'total_orders': 'total_purchases', 'total_cancelled': 'total_cancelled', 'avg_quantity': 'avg_quantity',
+        'avg_unit_price': 'avg_unit_price', 'unique_products': 'unique_products',
+        'total_not_cancelled': 'total_not_cancelled', 'age': 'Age', 'gender_male': 'gender_male',
+    },
+    'customer_clustering': _identity(*BEHAVIOR_FEATURES),
+    'future_purchases': {
+        **_identity('freq_per_month'),
+        'discount_rate': 'past_discount_rate',
+        **_identity('recency_days', 'tenure_days', 'past_purchases'),
+        'unique_products': 'past_unique_products',
+        'total_spent': 'past_spent',
+        **_identity(
+            'Overall_review', 'is_subscribed', 'purchases_per_month', 'discount_sensitivity', 'variety_index',
+            'monetary_intensity', 'recency_ratio', 'spend_per_product', 'discount_ratio', 'activity_intensity',
+            'recent_purchases', 'recent_spent', 'recent_unique_products',
+        ),
+    },
+    'women_preference': {
+        **_identity(
+            'Age', 'Gender', 'Zip_code', 'Preferred_size', 'Overall_review', 'Subscription Status',
+            'Previous Purchases', 'Payment Method', 'Frequency of Purchases', 'n_women_purchases', 'n_orders',
+            'n_unique_sku', 'avg_price', 'std_price', 'min_price', 'max_price',
+        ),
+        'avg_quantity': 'women_avg_quantity',
+        **_identity('n_unique_style', 'n_unique_color'),
+    },
+}
+
+
+def dependencies(names):
+    """``names`` and everything they depend on, dependencies first."""
+    ordered = []
+    seen = set()
+
+    def visit(name):
+        if name in seen:
+            return
+        if name not in FEATURES:
+            raise KeyError(f"Unknown feature '{name}'")
+        seen.add(name)
+        for dep in FEATURES[name].deps:
+            visit(dep)
+        ordered.append(name)
+
+    for name in names:
+        visit(name)
+    return ordered
+
+
+def uses_as_of(names):
+    """True when any of ``names`` is measured from the scoring date."""
+    for name in dependencies(names):
+        node = FEATURES[name]
+        if isinstance(node, Aggregate) and node.where in AS_OF_WINDOWS:
+            return True
+        if isinstance(node, Derived) and node.uses_context:
+            return True
+    return False
+
+
+def aggregate_spec(names):
+    """``(inputs, spec)`` of the aggregates ``names``.
+
+    ``inputs`` maps input column labels to ``(column, window)``; ``spec`` is
+    the named aggregation ``{name: (label, func)}`` over them, for
+    ``groupby('code_customer').agg(**spec)``.
+    """
+    labels = {}
+    spec = {}
+    for name in names:
+        node = FEATURES[name]
+        key = (node.column, node.where)
+        if key not in labels:
+            labels[key] = f'c{len(labels)}'
+        spec[name] = (labels[key], node.func)
+    return {label: key for key, label in labels.items()}, spec
+
+
+def aggregate_inputs(facts, inputs, context):
+    """The ``inputs`` columns of ``facts``, each NaN outside its window, and ``code_customer``.
+
+    ``context`` provides the ``as_of`` and ``history_end`` the windows test against.
+    """
+    masks = {}
+    frame = {}
+    for label, (column, where) in inputs.items():
+        values = facts[column]
+        if where is not None:
+            if where not in masks:
+                window_column, test = WINDOWS[where]
+                masks[where] = test(facts[window_column], context)
+            values = values.where(masks[where])
+        frame[label] = values.to_numpy()
+    frame['code_customer'] = facts['code_customer'].to_numpy()
+    return pd.DataFrame(frame)
+
+
+def fill_aggregates(result):
+    """``result``'s aggregate columns with each feature's ``fill`` for customers without rows."""
+    for name in result.columns:
+        if FEATURES[name].fill is not None:
+            result[name] = result[name].fillna(FEATURES[name].fill)
+    return result
+
+
+def model_features(model):
+    return list(dict.fromkeys(MODEL_INPUTS[model].values()))
+
+
+class FeatureContext:
+    """The tables features are computed from, with their joins and results memoized.
+
+    ``customers`` may be None to compute aggregates for the customers present
+    in ``sales`` only. ``as_of`` (default: the day after the last sale) is the
+    scoring date of the ``past``/``recent`` windows; ``history_end`` (default:
+    the ``HISTORY_QUANTILE`` of sale dates) ends the ``history`` window.
+    """
+
+    def __init__(self, tables, as_of=None, history_end=None, _facts=None):
+        self.tables = tables
+        sales = tables['Sales']
+        customers = tables.get('Customers_f')
+        if customers is not None:
+            customers = customers.sort_values('code_customer', kind='stable').reset_index(drop=True)
+        self.customers = customers
+        if as_of is None:
+            as_of = sales['sale_date'].max().normalize() + pd.Timedelta(days=1) if len(sales) else pd.Timestamp.now()
+        self.as_of = pd.Timestamp(as_of)
+        self.history_end = pd.Timestamp(history_end) if history_end is not None else (
+            pd.to_datetime(sales['sale_date']).quantile(HISTORY_QUANTILE) if len(sales) else self.as_of)
+        # frozenset of joins -> fact table sorted by customer
+        self._facts = _facts if _facts is not None else {
+            frozenset(): sales.sort_values('code_customer', kind='stable').reset_index(drop=True),
+        }
+        self._values = {}
+
+    @classmethod
+    def load(cls, as_of=None, history_end=None):
+        """A context over the warehouse exports (``data_loader.load_table``)."""
+        from .data_loader import load_table
+
+        return cls({name: load_table(name) for name in TABLES}, as_of, history_end)
+
+    @property
+    def codes(self):
+        if self.customers is not None:
+            return self.customers['code_customer'].to_numpy()
+        return np.unique(self._facts[frozenset()]['code_customer'].to_numpy())
+
+    def facts(self, joins=frozenset()):
+        """Sales joined with ``joins``, sorted by customer; built once per context."""
+        joins = frozenset(joins)
+        facts = self._facts.get(joins)
+        if facts is None:
+            # Extra joined columns are harmless: reuse a frame with more joins
+            covering = [key for key in self._facts if joins <= key]
+            if covering:
+                return self._facts[min(covering, key=len)]
+            facts = self._facts[frozenset()]
+            for name, (join, _) in JOINS.items():
+                if name in joins:
+                    facts = join(facts, self.tables)
+            facts = facts.sort_values('code_customer', kind='stable').reset_index(drop=True)
+            self._facts[joins] = facts
+        return facts
+
+    def prepare(self, names):
+        """Make the joins ``names`` need now, so contexts derived from this one share them."""
+        self.facts(self._joins(dependencies(names)))
+
+    def _joins(self, names):
+        columns = [c for name in names if isinstance(FEATURES[name], Aggregate) for c in FEATURES[name].columns]
+        return joins_for(columns)
+
+    def _derive(self, keep, as_of):
+        # keep(sorted codes) -> the rows to keep, as a slice or positions
+        tables = dict(self.tables)
+        if self.customers is not None:
+            tables['Customers_f'] = self.customers.iloc[keep(self.customers['code_customer'].to_numpy())]
+        facts = {}
+        for joins, frame in self._facts.items():
+            facts[joins] = frame.iloc[keep(frame['code_customer'].to_numpy())].reset_index(drop=True)
+        tables['Sales'] = facts[frozenset()]
+        return FeatureContext(tables, as_of if as_of is not None else self.as_of, self.history_end, facts)
+
+    def restrict(self, first, last, as_of=None):
+        """A context over the customers with ``first <= code <= last``, sharing the memoized joins."""
+        def keep(codes):
+            return slice(np.searchsorted(codes, first, side='left'), np.searchsorted(codes, last, side='right'))
+        return self._derive(keep, as_of)
+
+    def select(self, codes, as_of=None):
+        """A context over the customers in ``codes``, sharing the memoized joins."""
+        wanted = np.asarray(list(codes))
+        return self._derive(lambda values: np.flatnonzero(np.isin(values, wanted)), as_of)
+
+    def compute(self, names):
+        """A frame of ``names`` indexed by customer code, one row per customer."""
+        order = dependencies(names)
+        pending = [n for n in order if n not in self._values and isinstance(FEATURES[n], Aggregate)]
+        if pending:
+            self._aggregate(pending)
+        for name in order:
+            if name in self._values:
+                continue
+            node = FEATURES[name]
+            if isinstance(node, Attribute):
+                self._values[name] = pd.Series(self.customers[node.column].to_numpy(), index=self.codes)
+            elif isinstance(node, Derived):
+                args = [self._values[dep] for dep in node.deps]
+                values = node.func(self, *args) if node.uses_context else node.func(*args)
+                if node.fill is not None:
+                    values = values.fillna(node.fill)
+                self._values[name] = values
+        return pd.DataFrame({name: self._values[name] for name in names}, index=pd.Index(self.codes, name='code_customer'))
+
+    def _aggregate(self, names):
+        # One groupby over the fact table for every pending aggregate
+        inputs, spec = aggregate_spec(names)
+        frame = aggregate_inputs(self.facts(self._joins(names)), inputs, self)
+        result = fill_aggregates(frame.groupby('code_customer').agg(**spec).reindex(self.codes))
+        for name in names:
+            self._values[name] = result[name]
+
+    def model_frame(self, model):
+        """The input columns of ``model`` (see ``MODEL_INPUTS``), one row per customer."""
+        inputs = MODEL_INPUTS[model]
+        features = self.compute(list(dict.fromkeys(inputs.values())))
+        return pd.DataFrame({column: features[feature] for column, feature in inputs.items()})
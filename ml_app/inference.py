@@ -0,0 +1,265 @@
+"""Compiled encode -> scale -> predict pipelines for the registered models.
+
+Each registry entry is compiled once, at load time, into a ``CompiledPipeline``:
+the column order is fixed, label encoders become plain dict lookups and a
+``StandardScaler`` is folded into ``mean``/``scale`` arrays. A request then goes
+straight from its parsed input to a contiguous float64 row and into the
+estimator, without building any DataFrame.
+
+Input rows are keyed by the names in a model's ``features`` list. Categorical
+columns listed in ``cat_features`` are given as their raw labels and are
+label-encoded here, either in place or into the ``<col>_encoded`` feature the
+model was trained on.
+"""
+import time
+import warnings
+
+import numpy as np
+
+from .batching import batcher_for
+from .metrics import PREDICT_ERRORS, PREDICT_LATENCY, PREDICTED_ROWS
+from .result_cache import cache_for, vector_digest
+from .timing import stage, timed
+from .tree_engine import compile_estimator
+
+
+def _array_input(call, X):
+    """``call(X)`` on a plain array, without sklearn's feature-name warning.
+
+    The estimators and scalers were fitted on DataFrames; they score plain
+    arrays in the same column order just as well.
+    """
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', message='X does not have valid feature names', category=UserWarning)
+        return call(X)
+
+
+def tree_engine_enabled():
+    from django.conf import settings
+    return getattr(settings, 'ML_TREE_ENGINE', False)
+
+
+def label_encoders(entry):
+    encoders = entry.get('encoders')
+    if not isinstance(encoders, dict):
+        return {}
+    # spending_level stores its encoders inside a training bundle
+    if 'label_encoders' in encoders:
+        return encoders['label_encoders']
+    return encoders
+
+
+def encoded_column(col, features):
+    if col in features:
+        return col
+    if f'{col}_encoded' in features:
+        return f'{col}_encoded'
+    return None
+
+
+def categorical_sources(config):
+    """Map each encoded model feature to the raw column it is built from."""
+    sources = {}
+    for col in config.get('cat_features', []):
+        target = encoded_column(col, config['features'])
+        if target is not None:
+            sources[target] = col
+    return sources
+
+
+def required_columns(config):
+    """Columns a caller has to provide for each row."""
+    sources = categorical_sources(config)
+    return [sources.get(feature, feature) for feature in config['features']]
+
+
+class CompiledPipeline:
+    def __init__(self, entry):
+        config = entry['config']
+        self.features = list(config['features'])
+        self.columns = required_columns(config)
+        self.estimator = entry['model']
+        self.name = entry.get('name')
+        self.version = entry.get('version')
+
+        # Optional pure-NumPy evaluator for tree ensembles
+        self.flat_model = compile_estimator(self.estimator) if tree_engine_enabled() else None
+        self.predict_fn = self.flat_model.predict if self.flat_model is not None else self._estimator_predict
+
+        self.cache = cache_for(self.name, config)
+        self.batcher = batcher_for(self.name, config, self.predict_fn)
+
+        self._latency_one = PREDICT_LATENCY.labels(self.name, 'one')
+        self._latency_many = PREDICT_LATENCY.labels(self.name, 'many')
+        self._rows = PREDICTED_ROWS.labels(self.name)
+        self._errors = PREDICT_ERRORS.labels(self.name)
+
+        # Per-column lookup tables {raw label: code}, None for numeric columns
+        encoders = label_encoders(entry)
+        sources = categorical_sources(config)
+        self.lookups = []
+        for feature in self.features:
+            le = encoders.get(sources.get(feature))
+            if le is None:
+                self.lookups.append(None)
+            else:
+                self.lookups.append({str(label): float(code) for code, label in enumerate(le.classes_)})
+
+        self.mean = None
+        self.scale = None
+        self.scaler = None
+        scaler = entry.get('scaler')
+        if scaler is not None:
+            if type(scaler).__name__ == 'StandardScaler':
+                n = len(self.features)
+                mean = scaler.mean_ if scaler.mean_ is not None else np.zeros(n)
+                scale = scaler.scale_ if scaler.scale_ is not None else np.ones(n)
+                self.mean = np.ascontiguousarray(mean, dtype=np.float64)
+                self.scale = np.ascontiguousarray(scale, dtype=np.float64)
+            else:
+                self.scaler = scaler
+
+        # Column permutation when the estimator was fitted in another order
+        self.order = None
+        names = getattr(self.estimator, 'feature_names_in_', None)
+        if names is not None and list(names) != self.features:
+            self.order = np.array([self.features.index(name) for name in names])
+
+    # handle_unknown='first' maps unseen labels to the encoder's first class
+    def encode(self, index, value, handle_unknown='error'):
+        lookup = self.lookups[index]
+        if lookup is None:
+            return float(value)
+        code = lookup.get(str(value))
+        if code is None:
+            if handle_unknown == 'first':
+                return 0.0
+            raise ValueError(f"Unknown label for '{self.columns[index]}': {value!r}")
+        return code
+
+    def row(self, values, handle_unknown='error'):
+        """Encode one input dict into a (1, n_features) float64 array."""
+        return self.finish(self.encode_row(values, handle_unknown))
+
+    def encode_row(self, values, handle_unknown='error'):
+        """``row`` before scaling: label codes and raw numbers, in feature order."""
+        with stage('encode'):
+            X = np.empty((1, len(self.columns)), dtype=np.float64)
+            for i, col in enumerate(self.columns):
+                if col not in values:
+                    raise ValueError(f"Missing input '{col}'")
+                X[0, i] = self.encode(i, values[col], handle_unknown)
+        return X
+
+    def matrix(self, frame, handle_unknown='error'):
+        """Encode every row of a DataFrame into a (n_rows, n_features) array."""
+        missing = [c for c in self.columns if c not in frame.columns]
+        if missing:
+            raise ValueError(f'Missing columns: {missing}')
+        with stage('encode'):
+            X = np.empty((len(frame), len(self.columns)), dtype=np.float64)
+            for i, col in enumerate(self.columns):
+                lookup = self.lookups[i]
+                if lookup is None:
+                    X[:, i] = frame[col].to_numpy(dtype=np.float64)
+                    continue
+                codes = frame[col].astype(str).map(lookup)
+                unknown = codes.isna()
+                if unknown.any():
+                    if handle_unknown != 'first':
+                        labels = sorted(set(frame[col][unknown].astype(str)))
+                        raise ValueError(f"Unknown labels for '{col}': {labels}")
+                    codes = codes.fillna(0.0)
+                X[:, i] = codes.to_numpy(dtype=np.float64)
+        return self.finish(X)
+
+    @timed('scale')
+    def finish(self, X):
+        if self.mean is not None:
+            X -= self.mean
+            X /= self.scale
+        elif self.scaler is not None:
+            X = np.asarray(_array_input(self.scaler.transform, X), dtype=np.float64)
+        if self.order is not None:
+            X = np.ascontiguousarray(X[:, self.order])
+        return X
+
+    def _estimator_predict(self, X):
+        return _array_input(self.estimator.predict, X)
+
+    @timed('predict')
+    def _predict_row(self, X):
+        if self.batcher is not None:
+            return self.batcher.submit(X)
+        return self.predict_fn(X)[0]
+
+    def predict_one(self, values, handle_unknown='error'):
+        start = time.perf_counter()
+        try:
+            pred = self._predict_one(values, handle_unknown)
+        except Exception:
+            self._errors.inc()
+            raise
+        self._latency_one.observe(time.perf_counter() - start)
+        self._rows.inc()
+        return pred
+
+    def _predict_one(self, values, handle_unknown):
+        X = self.row(values, handle_unknown)
+        if self.cache is None:
+            return self._predict_row(X)
+        key = (self.version, vector_digest(X))
+        with stage('cache'):
+            hit, pred = self.cache.get(key)
+        if not hit:
+            pred = self._predict_row(X)
+            self.cache.put(key, pred)
+        return pred
+
+    def close(self):
+        if self.batcher is not None:
+            self.batcher.close()
+
+    def predict_many(self, frame, handle_unknown='error'):
+        if frame.empty:
+            return np.empty(0)
+        start = time.perf_counter()
+        try:
+            X = self.matrix(frame, handle_unknown)
+            with stage('predict'):
+                preds = np.asarray(self.predict_fn(X))
+        except Exception:
+            self._errors.inc()
+            raise
+        self._latency_many.observe(time.perf_counter() - start)
+        self._rows.inc(len(preds))
+        return preds
+
+    def synthetic_row(self):
+        """A valid input: each categorical column's first label, numbers at their training mean."""
+        values = {}
+        for i, col in enumerate(self.columns):
+            lookup = self.lookups[i]
+            if lookup is not None:
+                values[col] = next(iter(lookup), '')
+            else:
+                values[col] = float(self.mean[i]) if self.mean is not None else 0.0
+        return values
+
+    def warm(self):
+        """Score a synthetic row through the single-row and batch paths.
+
+        Pays the first-call costs (lazy imports, allocator and dtype caches,
+        the micro-batcher thread) up front; the result cache is bypassed so
+        nothing synthetic is ever served (or counted in the metrics).
+        """
+        import pandas as pd
+
+        values = self.synthetic_row()
+        self._predict_row(self.row(values))
+        self.predict_fn(self.matrix(pd.DataFrame([values])))
+
+
+def predict_frame(entry, frame):
+    """Score every row of ``frame`` with a single ``model.predict`` call."""
+    return entry['pipeline'].predict_many(frame)
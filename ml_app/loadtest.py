@@ -0,0 +1,347 @@
+"""Closed-loop HTTP load generator for the running platform.
+
+Virtual users are asyncio tasks, each with its own keep-alive HTTP/1.1
+connection and cookie jar. They log in through ``accountsApp``'s login form,
+then post a weighted mix of ``/ml/`` forms (with the session and CSRF cookies
+a browser would send) back to back until the stage ends. Stages run at rising
+concurrency; each reports throughput and latency percentiles, which together
+give the throughput/latency curve and its knee.
+
+Only the standard library is used on the client side. ``manage.py loadtest``
+also starts the server under test: gunicorn (WSGI) or uvicorn (ASGI) with
+several workers when they are installed, or ``runserver`` as a
+single-process baseline.
+"""
+import asyncio
+import http.cookies
+import importlib.util
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import numpy as np
+from django.conf import settings
+
+LOGIN_PATH = '/accounts/login/'
+READY_PATH = '/ml/health/ready'
+
+_CSRF_INPUT = re.compile(rb'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+class LoadTestError(Exception):
+    """The server could not be started, or a virtual user could not log in."""
+
+
+class Response:
+    __slots__ = ('status', 'headers', 'body')
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+class HttpSession:
+    """One keep-alive HTTP/1.1 connection with its own cookie jar."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.cookies = {}
+        self._reader = None
+        self._writer = None
+
+    @property
+    def csrf_token(self):
+        return self.cookies.get('csrftoken', '')
+
+    async def request(self, method, path, form=None):
+        body = urllib.parse.urlencode(form).encode() if form is not None else b''
+        lines = [
+            f'{method} {path} HTTP/1.1',
+            f'Host: {self.host}:{self.port}',
+            f'Content-Length: {len(body)}',
+        ]
+        if form is not None:
+            lines.append('Content-Type: application/x-www-form-urlencoded')
+        if self.cookies:
+            lines.append('Cookie: ' + '; '.join(f'{name}={value}' for name, value in self.cookies.items()))
+        payload = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+        # A server may close an idle keep-alive connection; reconnect once
+        for attempt in (0, 1):
+            if self._writer is None:
+                self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+                self._writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            try:
+                self._writer.write(payload)
+                await self._writer.drain()
+                self._quick_ack()
+                return await self._read_response()
+            except (ConnectionError, asyncio.IncompleteReadError):
+                await self.close()
+                if attempt:
+                    raise
+
+    def _quick_ack(self):
+        # A server that writes headers and body in separate small packets
+        # without TCP_NODELAY (runserver does) stalls ~40 ms per response on
+        # our delayed ACK. Linux re-enables delayed ACKs by itself, so this is
+        # re-armed before every response.
+        if hasattr(socket, 'TCP_QUICKACK'):
+            self._writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+
+    async def _read_response(self):
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionResetError('connection closed by the server')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = (await self._reader.readline()).decode('latin-1').rstrip('\r\n')
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            name, value = name.strip().lower(), value.strip()
+            if name == 'set-cookie':
+                self._store_cookie(value)
+            headers[name] = value
+
+        if 'content-length' in headers:
+            body = await self._reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self._reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await self._reader.readline()
+                    break
+                chunks.append(await self._reader.readexactly(size))
+                await self._reader.readline()
+            body = b''.join(chunks)
+        else:
+            body = await self._reader.read()
+            headers['connection'] = 'close'
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return Response(status, headers, body)
+
+    def _store_cookie(self, header):
+        cookie = http.cookies.SimpleCookie()
+        cookie.load(header)
+        for name, morsel in cookie.items():
+            if morsel['max-age'] == '0' or not morsel.value:
+                self.cookies.pop(name, None)
+            else:
+                self.cookies[name] = morsel.value
+
+    async def close(self):
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+
+async def login(session, username, password):
+    """Log in through the login form, as a browser would."""
+    page = await session.request('GET', LOGIN_PATH)
+    match = _CSRF_INPUT.search(page.body)
+    if match is None:
+        raise LoadTestError(f'No CSRF token in {LOGIN_PATH} (status {page.status})')
+    response = await session.request('POST', LOGIN_PATH, {
+        'username': username,
+        'password': password,
+        'csrfmiddlewaretoken': match.group(1).decode(),
+    })
+    if response.status != 302 or 'sessionid' not in session.cookies:
+        raise LoadTestError(f"Login as '{username}' failed (status {response.status})")
+
+
+class Mix:
+    """Weighted choice among (name, path, form) targets."""
+
+    def __init__(self, targets, weights, seed=0):
+        if not targets:
+            raise LoadTestError('The request mix is empty')
+        self.targets = targets
+        self.weights = weights
+        self._random = random.Random(seed)
+
+    def pick(self):
+        return self._random.choices(self.targets, self.weights)[0]
+
+
+async def _virtual_user(session, mix, deadline, samples):
+    loop = asyncio.get_running_loop()
+    while loop.time() < deadline:
+        name, path, form = mix.pick()
+        start = time.perf_counter()
+        try:
+            response = await session.request('POST', path, dict(form, csrfmiddlewaretoken=session.csrf_token))
+            ok = response.status < 400
+        except (OSError, asyncio.IncompleteReadError):
+            ok = False
+        samples.append((name, time.perf_counter() - start, ok))
+
+
+def _percentiles(latencies):
+    ms = np.asarray(latencies) * 1000.0
+    if len(ms) == 0:
+        return {'p50_ms': None, 'p90_ms': None, 'p99_ms': None, 'max_ms': None}
+    p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+    return {'p50_ms': float(p50), 'p90_ms': float(p90), 'p99_ms': float(p99), 'max_ms': float(ms.max())}
+
+
+async def run_stage(host, port, users, duration, mix, credentials):
+    """``users`` virtual users posting ``mix`` for ``duration`` seconds; returns the stage summary."""
+    sessions = [HttpSession(host, port) for _ in range(users)]
+    try:
+        # Logins are not part of the measurement
+        await asyncio.gather(*(login(session, *credentials) for session in sessions))
+        samples = []
+        loop = asyncio.get_running_loop()
+        cpu = time.process_time()
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            _virtual_user(session, mix, loop.time() + duration, samples) for session in sessions
+        ))
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+    finally:
+        await asyncio.gather(*(session.close() for session in sessions))
+
+    paths = {}
+    for name, seconds, ok in samples:
+        paths.setdefault(name, []).append(seconds)
+    return {
+        'concurrency': users,
+        'requests': len(samples),
+        'errors': sum(1 for _, _, ok in samples if not ok),
+        'throughput_rps': len(samples) / elapsed if elapsed else 0.0,
+        **_percentiles([seconds for _, seconds, _ in samples]),
+        # Near 1.0 means the load generator, not the server, was the bottleneck
+        'client_cpu': cpu / elapsed if elapsed else 0.0,
+        'paths': {
+            name: {'requests': len(latencies), **_percentiles(latencies)}
+            for name, latencies in sorted(paths.items())
+        },
+    }
+
+
+def find_knee(stages, min_gain=0.1):
+    """Concurrency past which throughput grows by less than ``min_gain`` per step, or None."""
+    for previous, current in zip(stages, stages[1:]):
+        if current['throughput_rps'] < previous['throughput_rps'] * (1 + min_gain):
+            return previous['concurrency']
+    return None
+
+
+# Server under test
+
+def _wsgi_target():
+    module, attribute = settings.WSGI_APPLICATION.rsplit('.', 1)
+    return f'{module}:{attribute}'
+
+
+def _asgi_target():
+    path = getattr(settings, 'ASGI_APPLICATION', None) or settings.WSGI_APPLICATION.replace('.wsgi.', '.asgi.')
+    module, attribute = path.rsplit('.', 1)
+    return f'{module}:{attribute}'
+
+
+def server_command(server, port, workers=1, threads=1):
+    """argv starting ``server`` on 127.0.0.1:``port``."""
+    if server == 'gunicorn':
+        return [sys.executable, '-m', 'gunicorn', _wsgi_target(), '--bind', f'127.0.0.1:{port}',
+                '--workers', str(workers), '--threads', str(threads), '--log-level', 'warning']
+    if server == 'uvicorn':
+        return [sys.executable, '-m', 'uvicorn', _asgi_target(), '--host', '127.0.0.1', '--port', str(port),
+                '--workers', str(workers), '--log-level', 'warning', '--no-access-log']
+    if server == 'runserver':
+        if workers != 1:
+            raise LoadTestError('runserver is a single process; use gunicorn or uvicorn for several workers')
+        return [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'runserver', '--noreload',
+                '--skip-checks', f'127.0.0.1:{port}']
+    raise LoadTestError(f'Unknown server {server!r}')
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Server:
+    """A server subprocess, started and stopped as a context manager."""
+
+    def __init__(self, server, workers=1, threads=1, startup_timeout=120.0):
+        if server in ('gunicorn', 'uvicorn') and importlib.util.find_spec(server) is None:
+            raise LoadTestError(f'{server} is not installed (pip install {server})')
+        self.port = _free_port()
+        self.command = server_command(server, self.port, workers, threads)
+        self.workers = workers
+        self.startup_timeout = startup_timeout
+        self.process = None
+        self._log = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.port}'
+
+    def __enter__(self):
+        self._log = tempfile.TemporaryFile()
+        # Warm workers before the readiness checks pass, as a deployment would
+        env = dict(os.environ, ML_WARMUP='1')
+        self.process = subprocess.Popen(self.command, cwd=settings.BASE_DIR, env=env, stdout=self._log,
+                                        stderr=subprocess.STDOUT)
+        try:
+            self._wait_ready()
+        except BaseException:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def _wait_ready(self):
+        # Every worker warms up on its own; wait until a run of health checks
+        # (spread over the workers) all answer ready
+        deadline = time.monotonic() + self.startup_timeout
+        ready_in_a_row = 0
+        while ready_in_a_row < 2 * self.workers:
+            if self.process.poll() is not None:
+                raise LoadTestError(f'The server exited with status {self.process.returncode}:\n{self.output()}')
+            if time.monotonic() > deadline:
+                raise LoadTestError(f'The server was not ready after {self.startup_timeout:.0f}s:\n{self.output()}')
+            try:
+                with urllib.request.urlopen(self.url + READY_PATH, timeout=5):
+                    ready_in_a_row += 1
+                    continue
+            except (urllib.error.URLError, OSError):
+                ready_in_a_row = 0
+            time.sleep(0.2)
+
+    def output(self, limit=4000):
+        self._log.seek(0)
+        return self._log.read().decode(errors='replace')[-limit:]
+
+    def __exit__(self, *exc_info):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if self._log is not None:
+            self._log.close()
+        return False
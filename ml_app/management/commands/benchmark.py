@@ -0,0 +1,86 @@
+import fnmatch
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_app import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Benchmark every prediction path and stage; optionally save or compare against a JSON baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('patterns', nargs='*', help='Only run paths matching these globs, e.g. "view:*" "stage:predict:*"')
+        parser.add_argument('--iterations', type=int, default=200, help='Timed runs per path (default: 200)')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed runs per path first (default: 5)')
+        parser.add_argument('--batch-rows', type=int, default=1000, help='Rows per batch API request (default: 1000)')
+        parser.add_argument('--save', metavar='PATH', help='Write the results to PATH as a baseline')
+        parser.add_argument('--compare', metavar='PATH', help='Compare against the baseline at PATH; fail on regressions')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Allowed slowdown as a fraction of the baseline (default: 0.25)')
+        parser.add_argument('--metric', choices=['mean_ms', 'p50_ms', 'p99_ms'], default='p50_ms',
+                            help='Statistic compared against the baseline (default: p50_ms)')
+        parser.add_argument('--min-delta-ms', type=float, default=0.05,
+                            help='Ignore slowdowns smaller than this many ms (default: 0.05)')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON instead of a table')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                baseline = benchmark.load_baseline(options['compare'])
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Cannot read baseline: {e}')
+
+        patterns = options['patterns']
+        select = None
+        if patterns:
+            def select(name):
+                return any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+
+        def progress(name, summary):
+            if options['json']:
+                return
+            if summary is None:
+                self.stderr.write(f'{name:<55} skipped (fails or unavailable)')
+                return
+            self.stdout.write(
+                f"{name:<55} mean {summary['mean_ms']:9.3f}  p50 {summary['p50_ms']:9.3f}  "
+                f"p99 {summary['p99_ms']:9.3f} ms  {summary['ops_per_sec']:10.1f} ops/s"
+            )
+
+        # Failing paths are expected (missing artifacts); keep their tracebacks out of the report
+        logging.disable(logging.ERROR)
+        try:
+            results = benchmark.run(
+                iterations=options['iterations'], warmup=options['warmup'],
+                batch_rows=options['batch_rows'], select=select, progress=progress,
+            )
+        finally:
+            logging.disable(logging.NOTSET)
+        if not results['results']:
+            raise CommandError('No benchmark path matched')
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        if options['save']:
+            benchmark.save_baseline(options['save'], results)
+            self.stderr.write(f"Saved {len(results['results'])} paths to {options['save']}")
+        if baseline is None:
+            return
+
+        rows = benchmark.compare(
+            baseline, results, threshold=options['threshold'], metric=options['metric'],
+            min_delta_ms=options['min_delta_ms'],
+        )
+        metric = options['metric']
+        self.stderr.write(f'Against {options["compare"]} ({metric}, threshold +{options["threshold"]:.0%}):')
+        for name, before, after, ratio, regressed in rows:
+            if regressed or not options['json']:
+                mark = 'REGRESSED' if regressed else ''
+                self.stderr.write(f'  {name:<55} {before:9.3f} -> {after:9.3f} ms  x{ratio:5.2f}  {mark}')
+        regressions = [row[0] for row in rows if row[4]]
+        if regressions:
+            raise CommandError(f"{len(regressions)} path(s) slower than the baseline: {', '.join(regressions)}")
+        self.stderr.write(f'No regressions across {len(rows)} paths')
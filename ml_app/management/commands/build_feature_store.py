@@ -0,0 +1,24 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_app.data_loader import load_table
+from ml_app.feature_store import build_feature_store
+
+
+class Command(BaseCommand):
+    help = 'Precompute the per-customer features used by future_avg_basket from Sales.xlsx'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sales', default=os.path.join(settings.DATA_DIR, 'Sales.xlsx'),
+                            help='Path to the Sales workbook')
+        parser.add_argument('--output', default=str(settings.CUSTOMER_FEATURE_STORE),
+                            help='Where to write the feature store (.npz)')
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['sales']):
+            raise CommandError(f"Sales workbook not found: {options['sales']}")
+        sales = load_table(options['sales'])
+        n_customers = build_feature_store(sales, options['output'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote features for {n_customers} customers to {options['output']}"))
@@ -0,0 +1,38 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ml_app.warehouse_db import SCHEMA, WarehouseDatabase, build
+
+
+class Command(BaseCommand):
+    help = ('Load the data/*.xlsx workbooks into an indexed SQLite star schema (settings.WAREHOUSE_DB) '
+            'for the warehouse_db query helpers')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=str(settings.WAREHOUSE_DB),
+                            help='SQLite file to write (default: settings.WAREHOUSE_DB)')
+        parser.add_argument('--force', action='store_true', help='Rebuild even if no workbook changed')
+
+    def handle(self, *args, **options):
+        database = WarehouseDatabase(options['output'])
+        if not options['force'] and not database.is_stale():
+            self.stdout.write(f"{options['output']} is up to date; use --force to rebuild")
+            return
+
+        def progress(name, rows):
+            if options['verbosity'] >= 1:
+                self.stdout.write(f'  {name:<20} {rows:>8} rows')
+
+        start = time.perf_counter()
+        summary = build(options['output'], progress=progress)
+        elapsed = time.perf_counter() - start
+        for name, info in summary.items():
+            if info['duplicates']:
+                key = SCHEMA[name][0]
+                self.stderr.write(f"{name}: dropped {info['duplicates']} row(s) repeating {key}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {options['output']}: {len(summary)} tables, "
+            f"{sum(info['rows'] for info in summary.values())} rows in {elapsed:.1f}s"
+        ))
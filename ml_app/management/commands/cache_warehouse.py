@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ml_app.data_loader import CACHE_FORMAT, available_tables, load_table
+
+
+class Command(BaseCommand):
+    help = 'Convert the data/*.xlsx workbooks into the columnar cache used by load_table()'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tables', nargs='*', help='Tables to cache (default: every workbook in DATA_DIR)')
+        parser.add_argument('--refresh', action='store_true', help='Rebuild even if the cache is fresh')
+
+    def handle(self, *args, **options):
+        for name in options['tables'] or available_tables():
+            start = time.perf_counter()
+            df = load_table(name, refresh=options['refresh'])
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f'{name}: {len(df)} rows ({CACHE_FORMAT}, {elapsed * 1000:.0f} ms)')
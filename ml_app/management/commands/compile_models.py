@@ -0,0 +1,92 @@
+import multiprocessing
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_app.registry import registry
+
+
+def _rss_anon():
+    """Resident anonymous (process-private) memory in bytes; None off Linux."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('RssAnon:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _measure_rss(source, store):
+    """Private RSS growth of unpickling ``source`` vs mapping ``store``.
+
+    Runs in a freshly spawned process so allocator reuse from earlier models
+    does not hide the cost.
+    """
+    import gc
+
+    import joblib
+    import numpy as np
+    import sklearn.ensemble  # noqa: F401  (library import cost is not model memory)
+    try:
+        import xgboost  # noqa: F401
+    except ImportError:
+        pass
+    from ml_app.tree_engine import ARRAYS, FlatTreeEnsemble
+
+    gc.collect()
+    before = _rss_anon()
+    model = joblib.load(source)
+    gc.collect()
+    native = _rss_anon() - before
+
+    before = _rss_anon()
+    flat = FlatTreeEnsemble.load(store)
+    # Touch every page: mapped file pages are shared, not anonymous
+    for name in ARRAYS:
+        getattr(flat, name).sum()
+    flat.predict(np.zeros((1, int(flat.feature.max()) + 1)))
+    mapped = _rss_anon() - before
+    del model
+    return native, mapped
+
+
+def _store_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+class Command(BaseCommand):
+    help = 'Compile tree-ensemble models into memory-mapped stores shared by all worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help='Models to compile (default: every configured model)')
+        parser.add_argument('--no-rss', action='store_true', help='Skip measuring the per-worker memory saved')
+
+    def handle(self, *args, **options):
+        names = options['models'] or registry.names()
+        unknown = [name for name in names if name not in registry.configs]
+        if unknown:
+            raise CommandError(f"Unknown model(s): {', '.join(unknown)}")
+
+        ctx = multiprocessing.get_context('spawn')
+        for name in names:
+            try:
+                flat = registry.compile_store(name)
+            except FileNotFoundError as e:
+                self.stderr.write(f'{name}: skipped, {e}')
+                continue
+            if flat is None:
+                self.stdout.write(f'{name}: not a tree ensemble, skipped')
+                continue
+
+            store = registry.store_path(name)
+            line = (f'{name}: {flat.n_trees} trees, {len(flat.feature)} nodes, '
+                    f'{_store_size(store) / 1024:.0f} KB in {store}')
+            if not options['no_rss'] and _rss_anon() is not None:
+                source = registry.artifact_paths(name)[0]
+                with ctx.Pool(1) as pool:
+                    native, mapped = pool.apply(_measure_rss, (source, store))
+                line += (f'; private RSS per worker {native / 1e6:.2f} MB -> {mapped / 1e6:.2f} MB '
+                         f'(saves {(native - mapped) / 1e6:.2f} MB)')
+            self.stdout.write(line)
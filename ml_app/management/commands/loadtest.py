@@ -0,0 +1,121 @@
+import asyncio
+import json
+import urllib.parse
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from ml_app.benchmark import VIEW_INPUTS
+from ml_app.loadtest import LoadTestError, Mix, Server, find_knee, run_stage
+from ml_app.registry import registry
+
+
+def _parse_mix(text):
+    """'spending_level=5,future_purchases=1' -> {url name: weight}"""
+    weights = {}
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        name, _, weight = item.partition('=')
+        if name not in VIEW_INPUTS:
+            raise CommandError(f"Unknown view '{name}' in --mix; choose from {', '.join(VIEW_INPUTS)}")
+        try:
+            weights[name] = float(weight) if weight else 1.0
+        except ValueError:
+            raise CommandError(f"Bad weight '{weight}' for '{name}' in --mix")
+    return weights
+
+
+class Command(BaseCommand):
+    help = ('Load-test the platform over HTTP at rising concurrency: logged-in virtual users post a '
+            'weighted mix of /ml/ forms; reports throughput and latency percentiles per step')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=['gunicorn', 'uvicorn', 'runserver'], default='gunicorn',
+                            help='Server to start: gunicorn (WSGI), uvicorn (ASGI) or runserver (default: gunicorn)')
+        parser.add_argument('--url', help='Test an already running server at this base URL instead of starting one')
+        parser.add_argument('--workers', type=int, default=4, help='Server worker processes (default: 4)')
+        parser.add_argument('--threads', type=int, default=1, help='Threads per gunicorn worker (default: 1)')
+        parser.add_argument('--concurrency', default='1,2,4,8,16,32',
+                            help='Comma-separated virtual user counts, one step each (default: 1,2,4,8,16,32)')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per step (default: 10)')
+        parser.add_argument('--mix', default='',
+                            help='Weighted views, e.g. "spending_level=5,customer_clustering=1" '
+                                 '(default: every view whose model is available, weight 1)')
+        parser.add_argument('--username', default='loadtest', help='Account the virtual users log in as')
+        parser.add_argument('--password', default='loadtest', help='Its password')
+        parser.add_argument('--create-user', action='store_true', help='Create the account (or reset its password) first')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the request mix')
+        parser.add_argument('--json', metavar='PATH', help='Also write the curve to PATH as JSON')
+
+    def handle(self, *args, **options):
+        try:
+            steps = sorted({int(n) for n in options['concurrency'].split(',') if n.strip()})
+        except ValueError:
+            raise CommandError('--concurrency takes comma-separated integers')
+        if not steps or steps[0] < 1:
+            raise CommandError('--concurrency needs positive user counts')
+
+        mix = self.build_mix(options)
+        if options['create_user']:
+            self.ensure_user(options['username'], options['password'])
+        credentials = (options['username'], options['password'])
+
+        try:
+            if options['url']:
+                url = urllib.parse.urlsplit(options['url'])
+                stages = self.run_steps(url.hostname, url.port or 80, steps, options, mix, credentials)
+                target = options['url']
+            else:
+                self.stderr.write(f"Starting {options['server']} with {options['workers']} worker(s)...")
+                with Server(options['server'], options['workers'], options['threads']) as server:
+                    stages = self.run_steps('127.0.0.1', server.port, steps, options, mix, credentials)
+                target = options['server']
+        except LoadTestError as e:
+            raise CommandError(str(e))
+
+        knee = find_knee(stages)
+        if knee is None:
+            self.stdout.write('Throughput was still rising at the highest concurrency tested')
+        else:
+            self.stdout.write(f'Knee: throughput stops scaling past ~{knee} concurrent users')
+        if options['json']:
+            with open(options['json'], 'w') as f:
+                json.dump({
+                    'target': target,
+                    'workers': None if options['url'] else options['workers'],
+                    'duration': options['duration'],
+                    'mix': dict(zip((t[0] for t in mix.targets), mix.weights)),
+                    'knee': knee,
+                    'stages': stages,
+                }, f, indent=2)
+            self.stderr.write(f"Wrote {options['json']}")
+
+    def build_mix(self, options):
+        weights = _parse_mix(options['mix'])
+        if not weights:
+            weights = {url_name: 1.0 for url_name, (model, _) in VIEW_INPUTS.items() if registry.available(model)}
+        targets = [(name, reverse(name), VIEW_INPUTS[name][1]) for name in weights]
+        return Mix(targets, list(weights.values()), seed=options['seed'])
+
+    def ensure_user(self, username, password):
+        User = get_user_model()
+        user, created = User.objects.get_or_create(username=username)
+        user.set_password(password)
+        user.save()
+        self.stderr.write(f"{'Created' if created else 'Reset the password of'} user '{username}'")
+
+    def run_steps(self, host, port, steps, options, mix, credentials):
+        self.stdout.write(f"{'users':>6} {'req/s':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} "
+                          f"{'errors':>7} {'client cpu':>10}")
+        stages = []
+        for users in steps:
+            stage = asyncio.run(run_stage(host, port, users, options['duration'], mix, credentials))
+            stages.append(stage)
+            self.stdout.write(
+                f"{users:>6} {stage['throughput_rps']:>9.1f} {stage['p50_ms'] or 0:>9.1f} {stage['p90_ms'] or 0:>9.1f} "
+                f"{stage['p99_ms'] or 0:>9.1f} {stage['max_ms'] or 0:>9.1f} {stage['errors']:>7} "
+                f"{stage['client_cpu']:>9.0%}"
+            )
+            if stage['client_cpu'] > 0.9:
+                self.stderr.write('  the load generator is CPU-bound; numbers above this step understate the server')
+        return stages
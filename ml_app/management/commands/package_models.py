@@ -0,0 +1,45 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_app.bundle import build_manifest, source_digests, write_bundle
+from ml_app.registry import artifact_version, registry
+
+
+class Command(BaseCommand):
+    help = 'Pack each model and its side artifacts into a single bundle file with a manifest'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help='Models to package (default: every configured model)')
+        parser.add_argument('--training-data', action='append', default=[], metavar='PATH',
+                            help='File the models were trained on, hashed into the manifest (repeatable)')
+
+    def handle(self, *args, **options):
+        names = options['models'] or registry.names()
+        unknown = [name for name in names if name not in registry.configs]
+        if unknown:
+            raise CommandError(f"Unknown model(s): {', '.join(unknown)}")
+
+        training_data = None
+        if options['training_data']:
+            paths = options['training_data']
+            try:
+                training_data = {
+                    'files': [os.path.basename(path) for path in paths],
+                    'sha256': artifact_version(paths),
+                }
+            except FileNotFoundError as e:
+                raise CommandError(str(e)) from e
+
+        os.makedirs(registry.bundle_dir, exist_ok=True)
+        for name in names:
+            try:
+                artifacts = registry.read_pickles(name)
+            except FileNotFoundError as e:
+                self.stderr.write(f'{name}: skipped, {e}')
+                continue
+            config = registry.configs[name]
+            path = registry.bundle_path(name)
+            sources = source_digests(p for p in registry.artifact_paths(name) if os.path.exists(p))
+            manifest = write_bundle(path, build_manifest(name, config, artifacts, training_data, sources), artifacts)
+            self.stdout.write(f'{name}: {path} ({os.path.getsize(path) / 1024:.0f} KB, version {manifest["version"]})')
@@ -0,0 +1,106 @@
+import json
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_app.bundle import BundleError
+from ml_app.registry import ModelRegistry, registry
+
+# What a worker imports before it can answer its first request
+BOOT_CODE = 'import django; django.setup(); from django.urls import get_resolver; get_resolver().url_patterns'
+
+_IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def _third_party_roots(modules):
+    """Top-level package names in ``modules``, leaving out the standard library."""
+    roots = {name.split('.')[0] for name in modules}
+    return {root for root in roots if not root.startswith('_') and root not in sys.stdlib_module_names}
+
+
+def import_profile():
+    """Import seconds of a fresh boot: per top-level package, and per ml_app module."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', BOOT_CODE],
+        capture_output=True, text=True, cwd=settings.BASE_DIR,
+    )
+    if result.returncode != 0:
+        raise CommandError(f'Booting the project failed:\n{result.stderr[-2000:]}')
+    packages = defaultdict(float)
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match is None:
+            continue
+        cumulative, indent, name = int(match.group(2)) / 1e6, match.group(3), match.group(4)
+        root = name.split('.')[0]
+        if len(indent) == 1 and _third_party_roots([root]):  # imported directly, not as a dependency
+            packages[root] += cumulative
+        if name.startswith('ml_app'):
+            modules[name] = cumulative
+    return dict(packages), modules
+
+
+def model_load_profile(names):
+    """Load each model into a fresh registry: (name, seconds, packages its load imported, error)."""
+    local = ModelRegistry(registry.configs)
+    rows = []
+    for name in names:
+        before = set(sys.modules)
+        start = time.perf_counter()
+        error = None
+        try:
+            local.get(name)
+        except (FileNotFoundError, BundleError) as e:
+            error = str(e)
+        elapsed = time.perf_counter() - start
+        imported = sorted(_third_party_roots(set(sys.modules) - before) - _third_party_roots(before))
+        rows.append((name, elapsed, imported, error))
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'Report where process startup goes: import time per package and load time per model'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help='Models to time (default: every configured model)')
+        parser.add_argument('--top', type=int, default=15, help='Packages to list (default: 15)')
+        parser.add_argument('--skip-models', action='store_true', help='Only profile imports')
+        parser.add_argument('--json', action='store_true', help='Print one JSON document instead of a table')
+
+    def handle(self, *args, **options):
+        packages, modules = import_profile()
+        rows = [] if options['skip_models'] else model_load_profile(options['models'] or registry.names())
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'import_seconds': packages,
+                'ml_app_module_seconds': modules,
+                'models': [
+                    {'name': name, 'seconds': elapsed, 'imported': imported, 'error': error}
+                    for name, elapsed, imported, error in rows
+                ],
+            }, indent=2))
+            return
+
+        self.stdout.write(f'Imports to serve the first request: {sum(packages.values()) * 1000:.0f} ms')
+        for package, seconds in sorted(packages.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f'  {package:<30} {seconds * 1000:8.1f} ms')
+        self.stdout.write('ml_app modules (cumulative):')
+        for module, seconds in sorted(modules.items(), key=lambda item: -item[1]):
+            self.stdout.write(f'  {module:<30} {seconds * 1000:8.1f} ms')
+
+        if rows:
+            self.stdout.write(f'Model loads: {sum(row[1] for row in rows) * 1000:.0f} ms')
+            for name, elapsed, imported, error in rows:
+                line = f'  {name:<38} {elapsed * 1000:8.1f} ms'
+                if imported:
+                    line += f"  (imported {', '.join(imported)})"
+                if error:
+                    line += f'  FAILED: {error}'
+                self.stdout.write(line)
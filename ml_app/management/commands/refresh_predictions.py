@@ -0,0 +1,49 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_app.customer_scoring import CUSTOMER_MODELS, default_workers
+from ml_app.prediction_table import prediction_table
+from ml_app.registry import registry
+
+
+class Command(BaseCommand):
+    help = ('Bring the materialized customer predictions up to date: rescore customers whose warehouse rows '
+            'changed, new customers and models with a new version')
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help=f"Models to refresh (default: the available ones of {', '.join(CUSTOMER_MODELS)})")
+        parser.add_argument('--full', action='store_true', help='Rescore every customer, changed or not')
+        parser.add_argument('--workers', type=int, default=default_workers(),
+                            help='Worker processes (default: one per available core)')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Customers per chunk (default: 500)')
+        parser.add_argument('--as-of', help='Date recency features are measured from (default: the day after the last sale)')
+        parser.add_argument('--json', action='store_true', help='Print the summary as JSON')
+
+    def handle(self, *args, **options):
+        models = options['models'] or None
+        for name in models or ():
+            if name not in CUSTOMER_MODELS:
+                raise CommandError(f"'{name}' is not a customer-level model; choose from {', '.join(CUSTOMER_MODELS)}")
+            if not registry.available(name):
+                raise CommandError(f"Model '{name}' has no artifacts in {registry.models_dir}")
+        if options['workers'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--workers and --chunk-size must be positive')
+
+        def progress(name, done, total):
+            if not options['json'] and options['verbosity'] > 1:
+                self.stderr.write(f'  {name}: chunk {done}/{total}')
+
+        summary = prediction_table.refresh(
+            models, full=options['full'], workers=options['workers'], chunk_size=options['chunk_size'],
+            as_of=options['as_of'], progress=progress,
+        )
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+            return
+        for name, result in summary.items():
+            self.stdout.write(
+                f"{name:<40} version {result['version']}: rescored {result['rescored']}/{result['customers']} "
+                f"customers, removed {result['removed']} ({result['seconds']:.2f}s)"
+            )
+        self.stdout.write(self.style.SUCCESS(f'Predictions table: {prediction_table.path}'))
@@ -0,0 +1,68 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_app.customer_scoring import CUSTOMER_MODELS, ScoringError, default_workers, score_customers
+from ml_app.registry import registry
+
+
+class Command(BaseCommand):
+    help = ('Score every customer of Customers_f with the customer-level models, in chunks on a process '
+            'pool; writes one row per customer to SQLite (default) or Parquet and resumes interrupted runs')
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help=f"Models to score (default: the available ones of {', '.join(CUSTOMER_MODELS)})")
+        parser.add_argument('--output', default=str(settings.CUSTOMER_SCORES),
+                            help='SQLite file, or a .parquet path (default: settings.CUSTOMER_SCORES)')
+        parser.add_argument('--workers', type=int, default=default_workers(),
+                            help='Worker processes (default: one per available core)')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Customers per chunk (default: 500)')
+        parser.add_argument('--as-of', help='Date recency features are measured from (default: the day after the last sale)')
+        parser.add_argument('--restart', action='store_true', help='Start over instead of resuming an interrupted run')
+        parser.add_argument('--json', action='store_true', help='Print the run summary as JSON')
+
+    def handle(self, *args, **options):
+        models = options['models'] or None
+        for name in models or ():
+            if name not in CUSTOMER_MODELS:
+                raise CommandError(f"'{name}' is not a customer-level model; choose from {', '.join(CUSTOMER_MODELS)}")
+            if not registry.available(name):
+                raise CommandError(f"Model '{name}' has no artifacts in {registry.models_dir}")
+        if models is None:
+            for name in CUSTOMER_MODELS:
+                if not registry.available(name):
+                    self.stderr.write(f"Skipping '{name}': its artifacts are missing")
+        if options['workers'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--workers and --chunk-size must be positive')
+
+        def progress(done, total, customers, elapsed):
+            if options['json'] or options['verbosity'] < 1:
+                return
+            rate = customers / elapsed if elapsed else 0.0
+            self.stderr.write(f'  chunk {done}/{total}: {customers} customers in {elapsed:.1f}s ({rate:.0f}/s)')
+
+        try:
+            summary = score_customers(
+                options['output'], models=models, workers=options['workers'], chunk_size=options['chunk_size'],
+                as_of=options['as_of'], restart=options['restart'], progress=progress,
+            )
+        except ScoringError as e:
+            raise CommandError(str(e))
+
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+            return
+        if summary['up_to_date']:
+            self.stdout.write(f"{options['output']} is up to date (run {summary['key']}); use --restart to score again")
+            return
+        if summary['skipped_chunks']:
+            self.stdout.write(f"Resumed run {summary['key']}: {summary['skipped_chunks']} chunk(s) were already written")
+        self.stdout.write(self.style.SUCCESS(
+            f"Scored {summary['customers']} customers with {len(summary['models'])} models in "
+            f"{summary['seconds']:.1f}s ({summary['customers_per_sec'] or 0:.0f} customers/s, "
+            f"{summary['workers']} worker(s)) -> {summary['output']}"
+        ))
+        for name, seconds in summary['model_seconds'].items():
+            rate = summary['customers'] / seconds if seconds else 0.0
+            self.stdout.write(f'  {name:<40} {seconds:8.2f}s  {rate:10.0f} customers/s')
@@ -0,0 +1,33 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ml_app.registry import registry
+from ml_app.warmup import run_warmup
+
+
+class Command(BaseCommand):
+    help = 'Load the configured models and score one synthetic row each, reporting the time taken'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help='Models to warm (default: every configured model)')
+        parser.add_argument('--json', action='store_true', help='Print the warmup state as JSON')
+
+    def handle(self, *args, **options):
+        names = options['models'] or registry.names()
+        unknown = [name for name in names if name not in registry.configs]
+        if unknown:
+            raise CommandError(f"Unknown model(s): {', '.join(unknown)}")
+
+        state = run_warmup(names)
+        if options['json']:
+            self.stdout.write(json.dumps(state, indent=2))
+            return
+
+        for name, result in state['models'].items():
+            if 'error' in result:
+                self.stderr.write(f'{name}: {result["error"]}')
+                continue
+            self.stdout.write(f"{name} ({result['version']}): load {result['load_seconds'] * 1000:.1f} ms, "
+                              f"first prediction {result['predict_seconds'] * 1000:.1f} ms")
+        self.stdout.write(f"Warm in {state['finished'] - state['started']:.2f}s")
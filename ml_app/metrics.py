@@ -0,0 +1,282 @@
+"""In-process metrics, exposed at ``/metrics`` in the Prometheus text format.
+
+Counters and histograms are updated on the request path and cost one lock
+acquisition each. They are registered at import time::
+
+    REQUESTS = counter('ml_requests_total', 'Requests handled', ['view', 'status'])
+    REQUESTS.labels('spending_level', '200').inc()
+
+State that already lives elsewhere (registry, result cache and micro-batcher
+stats, warmup) is read by collectors at scrape time instead of being copied
+on every request.
+
+Every worker process keeps its own values; scrape each worker (or label the
+target by pod/process) rather than expecting one set of totals per host.
+"""
+import bisect
+import math
+import threading
+import time
+
+# Upper bounds in seconds; +Inf is implied
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOAD_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_metrics = []
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_value(value):
+    if value is None:
+        return 'NaN'
+    if isinstance(value, float) and math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _sample(name, labels, value):
+    if labels:
+        label_text = ','.join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+        return f'{name}{{{label_text}}} {_format_value(value)}'
+    return f'{name} {_format_value(value)}'
+
+
+class _CounterChild:
+    __slots__ = ('_lock', 'value')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ('_lock', 'bounds', 'counts', 'sum')
+
+    def __init__(self, bounds):
+        self._lock = threading.Lock()
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        # Buckets are "less than or equal": bisect_left finds the first bound >= value
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ('child', 'start')
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} takes labels {self.labelnames}, got {values}')
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def reset(self):
+        with self._lock:
+            self._children.clear()
+
+    def exposition(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            children = sorted(self._children.items())
+        for values, child in children:
+            lines.extend(self._samples(dict(zip(self.labelnames, values)), child))
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _samples(self, labels, child):
+        yield _sample(self.name, labels, child.value)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _samples(self, labels, child):
+        with child._lock:
+            counts = list(child.counts)
+            total = child.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            yield _sample(f'{self.name}_bucket', dict(labels, le=_format_value(float(bound))), cumulative)
+        yield _sample(f'{self.name}_sum', labels, total)
+        yield _sample(f'{self.name}_count', labels, cumulative)
+
+
+def counter(name, documentation, labelnames=()):
+    metric = Counter(name, documentation, labelnames)
+    _metrics.append(metric)
+    return metric
+
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    metric = Histogram(name, documentation, labelnames, buckets)
+    _metrics.append(metric)
+    return metric
+
+
+def collector(func):
+    """Register ``func() -> [(name, kind, help, [(labels, value), ...]), ...]``, run at scrape time."""
+    _collectors.append(func)
+    return func
+
+
+def exposition():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.exposition())
+    for func in _collectors:
+        for name, kind, documentation, samples in func():
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(_sample(name, labels, value) for labels, value in samples)
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_enabled():
+    from django.conf import settings
+    return getattr(settings, 'ML_METRICS', False)
+
+
+# Request path
+
+REQUESTS = counter('ml_requests_total', 'HTTP requests handled, by view and status code', ['view', 'status'])
+REQUEST_ERRORS = counter('ml_request_errors_total', 'Requests that raised or answered 5xx', ['view'])
+REQUEST_LATENCY = histogram('ml_request_duration_seconds', 'Request latency through the whole middleware stack', ['view'])
+STAGE_LATENCY = histogram('ml_stage_duration_seconds', 'Time per request spent in each timed stage', ['stage'])
+
+# Models
+
+PREDICT_LATENCY = histogram(
+    'ml_model_predict_duration_seconds', 'Latency of one predict call (encode, scale, cache, predict)', ['model', 'mode'],
+)
+PREDICTED_ROWS = counter('ml_model_predicted_rows_total', 'Rows scored', ['model'])
+PREDICT_ERRORS = counter('ml_model_predict_errors_total', 'Predict calls that raised', ['model'])
+MODEL_LOAD = histogram('ml_model_load_duration_seconds', 'Time to load a model, first load or reload', ['model'], LOAD_BUCKETS)
+TABLE_LOOKUPS = counter(
+    'ml_prediction_table_lookups_total', 'Customers looked up by code_customer, by where the answer came from',
+    ['model', 'source'],
+)
+
+
+@collector
+def _registry_metrics():
+    from .registry import registry
+
+    stats = registry.stats()
+    models = stats['models']
+    return [
+        ('ml_models_loaded', 'gauge', 'Models currently loaded', [({}, stats['loaded'])]),
+        ('ml_model_loads_total', 'counter', 'Cold model loads', [({}, stats['loads'])]),
+        ('ml_model_reloads_total', 'counter', 'Hot reloads swapped in', [({}, stats['reloads'])]),
+        ('ml_model_evictions_total', 'counter', 'Models evicted to respect ML_MEMORY_BUDGET', [({}, stats['evictions'])]),
+        ('ml_model_resident_bytes', 'gauge', 'Estimated resident size of each loaded model',
+         [({'model': name}, model['resident_bytes']) for name, model in sorted(models.items())]),
+        ('ml_model_info', 'gauge', 'Version of each loaded model',
+         [({'model': name, 'version': model['version']}, 1) for name, model in sorted(models.items())]),
+    ]
+
+
+@collector
+def _result_cache_metrics():
+    from . import result_cache
+
+    caches = sorted(result_cache.stats().items())
+    return [
+        ('ml_result_cache_hits_total', 'counter', 'Prediction cache hits',
+         [({'model': name}, stats['hits']) for name, stats in caches]),
+        ('ml_result_cache_misses_total', 'counter', 'Prediction cache misses',
+         [({'model': name}, stats['misses']) for name, stats in caches]),
+        ('ml_result_cache_hit_ratio', 'gauge', 'Hits / lookups since start',
+         [({'model': name}, stats['hit_ratio']) for name, stats in caches]),
+        ('ml_result_cache_entries', 'gauge', 'Entries held',
+         [({'model': name}, stats['entries']) for name, stats in caches]),
+    ]
+
+
+@collector
+def _batching_metrics():
+    from . import batching
+
+    batchers = sorted(batching.stats().items())
+    return [
+        ('ml_micro_batches_total', 'counter', 'Vectorized predict calls made by micro-batchers',
+         [({'model': name}, stats['batches']) for name, stats in batchers]),
+        ('ml_micro_batch_rows_total', 'counter', 'Rows scored through micro-batchers',
+         [({'model': name}, stats['rows']) for name, stats in batchers]),
+        ('ml_micro_batch_queued', 'gauge', 'Rows waiting for a batch',
+         [({'model': name}, stats['queued']) for name, stats in batchers]),
+    ]
+
+
+@collector
+def _warmup_metrics():
+    from . import warmup
+
+    return [('ml_ready', 'gauge', '1 once this worker is warm (see /ml/health/ready)', [({}, int(warmup.is_ready()))])]
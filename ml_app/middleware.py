@@ -0,0 +1,102 @@
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import metrics, timing
+from .registry import models_used
+
+# Views whose responses carry Server-Timing
+TIMED_VIEW_MODULES = ('ml_app.views', 'ml_app.api')
+
+
+class ModelVersionMiddleware:
+    """Report the version of every model a response was computed with.
+
+    Adds ``X-Model-Version: name=version, ...``, so a client can tell which
+    side of a hot reload answered it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        used = {}
+        token = models_used.set(used)
+        try:
+            response = self.get_response(request)
+        finally:
+            models_used.reset(token)
+        if used:
+            response['X-Model-Version'] = ', '.join(f'{name}={version}' for name, version in sorted(used.items()))
+        return response
+
+
+class ServerTimingMiddleware:
+    """Time the stages of each prediction request and report them as ``Server-Timing``.
+
+    Listed first in ``MIDDLEWARE`` so that ``total`` covers the whole stack.
+    Only the views of ``TIMED_VIEW_MODULES`` get the header; admin, account
+    and static responses are left alone. Form bodies of the prediction
+    views are parsed under ``parse`` once the URL is resolved, just before
+    CSRF's own check reads them; the API views time their own parsing.
+    Disabled entirely unless ``ML_SERVER_TIMING`` is set.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'ML_SERVER_TIMING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        token = timing.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            totals = timing.stop(token)
+        if getattr(request, '_server_timing', False):
+            totals['total'] = time.perf_counter() - start
+            response['Server-Timing'] = timing.header_value(totals)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if view_func.__module__ not in TIMED_VIEW_MODULES:
+            return None
+        request._server_timing = True
+        if request.method == 'POST' and view_func.__module__ == 'ml_app.views':
+            with timing.stage('parse'):
+                request.POST
+        return None
+
+
+class MetricsMiddleware:
+    """Count and time every request for ``/metrics``, per view and per stage.
+
+    Listed first in ``MIDDLEWARE``. Disabled entirely unless ``ML_METRICS``
+    is set.
+    """
+
+    def __init__(self, get_response):
+        if not metrics.metrics_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        token = timing.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            stages = timing.stop(token)
+        elapsed = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = (match.url_name or match.view_name) if match is not None else 'unmatched'
+        metrics.REQUESTS.labels(view, response.status_code).inc()
+        if response.status_code >= 500:
+            metrics.REQUEST_ERRORS.labels(view).inc()
+        metrics.REQUEST_LATENCY.labels(view).observe(elapsed)
+        for name, seconds in stages.items():
+            metrics.STAGE_LATENCY.labels(name).observe(seconds)
+        return response
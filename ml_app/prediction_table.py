@@ -0,0 +1,255 @@
+"""Materialized per-customer predictions, read by the views and the JSON API.
+
+Customer-level predictions (see ``customer_scoring.CUSTOMER_MODELS``) only
+change when a customer's warehouse rows or the model change, so they are
+kept in a SQLite table (``settings.CUSTOMER_PREDICTIONS``)::
+
+    customer_predictions(model, version, code_customer, prediction, digest, as_of, updated, source)
+
+keyed by ``(model, version, code_customer)``. ``digest`` fingerprints the
+customer's source rows (``Warehouse.source_digests``), so
+``manage.py refresh_predictions`` only rescores customers whose rows changed,
+who are new, or who have no row for the model's current version; rows of
+older versions are dropped once a model is refreshed. ``source`` is the
+``customer_scoring.data_version`` of the exports the refresh read.
+
+At request time ``predict_customer`` answers from the row for the loaded
+model version and the current exports (an indexed read) and falls back to
+live inference when there is none, reading only the missing customers' rows
+from the SQLite warehouse (``warehouse_db``). Once the exports in ``data/``
+change, stored rows stop being served until ``manage.py refresh_predictions``
+has run, and live inference is refused until ``manage.py build_warehouse``
+has, so neither answers from older data than the other.
+"""
+import datetime
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from . import customer_scoring
+from .customer_scoring import AS_OF_MODELS, CUSTOMER_MODELS
+from .features import MODEL_INPUTS
+from .metrics import TABLE_LOOKUPS
+from .registry import registry
+from .timing import stage
+from .warehouse_db import WarehouseError, warehouse_db
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS customer_predictions (
+        model TEXT NOT NULL,
+        version TEXT NOT NULL,
+        code_customer INTEGER NOT NULL,
+        prediction,
+        digest INTEGER NOT NULL,
+        as_of TEXT,
+        updated TEXT,
+        source TEXT,
+        PRIMARY KEY (model, version, code_customer)
+    ) WITHOUT ROWID;
+'''
+
+
+class UnknownCustomerError(LookupError):
+    """A code_customer that is not in Customers_f."""
+
+
+class PredictionTable:
+    def __init__(self, path=None):
+        self._path = path
+        self._local = threading.local()
+        if hasattr(os, 'register_at_fork'):
+            # SQLite connections must not be shared with a forked child
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    @property
+    def path(self):
+        return Path(self._path or settings.CUSTOMER_PREDICTIONS)
+
+    def _after_fork(self):
+        self._local = threading.local()
+
+    def _reader(self):
+        """This thread's read-only connection, or None while the table has not been built."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if not self.path.exists():
+                return None
+            conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def _writer(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        # Readers keep answering while a refresh writes
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(customer_predictions)')}
+        if 'source' not in columns:
+            # Tables written before rows were stamped: none of their rows is served until refreshed
+            conn.execute('ALTER TABLE customer_predictions ADD COLUMN source TEXT')
+        return conn
+
+    def lookup(self, model, version, source, codes):
+        """``{code: prediction}`` for the codes with a row at ``version`` computed from ``source``."""
+        conn = self._reader()
+        if conn is None:
+            return {}
+        found = {}
+        codes = list(codes)
+        try:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(codes), 500):
+                batch = codes[start:start + 500]
+                rows = conn.execute(
+                    'SELECT code_customer, prediction FROM customer_predictions '
+                    'WHERE model = ? AND version = ? AND source = ? '
+                    f"AND code_customer IN ({', '.join('?' * len(batch))})",
+                    (model, version, source, *batch),
+                )
+                found.update(rows)
+        except sqlite3.OperationalError:
+            # Created but not yet populated by a refresh, or not yet stamped with sources
+            return {}
+        return found
+
+    def stats(self):
+        conn = self._reader()
+        if conn is None:
+            return {}
+        try:
+            rows = conn.execute(
+                'SELECT model, version, COUNT(*), MAX(updated) FROM customer_predictions GROUP BY model, version'
+            ).fetchall()
+        except sqlite3.OperationalError:
+            return {}
+        return {model: {'version': version, 'customers': count, 'updated': updated}
+                for model, version, count, updated in rows}
+
+    def refresh(self, models=None, full=False, workers=1, chunk_size=500, as_of=None, progress=None):
+        """Rescore the stale customers of each model; returns ``{model: summary}``.
+
+        ``full`` rescores everyone. ``progress(model, done, total)`` is called
+        after each chunk.
+        """
+        if models is None:
+            models = [name for name in CUSTOMER_MODELS if registry.available(name)]
+        # Taken before loading: exports replaced mid-refresh leave the rows unstamped for them
+        source = customer_scoring.data_version()
+        warehouse = customer_scoring.use_warehouse()
+        as_of = pd.Timestamp(as_of) if as_of is not None else customer_scoring.default_as_of(warehouse)
+        as_of_text = as_of.isoformat()
+        digests = warehouse.source_digests()
+
+        conn = self._writer()
+        summary = {}
+        try:
+            for name in models:
+                start = time.perf_counter()
+                version = registry.get(name)['version']
+                stored = pd.read_sql_query(
+                    'SELECT code_customer, digest, as_of FROM customer_predictions WHERE model = ? AND version = ?',
+                    conn, params=(name, version), index_col='code_customer',
+                )
+                stale = digests.index
+                if not full:
+                    # Compared on known codes only: reindexing would turn the int64 digests into floats
+                    known = digests.index.isin(stored.index)
+                    previous = stored.loc[digests.index[known]]
+                    fresh = previous['digest'].to_numpy() == digests[known].to_numpy()
+                    if name in AS_OF_MODELS:
+                        fresh &= previous['as_of'].to_numpy() == as_of_text
+                    stale = digests.index[known].difference(previous.index[fresh]).union(digests.index[~known])
+                removed = stored.index.difference(digests.index)
+
+                codes = [int(code) for code in stale]
+                chunks = [codes[i:i + chunk_size] for i in range(0, len(codes), chunk_size)]
+                tasks = [(chunk, [name], as_of) for chunk in chunks]
+                updated = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+                for done, (_, (scores, _)) in enumerate(customer_scoring.run_tasks(customer_scoring.score_codes, tasks, workers), 1):
+                    with conn:
+                        conn.executemany(
+                            'INSERT OR REPLACE INTO customer_predictions VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                            ((name, version, code, pred, int(digests[code]), as_of_text, updated, source)
+                             for code, pred in zip(scores['code_customer'].tolist(), scores[name].tolist())),
+                        )
+                    if progress is not None:
+                        progress(name, done, len(chunks))
+                with conn:
+                    conn.execute('DELETE FROM customer_predictions WHERE model = ? AND version != ?', (name, version))
+                    conn.executemany('DELETE FROM customer_predictions WHERE model = ? AND code_customer = ?',
+                                     ((name, int(code)) for code in removed))
+                    # Rows whose digest did not change are as good for these exports as rescored ones
+                    conn.execute('UPDATE customer_predictions SET source = ? WHERE model = ? AND version = ?',
+                                 (source, name, version))
+                summary[name] = {
+                    'version': version,
+                    'customers': len(digests),
+                    'rescored': len(codes),
+                    'removed': len(removed),
+                    'seconds': time.perf_counter() - start,
+                }
+        finally:
+            conn.close()
+        return summary
+
+
+prediction_table = PredictionTable()
+
+
+def parse_customer_code(value):
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        raise LookupError(f'Invalid customer code {value!r}')
+
+
+def predict_customers(entry, codes):
+    """Predictions of the loaded model ``entry`` for ``codes``, and where each came from.
+
+    Returns ``(predictions, sources)`` in the order of ``codes``, with
+    ``'table'`` or ``'live'`` per code. Raises LookupError for a model
+    without declared inputs (``features.MODEL_INPUTS``) or a malformed
+    code, UnknownCustomerError for codes missing from Customers_f, and
+    ``warehouse_db.WarehouseError`` when live codes are asked for while the
+    warehouse is missing or older than the exports.
+    """
+    name = entry['name']
+    if name not in MODEL_INPUTS:
+        raise LookupError(f"Model '{name}' does not score customers by code_customer")
+    codes = [parse_customer_code(code) for code in codes]
+    with stage('table'):
+        found = prediction_table.lookup(name, entry['version'], customer_scoring.data_version(), set(codes))
+    missing = sorted(set(codes) - set(found))
+    if missing:
+        with stage('features'):
+            if warehouse_db.is_stale():
+                raise WarehouseError(
+                    f'{warehouse_db.path} is missing or older than the exports in data/; run manage.py build_warehouse'
+                )
+            context = warehouse_db.feature_context(codes=missing)
+            unknown = sorted(set(missing) - set(context.codes.tolist()))
+            if unknown:
+                TABLE_LOOKUPS.labels(name, 'unknown').inc(len(unknown))
+                raise UnknownCustomerError(f'Unknown customer(s): {", ".join(map(str, unknown[:20]))}')
+        preds = customer_scoring.predict_customers(entry['pipeline'], name, context)
+        live = dict(zip(context.codes.tolist(), np.asarray(preds).tolist()))
+    else:
+        live = {}
+    TABLE_LOOKUPS.labels(name, 'table').inc(len(codes) - len(missing))
+    TABLE_LOOKUPS.labels(name, 'live').inc(len(missing))
+    predictions = [found[code] if code in found else live[code] for code in codes]
+    sources = ['table' if code in found else 'live' for code in codes]
+    return predictions, sources
+
+
+def predict_customer(entry, code):
+    """``(prediction, source)`` for one customer; see ``predict_customers``."""
+    predictions, sources = predict_customers(entry, [code])
+    return predictions[0], sources[0]
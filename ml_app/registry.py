@@ -0,0 +1,446 @@
+"""Lazy, thread-safe registry of the ML artifacts stored in ``models/``.
+
+Each model is loaded the first time it is requested, behind a per-model
+lock, so a cold request only pays for the model it actually uses and
+concurrent first requests never unpickle the same artifact twice.
+
+A model packaged with ``manage.py package_models`` is read from its single
+bundle file (see ``bundle``) and checked against its config first; models
+without a bundle fall back to the individual pickles named in the config.
+
+Tree ensembles compiled with ``manage.py compile_models`` are not unpickled
+at all: their memory-mapped store (see ``tree_engine``) is opened instead,
+so the node arrays live once in the page cache however many workers run.
+
+Loaded models are hot-reloaded: a watcher thread polls the files each model
+came from every ``ML_RELOAD_INTERVAL`` seconds, loads a changed model in the
+background and swaps the new entry in with one dict assignment. Requests that
+already hold the old entry finish on it; nobody waits on a cold load.
+
+With ``ML_MEMORY_BUDGET`` set, the registry keeps the resident footprint of
+loaded models under that many bytes by evicting the least recently used
+ones; an evicted model is simply loaded again on its next request.
+"""
+import contextvars
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from config.models_config import MODEL_CONFIGS
+
+from .bundle import BUNDLE_SUFFIX, BundleError, load_section, read_bundle, validate_manifest
+from .inference import CompiledPipeline, tree_engine_enabled
+from .metrics import MODEL_LOAD
+from .timing import stage
+from .tree_engine import FlatTreeEnsemble, compile_estimator, read_meta
+
+logger = logging.getLogger(__name__)
+
+# Optional side artifacts: (entry key, config key holding the file name)
+ARTIFACT_FILES = (
+    ('encoders', 'encoders_file'),
+    ('scaler', 'scaler_file'),
+    ('pca', 'pca_file'),
+    ('features', 'features_file'),
+)
+
+
+def _unpickle(path):
+    # joblib (and whatever the pickle references: sklearn, xgboost) is only
+    # imported once a model is actually loaded, not when Django starts
+    import joblib
+
+    return joblib.load(path)
+
+
+def artifact_version(paths):
+    """Short content hash identifying one set of artifact files."""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+class ModelRegistry:
+    def __init__(self, configs, models_dir=None, store_dir=None, bundle_dir=None):
+        self.configs = configs
+        self._models_dir = models_dir
+        self._store_dir = store_dir
+        self._bundle_dir = bundle_dir
+        self._entries = {}
+        self._last_used = {}
+        self._failed = {}
+        self._budget_lock = threading.Lock()
+        self.loads = 0
+        self.reloads = 0
+        self.evictions = 0
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._watching = False
+        if hasattr(os, 'register_at_fork'):
+            # The watcher thread does not survive a fork; restart it per worker
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    @property
+    def models_dir(self):
+        if self._models_dir is None:
+            return os.path.join(settings.BASE_DIR, 'models')
+        return self._models_dir
+
+    # Settings only apply to the default models/ directory; a registry given
+    # its own models_dir keeps its stores and bundles underneath it
+    @property
+    def store_dir(self):
+        if self._store_dir is not None:
+            return self._store_dir
+        if self._models_dir is None and getattr(settings, 'ML_MODEL_STORE', None):
+            return settings.ML_MODEL_STORE
+        return os.path.join(self.models_dir, 'compiled')
+
+    @property
+    def bundle_dir(self):
+        if self._bundle_dir is not None:
+            return self._bundle_dir
+        if self._models_dir is None and getattr(settings, 'ML_BUNDLE_DIR', None):
+            return settings.ML_BUNDLE_DIR
+        return os.path.join(self.models_dir, 'bundles')
+
+    def names(self):
+        return list(self.configs)
+
+    def is_loaded(self, name):
+        return name in self._entries
+
+    def loaded(self):
+        """{name: entry} of the models loaded right now."""
+        return dict(self._entries)
+
+    def get(self, name):
+        """Return the loaded entry for ``name``, loading it on first use."""
+        if not self._watching:
+            self._ensure_watcher()
+        entry = self._entries.get(name)
+        if entry is not None:
+            self._last_used[name] = time.monotonic()
+            return entry
+        if name not in self.configs:
+            raise KeyError(f"Unknown model '{name}'")
+        with self._lock_for(name):
+            # Another thread may have finished loading while we waited
+            entry = self._entries.get(name)
+            if entry is None:
+                with stage('load'):
+                    entry = self._load(name)
+                self._last_used[name] = time.monotonic()
+                self._entries[name] = entry
+                self.loads += 1
+                self._enforce_budget(keep=name)
+        return entry
+
+    def load_all(self):
+        """Load every configured model, skipping those with missing artifacts.
+
+        Under a memory budget only the models loaded last stay resident.
+        """
+        loaded = {}
+        for name in self.configs:
+            try:
+                loaded[name] = self.get(name)
+            except FileNotFoundError as e:
+                logger.warning("Skipping model '%s': %s", name, e)
+            except BundleError as e:
+                logger.error("Skipping model '%s': %s", name, e)
+        return loaded
+
+    def reload(self, name):
+        """Load a fresh copy of ``name`` and swap it in; returns True on success.
+
+        On failure the current version keeps serving, and the same files are
+        not retried until they change again.
+        """
+        with self._lock_for(name):
+            old = self._entries.get(name)
+            fingerprint = self._fingerprint(name)
+            try:
+                entry = self._load(name)
+                # The new version takes traffic already warm; one that cannot score is not swapped in
+                try:
+                    entry['pipeline'].warm()
+                except Exception:
+                    entry['pipeline'].close()
+                    raise
+            except Exception as e:
+                self._failed[name] = fingerprint
+                logger.error("Reloading model '%s' failed, keeping version %s: %s",
+                             name, old['version'] if old else None, e)
+                return False
+            self._entries[name] = entry
+            self._failed.pop(name, None)
+            self.reloads += 1
+            self._enforce_budget(keep=name)
+        logger.info("Reloaded model '%s': version %s -> %s", name, old['version'] if old else None, entry['version'])
+        if old is not None:
+            old['pipeline'].close()
+        return True
+
+    def reload_changed(self):
+        """Reload every loaded model whose files changed on disk; returns their names."""
+        reloaded = []
+        for name, entry in list(self._entries.items()):
+            fingerprint = self._fingerprint(name)
+            if fingerprint == entry['fingerprint'] or fingerprint == self._failed.get(name):
+                continue
+            if self.reload(name):
+                reloaded.append(name)
+        return reloaded
+
+    def versions(self):
+        return {name: entry['version'] for name, entry in self._entries.items()}
+
+    @property
+    def memory_budget(self):
+        return getattr(settings, 'ML_MEMORY_BUDGET', None)
+
+    def resident_bytes(self):
+        return sum(entry['nbytes'] for entry in list(self._entries.values()))
+
+    def _enforce_budget(self, keep):
+        """Evict least recently used models until the loaded ones fit the budget."""
+        budget = self.memory_budget
+        if not budget:
+            return
+        with self._budget_lock:
+            while self.resident_bytes() > budget:
+                candidates = [name for name in self._entries if name != keep]
+                if not candidates:
+                    logger.warning("Model '%s' alone exceeds ML_MEMORY_BUDGET (%d > %d bytes)",
+                                   keep, self._entries[keep]['nbytes'], budget)
+                    return
+                victim = min(candidates, key=lambda name: self._last_used.get(name, 0.0))
+                self._evict(victim)
+
+    def _evict(self, name):
+        entry = self._entries.pop(name, None)
+        if entry is None:
+            return
+        self.evictions += 1
+        logger.info("Evicted model '%s' (%d bytes) to stay within ML_MEMORY_BUDGET", name, entry['nbytes'])
+        # Requests holding the entry finish on it; its memory goes with the last of them
+        entry['pipeline'].close()
+
+    def stats(self):
+        entries = dict(self._entries)
+        return {
+            'loaded': len(entries),
+            'configured': len(self.configs),
+            'loads': self.loads,
+            'reloads': self.reloads,
+            'evictions': self.evictions,
+            'resident_bytes': sum(entry['nbytes'] for entry in entries.values()),
+            'memory_budget': self.memory_budget,
+            'models': {
+                name: {
+                    'version': entry['version'],
+                    'resident_bytes': entry['nbytes'],
+                    'idle_seconds': round(time.monotonic() - self._last_used.get(name, time.monotonic()), 3),
+                }
+                for name, entry in entries.items()
+            },
+        }
+
+    def _ensure_watcher(self):
+        with self._locks_guard:
+            if self._watching:
+                return
+            self._watching = True
+            interval = getattr(settings, 'ML_RELOAD_INTERVAL', 0)
+            if interval:
+                threading.Thread(target=self._watch, args=(interval,), name='ml-model-reload', daemon=True).start()
+
+    def _after_fork(self):
+        self._watching = False
+
+    def _watch(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.reload_changed()
+            except Exception:
+                logger.exception('Checking models for changes failed')
+
+    def _fingerprint(self, name):
+        """(path, mtime, size) of every file the model is loaded or packaged from.
+
+        The source pickles are watched even behind a bundle: a retrained pickle
+        then reloads the model, and the bundle it no longer matches is refused
+        loudly instead of quietly serving the old estimator.
+        """
+        paths = self.artifact_paths(name)
+        bundle = self.bundle_path(name)
+        if os.path.exists(bundle):
+            paths.append(bundle)
+        paths.append(os.path.join(self.store_path(name), 'meta.json'))
+        stamp = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                stamp.append((path, None, None))
+            else:
+                stamp.append((path, st.st_mtime_ns, st.st_size))
+        return tuple(stamp)
+
+    def unload(self, name=None):
+        if name is None:
+            self._entries.clear()
+            self._last_used.clear()
+        else:
+            self._entries.pop(name, None)
+            self._last_used.pop(name, None)
+
+    def _lock_for(self, name):
+        with self._locks_guard:
+            lock = self._locks.get(name)
+            if lock is None:
+                lock = self._locks[name] = threading.Lock()
+            return lock
+
+    def _path(self, file_name):
+        return os.path.join(self.models_dir, file_name)
+
+    def artifact_paths(self, name):
+        config = self.configs[name]
+        paths = [self._path(config['model_file'])]
+        for _, file_key in ARTIFACT_FILES:
+            if config.get(file_key):
+                paths.append(self._path(config[file_key]))
+        return paths
+
+    def available(self, name):
+        """True when ``name`` has a bundle or every one of its pickles on disk."""
+        return os.path.exists(self.bundle_path(name)) or all(os.path.exists(p) for p in self.artifact_paths(name))
+
+    def bundle_path(self, name):
+        return os.path.join(self.bundle_dir, f'{name}{BUNDLE_SUFFIX}')
+
+    def store_path(self, name):
+        return os.path.join(self.store_dir, name)
+
+    def read_pickles(self, name):
+        """The model and side artifacts of ``name`` from its legacy per-artifact pickles."""
+        config = self.configs[name]
+        artifacts = {key: None for key, _ in ARTIFACT_FILES}
+        artifacts['model'] = _unpickle(self._path(config['model_file']))
+        for key, file_key in ARTIFACT_FILES:
+            if config.get(file_key):
+                artifacts[key] = _unpickle(self._path(config[file_key]))
+        return artifacts
+
+    def _native_model(self, name):
+        """The unpickled estimator, and the version a compiled store is keyed on."""
+        path = self.bundle_path(name)
+        if os.path.exists(path):
+            manifest, sections = read_bundle(path)
+            return load_section(sections, 'model'), manifest['version']
+        source = self._path(self.configs[name]['model_file'])
+        return _unpickle(source), artifact_version([source])
+
+    def compile_store(self, name):
+        """Write the memory-mapped tree store for ``name``; None if it is not a tree ensemble."""
+        model, version = self._native_model(name)
+        flat = compile_estimator(model)
+        if flat is None:
+            return None
+        return flat.save(self.store_path(name), model=name, source_version=version)
+
+    def _open_store(self, name, source_version):
+        """The model's compiled store if present and built from ``source_version``, else None."""
+        store = self.store_path(name)
+        if not tree_engine_enabled() or not os.path.exists(os.path.join(store, 'meta.json')):
+            return None
+        try:
+            if read_meta(store).get('source_version') != source_version:
+                logger.warning("Tree store for '%s' is stale, run compile_models; unpickling instead", name)
+                return None
+            return FlatTreeEnsemble.load(store)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Cannot open tree store for '%s': %s", name, e)
+            return None
+
+    def _load_bundle(self, name, path):
+        manifest, sections = read_bundle(path)
+        problems = validate_manifest(manifest, name, self.configs[name], self.artifact_paths(name))
+        if problems:
+            raise BundleError(f"{path}: {'; '.join(problems)}")
+        entry = {key: None for key, _ in ARTIFACT_FILES}
+        entry.update(load_section(sections, 'artifacts'))
+        entry['model'] = self._open_store(name, manifest['version'])
+        if entry['model'] is None:
+            entry['model'] = load_section(sections, 'model')
+            model_bytes = len(sections['model'])
+        else:
+            model_bytes = entry['model'].nbytes
+        entry['nbytes'] = len(sections['artifacts']) + model_bytes
+        entry['manifest'] = manifest
+        entry['version'] = manifest['version']
+        return entry
+
+    def _load_pickles(self, name):
+        config = self.configs[name]
+        source = self._path(config['model_file'])
+        entry = {key: None for key, _ in ARTIFACT_FILES}
+        entry['model'] = self._open_store(name, artifact_version([source]))
+        if entry['model'] is None:
+            entry['model'] = _unpickle(source)
+            entry['nbytes'] = os.path.getsize(source)
+        else:
+            entry['nbytes'] = entry['model'].nbytes
+        for key, file_key in ARTIFACT_FILES:
+            if config.get(file_key):
+                path = self._path(config[file_key])
+                entry[key] = _unpickle(path)
+                entry['nbytes'] += os.path.getsize(path)
+        entry['manifest'] = None
+        entry['version'] = artifact_version(self.artifact_paths(name))
+        return entry
+
+    # An entry's 'nbytes' is its footprint estimate: the pickled size of what
+    # was unpickled (joblib stores arrays raw, so this tracks their in-memory
+    # size) plus the node arrays of a mapped tree store.
+    def _load(self, name):
+        start = time.perf_counter()
+        # Taken first, so a file rewritten while loading triggers another reload
+        fingerprint = self._fingerprint(name)
+        path = self.bundle_path(name)
+        if os.path.exists(path):
+            entry = self._load_bundle(name, path)
+        else:
+            entry = self._load_pickles(name)
+        entry['name'] = name
+        entry['config'] = self.configs[name]
+        entry['fingerprint'] = fingerprint
+        entry['pipeline'] = CompiledPipeline(entry)
+        MODEL_LOAD.labels(name).observe(time.perf_counter() - start)
+        logger.info("Loaded model '%s' (version %s)", name, entry['version'])
+        return entry
+
+
+registry = ModelRegistry(MODEL_CONFIGS)
+
+# {model name: version} of the models used while serving the current request,
+# set up by ModelVersionMiddleware
+models_used = contextvars.ContextVar('ml_models_used', default=None)
+
+
+def get_model(name):
+    entry = registry.get(name)
+    used = models_used.get()
+    if used is not None:
+        used[name] = entry['version']
+    return entry
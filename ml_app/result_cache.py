@@ -0,0 +1,105 @@
+"""Opt-in prediction result cache.
+
+A model enables it with a ``result_cache`` entry in ``MODEL_CONFIGS``::
+
+    'result_cache': {'max_entries': 1024, 'ttl': 300},
+
+Results are keyed by the model's artifact version and a digest of the final
+(encoded and scaled) feature vector, so two inputs that encode to the same row
+share an entry and a retrained artifact never serves stale results.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTL = 300
+
+
+def vector_digest(X):
+    # Adding 0.0 turns -0.0 into 0.0 so both hash the same
+    data = np.ascontiguousarray(X, dtype=np.float64) + 0.0
+    return hashlib.blake2b(data.tobytes(), digest_size=16).digest()
+
+
+class PredictionCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """Return ``(True, value)`` on a fresh hit, ``(False, None)`` otherwise."""
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires, value = item
+                if expires > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._data[key]
+                self.expirations += 1
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+_caches = {}
+_caches_guard = threading.Lock()
+
+
+def cache_for(name, config):
+    """The cache of model ``name``, or None when its config does not opt in."""
+    options = config.get('result_cache')
+    if not options:
+        return None
+    with _caches_guard:
+        cache = _caches.get(name)
+        if cache is None:
+            cache = _caches[name] = PredictionCache(
+                max_entries=options.get('max_entries', DEFAULT_MAX_ENTRIES),
+                ttl=options.get('ttl', DEFAULT_TTL),
+            )
+        return cache
+
+
+def stats():
+    with _caches_guard:
+        caches = dict(_caches)
+    return {name: cache.stats() for name, cache in caches.items()}
@@ -1,3 +1,994 @@
-from django.test import TestCase
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+import joblib
+import numpy as np
+import pandas as pd
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from . import (
+    aggregation, api, benchmark, customer_scoring, data_loader, feature_store, metrics, prediction_table, views,
+    warehouse_db, warmup,
+)
+from .batching import MicroBatcher
+from .bundle import (
+    BundleError, build_manifest, installed_version, load_section, read_bundle, source_digests, validate_manifest,
+    write_bundle,
+)
+from .features import HISTORY_QUANTILE, MODEL_INPUTS, FeatureContext
+from .inference import CompiledPipeline, categorical_sources, label_encoders
+from .prediction_table import PredictionTable
+from .registry import ModelRegistry, registry
+from .result_cache import PredictionCache, vector_digest
+from .tree_engine import FlatTreeEnsemble, compile_estimator
+
+
+class FlatTreeEngineTests(SimpleTestCase):
+    """The flattened evaluator must reproduce each tree model's own predict()."""
+
+    def sample_inputs(self, flat, n_features, n_rows=2000, seed=0):
+        # Draw every feature from its split thresholds (exactly on, and just
+        # around them) so that both branches of most nodes are exercised.
+        rng = np.random.default_rng(seed)
+        X = rng.normal(size=(n_rows, n_features))
+        internal = np.isfinite(flat.threshold)
+        for j in range(n_features):
+            thresholds = np.asarray(flat.threshold[internal & (flat.feature == j)], dtype=np.float64)
+            if len(thresholds) == 0:
+                continue
+            picks = rng.choice(thresholds, size=n_rows)
+            jitter = rng.choice([-1e-3, 0.0, 1e-3], size=n_rows) * np.maximum(1.0, np.abs(picks))
+            X[:, j] = picks + jitter
+        return X
+
+    def tree_models(self):
+        """(name, config, unpickled estimator, flat model) for every tree artifact on disk."""
+        models = []
+        for name in registry.names():
+            try:
+                model = joblib.load(registry.artifact_paths(name)[0])
+            except (FileNotFoundError, ImportError):
+                continue
+            flat = compile_estimator(model)
+            if flat is not None:
+                models.append((name, registry.configs[name], model, flat))
+        if not models:
+            self.skipTest('No tree-ensemble artifacts available')
+        return models
+
+    def assert_same_predictions(self, config, actual, expected):
+        if config['type'] == 'regression':
+            np.testing.assert_allclose(actual, expected, rtol=1e-6)
+        else:
+            np.testing.assert_array_equal(actual, expected)
+
+    def test_flat_predict_matches_estimator(self):
+        for name, config, model, flat in self.tree_models():
+            X = self.sample_inputs(flat, len(config['features']))
+            with self.subTest(model=name):
+                self.assert_same_predictions(config, flat.predict(X), np.asarray(model.predict(X)))
+
+    def test_missing_values_follow_each_node_default(self):
+        for name, config, model, flat in self.tree_models():
+            X = self.sample_inputs(flat, len(config['features']), seed=2)
+            X[np.random.default_rng(2).random(X.shape) < 0.2] = np.nan
+            with self.subTest(model=name):
+                self.assert_same_predictions(config, flat.compact().predict(X), np.asarray(model.predict(X)))
+
+    def test_compact_store_round_trip(self):
+        for name, config, model, flat in self.tree_models():
+            X = self.sample_inputs(flat, len(config['features']), seed=1)
+            with tempfile.TemporaryDirectory() as tmp, self.subTest(model=name):
+                flat.save(f'{tmp}/{name}')
+                stored = FlatTreeEnsemble.load(f'{tmp}/{name}')
+                self.assertEqual(stored.left.dtype, np.int32)
+                self.assertEqual(stored.threshold.dtype, np.float32)
+                self.assert_same_predictions(config, stored.predict(X), np.asarray(model.predict(X)))
+
+    def test_failed_save_keeps_the_previous_store(self):
+        name, config, model, flat = self.tree_models()[0]
+        with tempfile.TemporaryDirectory() as tmp:
+            flat.save(f'{tmp}/{name}', source_version='a')
+            with mock.patch('numpy.save', side_effect=OSError('disk full')), self.assertRaises(OSError):
+                flat.save(f'{tmp}/{name}', source_version='b')
+            self.assertEqual(os.listdir(tmp), [name])
+            self.assertEqual(FlatTreeEnsemble.load(f'{tmp}/{name}').n_trees, flat.n_trees)
+
+
+def legacy_predict(entry, rows):
+    """The views' original path: one DataFrame, LabelEncoder.transform, astype(float), scaler, predict."""
+    config = entry['config']
+    features = list(config['features'])
+    sources = categorical_sources(config)
+    encoders = label_encoders(entry)
+    frame = pd.DataFrame(rows)
+    X = pd.DataFrame({feature: frame[sources.get(feature, feature)] for feature in features})
+    for feature, col in sources.items():
+        if col in encoders:
+            X[feature] = encoders[col].transform(frame[col].astype(str))
+    X = X.astype(float)
+    if entry.get('scaler') is not None:
+        X = pd.DataFrame(entry['scaler'].transform(X), columns=features)
+    names = getattr(entry['model'], 'feature_names_in_', None)
+    if names is not None:
+        X = X[list(names)]
+    return np.asarray(entry['model'].predict(X))
+
+
+class CompiledPipelineTests(SimpleTestCase):
+    """CompiledPipeline must score exactly like the DataFrame path it replaced."""
+
+    def sample_rows(self, entry, n_rows=200, seed=0):
+        """Customers' real feature rows when the warehouse is built, else rows around the training statistics."""
+        pipeline = entry['pipeline']
+        if entry['name'] in MODEL_INPUTS and warehouse_db.warehouse_db.exists():
+            context = warehouse_db.warehouse_db.feature_context(codes=range(1, n_rows + 1))
+            return context.model_frame(entry['name'])[pipeline.columns].to_dict('records')
+        rng = np.random.default_rng(seed)
+        columns = {}
+        for i, col in enumerate(pipeline.columns):
+            if pipeline.lookups[i] is not None:
+                columns[col] = rng.choice(list(pipeline.lookups[i]), size=n_rows)
+            elif pipeline.mean is not None:
+                columns[col] = pipeline.mean[i] + pipeline.scale[i] * rng.normal(size=n_rows)
+            else:
+                columns[col] = rng.uniform(0, 100, size=n_rows).round()
+        return pd.DataFrame(columns).to_dict('records')
+
+    def assert_same(self, config, actual, expected):
+        if config['type'] == 'regression':
+            np.testing.assert_allclose(np.asarray(actual, dtype=float), expected, rtol=1e-9)
+        else:
+            np.testing.assert_array_equal(np.asarray(actual), expected)
+
+    def assert_matches_legacy(self, entry, rows):
+        pipeline = entry['pipeline']
+        expected = legacy_predict(entry, rows)
+        self.assert_same(entry['config'], pipeline.predict_many(pd.DataFrame(rows)), expected)
+        self.assert_same(entry['config'], [pipeline.predict_one(row) for row in rows[:25]], expected[:25])
+
+    def test_every_model_matches_the_dataframe_path(self):
+        checked = 0
+        for name in registry.names():
+            try:
+                entry = registry.get(name)
+            except (FileNotFoundError, BundleError):
+                continue
+            with self.subTest(model=name):
+                rows = self.sample_rows(entry)
+                self.assert_matches_legacy(entry, rows)
+
+                categorical = [col for col, lookup in zip(entry['pipeline'].columns, entry['pipeline'].lookups) if lookup]
+                if categorical:
+                    col = categorical[0]
+                    unseen = dict(rows[0], **{col: 'not-a-label'})
+                    with self.assertRaises(ValueError):
+                        legacy_predict(entry, [unseen])
+                    with self.assertRaises(ValueError):
+                        entry['pipeline'].predict_one(unseen)
+                    # handle_unknown='first' scores an unseen label as the encoder's first class
+                    first = dict(unseen, **{col: label_encoders(entry)[col].classes_[0]})
+                    self.assert_same(entry['config'], [entry['pipeline'].predict_one(unseen, handle_unknown='first')],
+                                     legacy_predict(entry, [first]))
+            checked += 1
+        if not checked:
+            self.skipTest('No model artifacts available')
+
+    def test_columns_are_reordered_for_an_estimator_fitted_in_another_order(self):
+        from sklearn.linear_model import LinearRegression
+        from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+        rng = np.random.default_rng(0)
+        features = ['a', 'color_encoded', 'b']
+        colors = rng.choice(['red', 'green', 'blue'], size=50)
+        encoder = LabelEncoder().fit(colors)
+        train = pd.DataFrame({'a': rng.normal(size=50), 'color_encoded': encoder.transform(colors).astype(float),
+                              'b': rng.normal(10, 3, size=50)})
+        scaler = StandardScaler().fit(train)
+        scaled = pd.DataFrame(scaler.transform(train), columns=features)
+        target = scaled['a'] + 2 * scaled['color_encoded'] - 3 * scaled['b']
+        model = LinearRegression().fit(scaled[['b', 'a', 'color_encoded']], target)
+        config = {'features': features, 'cat_features': ['color'], 'type': 'regression'}
+        entry = {'name': 'reordered', 'version': 'v1', 'config': config, 'model': model,
+                 'encoders': {'color': encoder}, 'scaler': scaler}
+        entry['pipeline'] = CompiledPipeline(entry)
+        self.assertEqual(entry['pipeline'].order.tolist(), [2, 0, 1])
+        rows = [{'a': float(a), 'color': str(color), 'b': float(b)}
+                for a, color, b in zip(rng.normal(size=30), rng.choice(encoder.classes_, size=30), rng.normal(10, 3, size=30))]
+        self.assert_matches_legacy(entry, rows)
+
+
+class LazyRegistryTests(SimpleTestCase):
+    def test_concurrent_first_use_loads_each_model_once(self):
+        names = ['regression_state_revenue', 'customer_clustering']
+        local = ModelRegistry({name: registry.configs[name] for name in names})
+        load = local._load
+
+        def slow_load(name):
+            time.sleep(0.05)
+            return load(name)
+
+        barrier = threading.Barrier(8)
+
+        def first_use(name):
+            barrier.wait()
+            return local.get(name)
+
+        with mock.patch.object(local, '_load', side_effect=slow_load) as loader, ThreadPoolExecutor(8) as pool:
+            try:
+                entries = list(pool.map(first_use, names * 4))
+            except FileNotFoundError:
+                self.skipTest('model artifacts not available')
+        self.assertCountEqual([c.args[0] for c in loader.call_args_list], names)
+        self.assertEqual(local.stats()['loads'], 2)
+        for name, entry in zip(names * 4, entries):
+            self.assertIs(entry, local.get(name))
+
+
+class ModelBundleTests(SimpleTestCase):
+    def test_bundle_round_trip_and_validation(self):
+        name = 'classification_customer_behavior'
+        config = registry.configs[name]
+        try:
+            artifacts = registry.read_pickles(name)
+        except FileNotFoundError:
+            self.skipTest(f'{name} artifacts not available')
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f'{tmp}/{name}.bundle'
+            written = write_bundle(path, build_manifest(name, config, artifacts), artifacts)
+            manifest, sections = read_bundle(path)
+            self.assertEqual(manifest['version'], written['version'])
+            self.assertEqual(validate_manifest(manifest, name, config), [])
+            self.assertEqual(manifest['categorical']['Gender'], list(artifacts['encoders']['Gender'].classes_))
+
+            model = load_section(sections, 'model')
+            X = np.zeros((3, len(config['features'])))
+            np.testing.assert_array_equal(model.predict(X), artifacts['model'].predict(X))
+
+            problems = validate_manifest(manifest, name, dict(config, features=config['features'][:-1]))
+            self.assertIn('feature list differs from MODEL_CONFIGS', problems)
+
+            # Built from a source pickle that has since been retrained
+            sources = [shutil.copy(p, tmp) for p in registry.artifact_paths(name)]
+            manifest['sources'] = source_digests(sources)
+            self.assertEqual(validate_manifest(manifest, name, config, sources), [])
+            with open(sources[0], 'ab') as f:
+                f.write(b'retrained')
+            problems = validate_manifest(manifest, name, config, sources)
+            self.assertEqual(problems, [f'{os.path.basename(sources[0])} changed since the bundle was built'])
+
+            # sklearn pickles do not load across minor releases
+            major, minor = installed_version('sklearn').split('.')[:2]
+            manifest['libraries'] = {'sklearn': f'{major}.{int(minor) + 1}.0'}
+            self.assertIn('built with sklearn', validate_manifest(manifest, name, config)[0])
+
+            with open(path, 'r+b') as f:
+                f.seek(-1, 2)
+                last = f.read(1)
+                f.seek(-1, 2)
+                f.write(bytes([last[0] ^ 0xFF]))
+            with self.assertRaises(BundleError):
+                read_bundle(path)
+
+
+class HotReloadTests(SimpleTestCase):
+    def test_changed_artifact_is_swapped_in(self):
+        name = 'future_purchases'
+        config = registry.configs[name]
+        with tempfile.TemporaryDirectory() as tmp:
+            try:
+                for path in registry.artifact_paths(name):
+                    shutil.copy(path, tmp)
+            except FileNotFoundError:
+                self.skipTest(f'{name} artifacts not available')
+            local = ModelRegistry({name: config}, models_dir=tmp)
+            old = local.get(name)
+            self.assertEqual(local.reload_changed(), [])
+
+            model_path = os.path.join(tmp, config['model_file'])
+            stat = os.stat(model_path)
+            os.utime(model_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            self.assertEqual(local.reload_changed(), [name])
+
+            new = local.get(name)
+            self.assertIsNot(new, old)
+            self.assertEqual(new['version'], old['version'])
+            # A request still holding the old entry keeps working
+            values = dict.fromkeys(new['pipeline'].columns, 1.0)
+            self.assertEqual(old['pipeline'].predict_one(values), new['pipeline'].predict_one(values))
+
+    def test_pickle_retrained_behind_a_bundle_is_noticed(self):
+        name = 'future_purchases'
+        config = registry.configs[name]
+        with tempfile.TemporaryDirectory() as tmp:
+            try:
+                sources = [shutil.copy(path, tmp) for path in registry.artifact_paths(name)]
+            except FileNotFoundError:
+                self.skipTest(f'{name} artifacts not available')
+            local = ModelRegistry({name: config}, models_dir=tmp)
+            os.makedirs(local.bundle_dir)
+            artifacts = local.read_pickles(name)
+            write_bundle(local.bundle_path(name),
+                         build_manifest(name, config, artifacts, sources=source_digests(sources)), artifacts)
+            old = local.get(name)
+
+            with open(sources[0], 'ab') as f:
+                f.write(b'retrained')
+            with self.assertLogs('ml_app.registry', 'ERROR') as logs:
+                self.assertEqual(local.reload_changed(), [])
+            self.assertIn('changed since the bundle was built', logs.output[0])
+            self.assertIs(local.get(name), old)
+
+
+class MemoryBudgetTests(SimpleTestCase):
+    def test_least_recently_used_model_is_evicted(self):
+        names = ['future_purchases', 'regression_failed_orders', 'customer_clustering']
+        local = ModelRegistry({name: registry.configs[name] for name in names})
+        try:
+            sizes = {name: local.get(name)['nbytes'] for name in names}
+        except FileNotFoundError:
+            self.skipTest('model artifacts not available')
+
+        local.unload(names[2])
+        local.get(names[0])
+        with override_settings(ML_MEMORY_BUDGET=sizes[names[0]] + sizes[names[2]]):
+            local.get(names[2])
+        stats = local.stats()
+        self.assertEqual(sorted(stats['models']), sorted([names[0], names[2]]))
+        self.assertEqual(stats['evictions'], 1)
+        self.assertLessEqual(stats['resident_bytes'], sizes[names[0]] + sizes[names[2]])
+        # An evicted model comes back on demand
+        local.get(names[1])
+        self.assertTrue(local.is_loaded(names[1]))
+        self.assertEqual(local.stats()['loads'], 5)
+
+
+class MicroBatchingTests(SimpleTestCase):
+    def test_batcher_is_closed_only_once_its_entry_is_replaced(self):
+        name = 'regression_state_revenue'
+        local = ModelRegistry({name: registry.configs[name]})
+        try:
+            entry = local.get(name)
+        except FileNotFoundError:
+            self.skipTest(f'{name} artifacts not available')
+        batcher = entry['pipeline'].batcher
+        self.assertIsNotNone(batcher)
+
+        # Building another pipeline of the same model leaves the served one alone
+        other = CompiledPipeline(entry)
+        self.addCleanup(other.close)
+        self.assertFalse(batcher._closed)
+
+        self.assertTrue(local.reload(name))
+        self.assertTrue(batcher._closed)
+        new = local.get(name)['pipeline']
+        self.addCleanup(new.close)
+        self.assertFalse(new.batcher._closed)
+
+    def test_each_caller_gets_its_own_row_back(self):
+        calls = []
+
+        def predict(X):
+            calls.append(len(X))
+            time.sleep(0.001)
+            return X[:, 0] * 10
+
+        batcher = MicroBatcher(predict, max_batch_size=8, max_wait_ms=20)
+        self.addCleanup(batcher.close)
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(lambda i: batcher.submit(np.array([[float(i)]])), range(64)))
+        self.assertEqual(results, [i * 10.0 for i in range(64)])
+        self.assertEqual(sum(calls), 64)
+        self.assertLess(len(calls), 64)
+        self.assertLessEqual(max(calls), 8)
+
+
+class PredictAllTests(SimpleTestCase):
+    """predict_view's fan-out reports a slow or failing model on its own."""
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.addCleanup(views._stalled.clear)
+        self.calls = []
+        self.slow, self.failing = registry.names()[:2]
+
+    def fake_predict(self, name, input_data):
+        self.calls.append(name)
+        if name == self.slow:
+            self.release.wait(10)
+        if name == self.failing:
+            raise RuntimeError('boom')
+        return {'result': name}
+
+    @override_settings(ML_MODEL_TIMEOUT=0.2)
+    def test_slow_and_failing_models_do_not_break_the_others(self):
+        with mock.patch.object(views, '_predict_one_model', self.fake_predict):
+            predictions = views.predict_all({})
+            self.assertEqual(list(predictions), registry.names())
+            self.assertEqual(predictions[self.slow]['error'], 'timed out after 0.2s')
+            self.assertEqual(predictions[self.failing]['error'], 'RuntimeError: boom')
+            others = registry.names()[2:]
+            self.assertEqual([predictions[name]['result'] for name in others], others)
+
+            # The hung call still holds its worker: the model is not submitted again
+            predictions = views.predict_all({})
+            self.assertIn('still running', predictions[self.slow]['error'])
+            self.assertEqual(self.calls.count(self.slow), 1)
+
+            self.release.set()
+            views._stalled[self.slow].result(timeout=5)
+            predictions = views.predict_all({})
+            self.assertEqual(predictions[self.slow]['result'], self.slow)
+            self.assertEqual(self.calls.count(self.slow), 2)
+
+
+class BatchApiTests(SimpleTestCase):
+    name = 'regression_state_revenue'
+
+    def setUp(self):
+        try:
+            self.entry = registry.get(self.name)
+        except FileNotFoundError:
+            self.skipTest(f'{self.name} artifacts not available')
+        self.url = reverse('batch_predict', args=[self.name])
+        self.rows = pd.DataFrame({col: [1.0, 2.0, 3.0] for col in self.entry['pipeline'].columns})
+        self.expected = self.entry['pipeline'].predict_many(self.rows).tolist()
+
+    def post(self, body, content_type):
+        return self.client.post(self.url, body, content_type=content_type)
+
+    def test_csv_and_json_rows_are_scored(self):
+        for body, content_type in (
+            (self.rows.to_csv(index=False), 'text/csv'),
+            (self.rows.to_json(orient='records'), 'application/json'),
+            ({'rows': self.rows.to_dict(orient='records')}, 'application/json'),
+        ):
+            response = self.post(body, content_type)
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(response.json()['count'], 3)
+            np.testing.assert_allclose(response.json()['predictions'], self.expected)
+
+    def test_extra_columns_are_ignored_and_missing_ones_rejected(self):
+        response = self.post(self.rows.assign(extra='x').to_csv(index=False), 'text/csv')
+        np.testing.assert_allclose(response.json()['predictions'], self.expected)
+
+        missing = self.entry['pipeline'].columns[0]
+        response = self.post(self.rows.drop(columns=missing).to_csv(index=False), 'text/csv')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(missing, response.json()['error'])
+
+    def test_bad_values_are_rejected(self):
+        rows = self.rows.astype(object)
+        rows.iloc[1, 0] = 'not a number'
+        for body, content_type in (
+            (rows.to_csv(index=False), 'text/csv'),
+            (rows.to_json(orient='records'), 'application/json'),
+            ('{"rows": 3}', 'application/json'),
+            ('[{"a": ', 'application/json'),
+        ):
+            self.assertEqual(self.post(body, content_type).status_code, 400, body)
+
+    def test_row_and_body_limits(self):
+        with mock.patch.object(api, 'BATCH_MAX_ROWS', 2), \
+                mock.patch.object(pd.DataFrame, 'from_records', wraps=pd.DataFrame.from_records) as from_records:
+            for body, content_type in (
+                (self.rows.to_csv(index=False), 'text/csv'),
+                (self.rows.to_json(orient='records'), 'application/json'),
+            ):
+                response = self.post(body, content_type)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('Too many rows', response.json()['error'])
+            # The JSON rows were counted before any frame was built from them
+            from_records.assert_not_called()
+            response = self.post(self.rows.iloc[:2].to_csv(index=False), 'text/csv')
+            self.assertEqual(response.json()['count'], 2)
+
+        with override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=10):
+            response = self.post(self.rows.to_csv(index=False), 'text/csv')
+        self.assertEqual(response.status_code, 413)
+
+
+class JsonApiTests(SimpleTestCase):
+    def predict(self, name, payload):
+        return self.client.post(reverse('api_predict', args=[name]), payload, content_type='application/json')
+
+    def test_single_prediction_and_input_validation(self):
+        name = 'regression_state_revenue'
+        try:
+            pipeline = registry.get(name)['pipeline']
+        except FileNotFoundError:
+            self.skipTest(f'{name} artifacts not available')
+        payload = dict.fromkeys(pipeline.columns, 2.0)
+        response = self.predict(name, payload)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['model'], name)
+        self.assertAlmostEqual(response.json()['prediction'], float(pipeline.predict_one(payload)))
+
+        first, second = pipeline.columns[:2]
+        response = self.predict(name, {**payload, first: 'two', second: None})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['fields'], {first: 'expected a number', second: 'expected a number'})
+        del payload[first]
+        self.assertEqual(self.predict(name, payload).json()['fields'], {first: 'required'})
+        self.assertEqual(self.predict(name, '[1, 2]').status_code, 400)
+
+    def test_unknown_model(self):
+        self.assertEqual(self.predict('no_such_model', {}).status_code, 404)
+        self.assertEqual(self.client.post(reverse('batch_predict', args=['no_such_model']), '[]',
+                                          content_type='application/json').status_code, 404)
+
+    def test_models_catalogue(self):
+        response = self.client.get(reverse('api_models'))
+        self.assertEqual(response.status_code, 200)
+        models = {model['name']: model for model in response.json()['models']}
+        self.assertEqual(list(models), list(registry.configs))
+        for name, config in registry.configs.items():
+            self.assertEqual(models[name]['categorical_inputs'], config.get('cat_features', []))
+        self.assertNotIn('models', response.json()['registry'])
+
+    def test_customer_code_errors(self):
+        name = 'spending_level'
+        try:
+            registry.get(name)
+        except FileNotFoundError:
+            self.skipTest(f'{name} artifacts not available')
+        for error, status in (
+            (prediction_table.UnknownCustomerError('Unknown customer(s): 17'), 404),
+            (warehouse_db.WarehouseError('not built'), 503),
+            (LookupError("Invalid customer code 'x'"), 400),
+        ):
+            with mock.patch.object(prediction_table, 'predict_customers', side_effect=error):
+                response = self.predict(name, {'code_customer': 17})
+            self.assertEqual(response.status_code, status)
+            self.assertIn(str(error.args[0]), response.json()['error'])
+
+        with mock.patch.object(prediction_table, 'predict_customers', return_value=(['High'], ['table'])):
+            response = self.predict(name, {'code_customer': 17})
+        self.assertEqual(response.json()['prediction'], 'High')
+        self.assertEqual(response.json()['source'], 'table')
+
+    def test_dumps_matches_orjson(self):
+        data = {'predictions': [1, 2.5, None, True], 'label': 'Entrée', 3: 'x'}
+        expected = '{"predictions":[1,2.5,null,true],"label":"Entrée","3":"x"}'.encode()
+        with mock.patch.object(api, 'orjson', None):
+            self.assertEqual(api.dumps(data), expected)
+        if api.orjson is None:
+            self.skipTest('orjson not installed')
+        self.assertEqual(api.dumps(data), expected)
+
+
+class ResultCacheTests(SimpleTestCase):
+    def test_key_is_the_version_and_the_encoded_row(self):
+        cache = PredictionCache(max_entries=2, ttl=60)
+        row = np.array([[1.0, -0.0, 3.0]])
+        cache.put(('v1', vector_digest(row)), 'High')
+        self.assertEqual(cache.get(('v1', vector_digest(np.array([[1, 0, 3]])))), (True, 'High'))
+        self.assertEqual(cache.get(('v2', vector_digest(row))), (False, None))
+        self.assertEqual(cache.get(('v1', vector_digest(np.array([[1.0, 0.0, 3.5]])))), (False, None))
+        # Least recently used entries go first
+        cache.put('b', 2)
+        cache.get(('v1', vector_digest(row)))
+        cache.put('c', 3)
+        self.assertEqual(cache.get('b'), (False, None))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_entries_expire_after_the_ttl(self):
+        cache = PredictionCache(ttl=10)
+        with mock.patch('time.monotonic', return_value=100.0):
+            cache.put('k', 1)
+        with mock.patch('time.monotonic', return_value=109.0):
+            self.assertEqual(cache.get('k'), (True, 1))
+        with mock.patch('time.monotonic', return_value=110.0):
+            self.assertEqual(cache.get('k'), (False, None))
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+
+class WarmupTests(SimpleTestCase):
+    def setUp(self):
+        saved = warmup.state()
+        self.addCleanup(warmup._state.update, saved)
+
+    def test_not_ready_until_warmup_finishes(self):
+        name = 'future_purchases'
+        warmup._state.update(status=warmup.WARMING, started=None, finished=None, models={})
+        with override_settings(ML_WARMUP=True):
+            response = self.client.get(reverse('health_ready'))
+            self.assertEqual(response.status_code, 503)
+
+            state = warmup.run_warmup([name])
+            if 'error' in state['models'][name]:
+                self.skipTest(state['models'][name]['error'])
+            response = self.client.get(reverse('health_ready'))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['models'][name]['version'], registry.get(name)['version'])
+
+    def test_warmup_starts_from_a_request_only_when_a_server_enables_it(self):
+        warmup._state.update(status=warmup.IDLE, started=None, finished=None, models={})
+        with mock.patch.object(warmup, 'start_warmup') as start:
+            # Tests, scripts and notebooks run without ML_WARMUP=1
+            warmup.on_request_started(None)
+            start.assert_not_called()
+            with override_settings(ML_WARMUP=True):
+                warmup.on_request_started(None)
+            start.assert_called_once_with()
+
+    def test_synthetic_row_is_valid_input(self):
+        try:
+            pipeline = registry.get('spending_level')['pipeline']
+        except FileNotFoundError:
+            self.skipTest('spending_level artifacts not available')
+        pipeline.predict_one(pipeline.synthetic_row())
+
+
+class ServerTimingTests(SimpleTestCase):
+    def test_stages_reported_only_when_enabled(self):
+        url = reverse('regression_failed_orders')
+        with override_settings(ML_SERVER_TIMING=True):
+            response = self.client_class().post(url, {'year': 2024})
+        if response.status_code != 200:
+            self.skipTest('regression_failed_orders artifacts not available')
+        stages = [item.split(';')[0] for item in response['Server-Timing'].split(', ')]
+        for name in ('parse', 'encode', 'predict', 'render', 'total'):
+            self.assertIn(name, stages)
+
+        with override_settings(ML_SERVER_TIMING=False):
+            response = self.client_class().post(url, {'year': 2024})
+        self.assertNotIn('Server-Timing', response)
+
+    def test_only_ml_views_are_timed(self):
+        with override_settings(ML_SERVER_TIMING=True):
+            client = self.client_class()
+            api_response = client.get(reverse('api_models'))
+            admin_response = client.get('/admin/login/')
+            missing_response = client.get('/static/missing.css')
+        self.assertIn('total;dur=', api_response['Server-Timing'])
+        self.assertNotIn('Server-Timing', admin_response)
+        self.assertNotIn('Server-Timing', missing_response)
+
+
+class MetricsTests(SimpleTestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        latency = metrics.Histogram('test_seconds', 'Test latency', ['model'], buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            latency.labels('m').observe(value)
+        lines = latency.exposition()
+        self.assertIn('test_seconds_bucket{model="m",le="0.1"} 2', lines)
+        self.assertIn('test_seconds_bucket{model="m",le="1.0"} 3', lines)
+        self.assertIn('test_seconds_bucket{model="m",le="+Inf"} 4', lines)
+        self.assertIn('test_seconds_count{model="m"} 4', lines)
+
+    def test_metrics_endpoint_counts_requests(self):
+        with override_settings(ML_METRICS=True):
+            client = self.client_class()
+            client.get(reverse('api_models'))
+            response = client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        text = response.content.decode()
+        self.assertRegex(text, r'ml_requests_total\{view="api_models",status="200"\} [1-9]')
+        self.assertIn('# TYPE ml_request_duration_seconds histogram', text)
+
+
+class BenchmarkTests(SimpleTestCase):
+    def test_compare_flags_only_real_slowdowns(self):
+        def run(**p50):
+            return {'results': {name: {'p50_ms': value} for name, value in p50.items()}}
+
+        baseline = run(view=2.0, stage=0.01, api=1.0, gone=1.0)
+        current = run(view=3.0, stage=0.02, api=1.1, new=5.0)
+        rows = {row[0]: row for row in benchmark.compare(baseline, current, threshold=0.25)}
+        self.assertEqual(sorted(rows), ['api', 'stage', 'view'])
+        self.assertTrue(rows['view'][4])
+        # Doubled, but by less than min_delta_ms: timer noise
+        self.assertFalse(rows['stage'][4])
+        self.assertFalse(rows['api'][4])
+
+
+def sample_tables():
+    """A few customers of the warehouse exports, with their sales and dimensions."""
+    customers = pd.DataFrame({
+        'code_customer': [3, 1, 2], 'Age': [30, 40, 50], 'Gender': ['Male', 'Female', 'Male'],
+        'Overall_review': 3.0, 'Previous Purchases': 5, 'Preferred_size': 'M', 'Payment Method': 'Cash',
+        'Frequency of Purchases': 'Weekly', 'Subscription Status': 'Yes',
+        'Zip_code': ['Austin_Texas', 'Boston_Massachusetts', 'Dallas_Texas'],
+    })
+    sales = pd.DataFrame({
+        'code_sale': ['S1', 'S2', 'S3', 'S4'], 'code_customer': [1, 3, 1, 1],
+        'code_order': ['O1', 'O2', 'O3', 'O1'], 'SKU': [10, 11, 10, 12], 'quantity': [1, 2, 3, 4],
+        'Estimated_Unit_Price': [10.0, 20.0, 30.0, 40.0], 'is_discounted': [1, 0, 0, 1],
+        'sale_date': pd.to_datetime(['2024-01-01', '2024-01-05', '2024-01-31', '2024-01-01']),
+    })
+    orders = pd.DataFrame({'order_code': ['O1', 'O2', 'O3'], 'status_label': ['Delivered', 'Returned', 'Cancelled']})
+    products = pd.DataFrame({'SKU': [10, 11, 12], 'Style_code': [1, 1, 2], 'code_color': ['a', 'b', 'a'],
+                             'section_no': [5, 5, 6]})
+    sections = pd.DataFrame({'section_no': [5, 6], 'section_name': ['Womens Trend', 'Mens']})
+    locations = pd.DataFrame({'state': ['Texas', 'Massachusetts', 'Texas'], 'city': ['Austin', 'Boston', 'Dallas'],
+                              ' zip_code': ['Austin_Texas', 'Boston_Massachusetts', 'Dallas_Texas']})
+    return {'Customers_f': customers, 'Sales': sales, 'Orders': orders, 'Products_f': products, 'Sections': sections,
+            'Locations': locations}
+
+
+class TableCacheTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.cache = os.path.join(tmp, 'cache')
+        settings = override_settings(DATA_DIR=tmp, DATA_CACHE_DIR=self.cache)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.path = os.path.join(tmp, 'Orders.xlsx')
+        pd.DataFrame({'code': [1, 2], 'amount': [10.0, 20.0]}).to_excel(self.path, index=False)
+
+    def load(self):
+        with mock.patch.object(data_loader, 'read_source', wraps=data_loader.read_source) as read_source:
+            frame = data_loader.load_table('Orders')
+        return frame, read_source.called
+
+    def test_cache_is_reused_until_the_workbook_changes(self):
+        frame, rebuilt = self.load()
+        self.assertTrue(rebuilt)
+        self.assertEqual(frame['amount'].tolist(), [10.0, 20.0])
+        frame, rebuilt = self.load()
+        self.assertFalse(rebuilt)
+        self.assertEqual(frame['amount'].tolist(), [10.0, 20.0])
+        self.assertEqual(sorted(os.listdir(self.cache)), sorted(
+            f'Orders.{ext}' for ext in ('json', 'parquet' if data_loader.CACHE_FORMAT == 'parquet' else 'pkl')
+        ))
+
+    def test_touched_workbook_is_rehashed_not_reread(self):
+        self.load()
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        frame, rebuilt = self.load()
+        self.assertFalse(rebuilt)
+        manifest = data_loader._read_manifest(os.path.join(self.cache, 'Orders.json'))
+        self.assertEqual(manifest['mtime'], os.stat(self.path).st_mtime)
+        self.assertFalse(self.load()[1])
+
+    def test_changed_workbook_is_reread(self):
+        self.load()
+        stat = os.stat(self.path)
+        pd.DataFrame({'code': [1, 2], 'amount': [10.0, 99.0]}).to_excel(self.path, index=False)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        frame, rebuilt = self.load()
+        self.assertTrue(rebuilt)
+        self.assertEqual(frame['amount'].tolist(), [10.0, 99.0])
+        self.assertFalse(self.load()[1])
+
+
+class FeatureContextTests(SimpleTestCase):
+    def test_windowed_features_match_a_groupby_over_the_window(self):
+        tables = sample_tables()
+        context = FeatureContext(tables, as_of='2024-01-31')
+        features = context.compute(['past_purchases', 'past_spent', 'recent_unique_products', 'n_unique_style',
+                                    'std_price', 'recency_days'])
+        sales = tables['Sales']
+        past = sales[sales['sale_date'] < '2024-01-31'].groupby('code_customer').agg(
+            n=('code_sale', 'count'), spent=('Estimated_Unit_Price', 'sum'), last=('sale_date', 'max'))
+        self.assertEqual(features['past_purchases'].tolist(), [2, 0, 1])
+        self.assertEqual(features.loc[[1, 3], 'past_spent'].tolist(), past['spent'].tolist())
+        self.assertEqual(features.loc[[1, 3], 'recency_days'].tolist(),
+                         (pd.Timestamp('2024-01-31') - past['last']).dt.days.tolist())
+        self.assertEqual(features['recent_unique_products'].tolist(), [2, 0, 1])
+        # Womenswear: SKU 10 twice for customer 1, SKU 11 for customer 3; one sale has no spread
+        self.assertEqual(features['n_unique_style'].tolist(), [1, 0, 1])
+        self.assertEqual(features['std_price'].tolist(), [pd.Series([10.0, 30.0]).std(), 0, 0])
+
+    def test_feature_context_joins_only_what_is_needed_once(self):
+        context = FeatureContext(sample_tables())
+        context.compute(['total_purchases'])
+        self.assertEqual(list(context._facts), [frozenset()])
+        context.prepare(['total_cancelled', 'n_unique_color'])
+        joined = context._facts[frozenset({'orders', 'products'})]
+        self.assertIs(context.facts({'orders'}), joined)
+        # Contexts over a slice of the customers reuse the joins
+        chunk = context.restrict(1, 1)
+        self.assertEqual(chunk.compute(['total_cancelled'])['total_cancelled'].tolist(), [1])
+        self.assertEqual(len(chunk._facts), 2)
+
+
+class FeatureStoreTests(SimpleTestCase):
+    def test_store_matches_the_historical_aggregates(self):
+        sales = sample_tables()['Sales']
+        historical = sales[sales['sale_date'] <= sales['sale_date'].quantile(HISTORY_QUANTILE)]
+        expected = historical.groupby('code_customer').agg(
+            hist_total_amount=('Estimated_Unit_Price', 'sum'),
+            hist_n_purchases=('code_order', 'nunique'),
+            hist_avg_basket=('Estimated_Unit_Price', 'mean'),
+            avg_quantity=('quantity', 'mean'),
+        )
+        expected['avg_original_price'] = expected['hist_avg_basket']
+        features = feature_store.compute_customer_features(sales)
+        pd.testing.assert_frame_equal(features, expected[feature_store.CUSTOMER_FEATURES], check_dtype=False)
+
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, 'features.npz')
+        self.assertEqual(feature_store.build_feature_store(sales, path), len(expected))
+        store = feature_store.CustomerFeatureStore(path)
+        self.assertEqual(store.lookup(1), {**expected.loc[1, feature_store.CUSTOMER_FEATURES].to_dict(),
+                                           'hist_n_purchases': int(expected.loc[1, 'hist_n_purchases'])})
+        self.assertIsNone(store.lookup(2))
+
+    def test_lookups_during_a_reload_see_one_store(self):
+        sales = sample_tables()['Sales']
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, 'features.npz')
+        feature_store.build_feature_store(sales, path)
+        store = feature_store.CustomerFeatureStore(path)
+        before = store.lookup(1)
+        feature_store.build_feature_store(sales.assign(Estimated_Unit_Price=sales['Estimated_Unit_Price'] * 2), path)
+        store.reload()
+        after = store.lookup(1)
+        self.assertNotEqual(before, after)
+
+        stop = threading.Event()
+
+        def reload():
+            while not stop.is_set():
+                store.reload()
+
+        reloader = threading.Thread(target=reload)
+        reloader.start()
+        try:
+            for _ in range(200):
+                self.assertEqual(store.lookup(1), after)
+        finally:
+            stop.set()
+            reloader.join()
+
+
+class CustomerScoringTests(SimpleTestCase):
+    def test_chunk_features_follow_the_notebook_aggregates(self):
+        context = customer_scoring.Warehouse(sample_tables()).chunk(1, 2)
+        self.assertEqual(context.codes.tolist(), [1, 2])
+        features = context.model_frame('classification_high_risk_cancelling')
+        self.assertEqual(features['total_orders'].tolist(), [3, 0])
+        self.assertEqual(features['total_cancelled'].tolist(), [1, 0])
+        self.assertEqual(features['unique_products'].tolist(), [2, 0])
+        self.assertEqual(features['gender_male'].tolist(), [0, 1])
+        behavior = context.model_frame('classification_customer_behavior')
+        self.assertEqual(behavior['customer_lifetime_days'].tolist(), [30, 0])
+        self.assertAlmostEqual(behavior['return_cancel_rate'].iloc[0], 1 / 3)
+
+    def test_source_digest_changes_only_for_affected_customers(self):
+        tables = sample_tables()
+        before = customer_scoring.Warehouse(tables).source_digests()
+        self.assertEqual(before.index.tolist(), [1, 2, 3])
+        # Customer 3's only order gets cancelled
+        tables['Orders'].loc[tables['Orders']['order_code'] == 'O2', 'status_label'] = 'Cancelled'
+        after = customer_scoring.Warehouse(tables).source_digests()
+        self.assertEqual((before != after).tolist(), [False, False, True])
+
+    def test_interrupted_run_resumes_from_its_progress(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, 'scores.sqlite3')
+        scores = pd.DataFrame({'code_customer': [1, 2], 'm': [0.5, 1.5]})
+        sink = customer_scoring.SqliteSink(path)
+        sink.start('run-a', {'as_of': '2024-02-01', 'models': ['m'], 'versions': {'m': 'v1'}, 'chunks': 2})
+        sink.write('run-a', 0, 1, 2, scores, 0.1)
+        sink.close()
+
+        sink = customer_scoring.SqliteSink(path)
+        self.assertEqual(sink.run('run-a'), {'finished': None})
+        self.assertEqual(sink.done_chunks('run-a'), {0})
+        # Another key (new model version, data or settings) cannot resume
+        self.assertIsNone(sink.run('run-b'))
+        sink.close()
+
+
+class WarehouseDatabaseTests(SimpleTestCase):
+    def test_warehouse_db_lookups_are_indexed_and_match_the_workbooks(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        tables = sample_tables()
+        path = os.path.join(tmp, 'warehouse.sqlite3')
+        warehouse_db.build(path, tables)
+        database = warehouse_db.WarehouseDatabase(path)
+        self.addCleanup(database.close)
+        sales = database.customer_sales([1], end='2024-01-31')
+        self.assertEqual(sales['code_sale'].tolist(), ['S1', 'S4'])
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(sales['sale_date']))
+        self.assertEqual(database.customers(state='Texas')['code_customer'].tolist(), [2, 3])
+        indexes = database.query("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'Sales'")
+        self.assertTrue({'idx_sales_code_customer_sale_date', 'idx_sales_code_order', 'idx_sales_sku',
+                         'idx_sales_sale_date'} <= set(indexes['name']))
+        # Features of a state's customers, from their rows only, match the full tables'
+        context = database.feature_context(state='Texas')
+        expected = FeatureContext(tables).select([2, 3])
+        for model in ('classification_high_risk_cancelling', 'future_purchases', 'women_preference'):
+            pd.testing.assert_frame_equal(context.model_frame(model), expected.model_frame(model), check_dtype=False)
+
+
+class AggregationTests(SimpleTestCase):
+    def test_chunked_aggregation_matches_pandas_groupby(self):
+        tables = sample_tables()
+        sales = tables['Sales']
+        aggs = {'n': ('code_sale', 'count'), 'spent': ('Estimated_Unit_Price', 'sum'),
+                'mean': ('Estimated_Unit_Price', 'mean'), 'std': ('Estimated_Unit_Price', 'std'),
+                'last': ('sale_date', 'max'), 'skus': ('SKU', 'nunique')}
+        state = aggregation.state_of_customer(tables['Customers_f'], tables['Locations'])
+        month = aggregation.Period('sale_date', 'M')
+        for by, keys in [('code_customer', 'code_customer'), (state, state(sales)),
+                         ([state, month], [state(sales), sales['sale_date'].dt.to_period('M')])]:
+            # One row per chunk: every group is merged across chunks
+            result = aggregation.Aggregation(by, aggs).run(aggregation.FrameChunks(sales, rows=1))
+            pd.testing.assert_frame_equal(result, sales.groupby(keys).agg(**aggs), check_dtype=False)
+        names = ['total_purchases', 'past_spent', 'n_unique_style', 'std_price', 'hist_n_purchases']
+        context = FeatureContext(tables)
+        streamed = aggregation.customer_features(aggregation.FrameChunks(sales, rows=2), names, tables,
+                                                 context.as_of, context.history_end)
+        pd.testing.assert_frame_equal(streamed, context.compute(names).loc[[1, 3]], check_dtype=False)
+
+    def test_aggregating_an_empty_source_gives_an_empty_frame(self):
+        empty = sample_tables()['Sales'].iloc[:0]
+        aggs = {'n': ('code_sale', 'count'), 'std': ('Estimated_Unit_Price', 'std')}
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                result = aggregation.Aggregation('code_customer', aggs).run(aggregation.FrameChunks(empty), workers)
+                self.assertTrue(result.empty)
+                self.assertEqual(list(result.columns), ['n', 'std'])
+
+
+class PredictionTableTests(SimpleTestCase):
+    def table(self, rows):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        table = PredictionTable(os.path.join(tmp, 'predictions.sqlite3'))
+        conn = table._writer()
+        with conn:
+            conn.executemany('INSERT INTO customer_predictions VALUES (?, ?, ?, ?, ?, NULL, NULL, ?)', rows)
+        conn.close()
+        return table
+
+    def test_prediction_table_lookup_is_keyed_by_version(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.assertEqual(PredictionTable(os.path.join(tmp, 'predictions.sqlite3')).lookup('m', 'v1', 's1', [1]), {})
+        table = self.table([('m', 'v1', 1, 'High', 11, 's1'), ('m', 'v1', 2, 0.5, 12, 's1'),
+                            ('m', 'v2', 1, 'Low', 11, 's1')])
+        self.assertEqual(table.lookup('m', 'v1', 's1', [1, 2, 3]), {1: 'High', 2: 0.5})
+        self.assertEqual(table.lookup('m', 'v2', 's1', [1, 2]), {1: 'Low'})
+
+    def test_rows_from_other_exports_are_not_served(self):
+        table = self.table([('m', 'v1', 1, 'High', 11, 'old'), ('m', 'v1', 2, 'Low', 12, 'new'),
+                            ('m', 'v1', 3, 'Low', 13, None)])
+        self.assertEqual(table.lookup('m', 'v1', 'new', [1, 2, 3]), {2: 'Low'})
+
+    def test_tables_without_sources_are_stamped_on_open(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        table = PredictionTable(os.path.join(tmp, 'predictions.sqlite3'))
+        conn = sqlite3.connect(table.path)
+        with conn:
+            conn.executescript(prediction_table.SCHEMA.replace('source TEXT,', ''))
+            conn.execute("INSERT INTO customer_predictions VALUES ('m', 'v1', 1, 'High', 11, NULL, NULL)")
+        conn.close()
+        self.assertEqual(table.lookup('m', 'v1', 's1', [1]), {})
+        table._writer().close()
+        self.assertEqual(table.lookup('m', 'v1', 's1', [1]), {})
+
+    def test_live_scoring_refuses_a_warehouse_older_than_the_exports(self):
+        table = self.table([('spending_level', 'v1', 1, 'High', 11, 'old')])
+        entry = {'name': 'spending_level', 'version': 'v1', 'pipeline': None}
+        with mock.patch.object(prediction_table, 'prediction_table', table), \
+                mock.patch.object(customer_scoring, 'data_version', return_value='new'), \
+                mock.patch.object(prediction_table.warehouse_db, 'is_stale', return_value=True), \
+                mock.patch.object(prediction_table.warehouse_db, 'feature_context') as feature_context:
+            with self.assertRaises(warehouse_db.WarehouseError):
+                prediction_table.predict_customers(entry, [1])
+            feature_context.assert_not_called()
+        with mock.patch.object(prediction_table, 'prediction_table', table), \
+                mock.patch.object(customer_scoring, 'data_version', return_value='old'):
+            self.assertEqual(prediction_table.predict_customers(entry, [1]), (['High'], ['table']))
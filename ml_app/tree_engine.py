@@ -0,0 +1,343 @@
+"""Flattened, array-based evaluator for tree-ensemble models.
+
+At load time a fitted sklearn tree / random forest or an XGBoost model is
+compiled into flat NumPy arrays (``feature``, ``threshold``, ``left``,
+``right``, ``value``) holding every node of every tree. Prediction walks all
+trees of all rows at once, one depth level per step, so serving needs nothing
+but NumPy: no sklearn input validation, no joblib dispatch, no booster calls.
+
+Comparisons follow each library's own rules so results match ``predict``:
+sklearn casts inputs to float32 and goes left on ``x <= threshold``; XGBoost
+stores float32 split values and goes left on ``x < threshold``. In both, NaN
+follows the node's learned direction (sklearn's ``missing_go_to_left``,
+XGBoost's default child), kept in the ``missing`` array.
+
+``FlatTreeEnsemble.save`` writes the arrays in compact form (int32 node
+indices, float32 thresholds) as one ``.npy`` file each; ``load`` memory-maps
+them read-only, so every worker process shares the same physical pages.
+"""
+import json
+import math
+import os
+import shutil
+
+import numpy as np
+
+# 2: sklearn nodes send NaN where missing_go_to_left says (format 1 always went right)
+STORE_FORMAT = 2
+
+ARRAYS = ('feature', 'threshold', 'left', 'right', 'missing', 'value', 'roots')
+
+
+class FlatTreeEnsemble:
+    def __init__(self, kind, feature, threshold, left, right, missing, value, roots, depth,
+                 classes=None, base_margin=0.0, feature_names=None):
+        self.kind = kind
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing = missing
+        self.value = value
+        self.roots = roots
+        self.depth = depth
+        self.classes = classes
+        self.base_margin = base_margin
+        # Same attribute as the fitted estimator, used to order input columns
+        self.feature_names_in_ = feature_names
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in ARRAYS)
+
+    def compact(self):
+        """Copy with int32 node indices and float32 thresholds.
+
+        sklearn thresholds are rounded *down* to float32, so ``x <= t`` keeps
+        its meaning for float32 inputs. Leaf values become float32 only where
+        that is lossless (always for XGBoost): sklearn averages float64 leaves
+        and rounding them would move regression outputs.
+        """
+        value = self.value
+        if value.dtype != np.float32 and np.array_equal(value.astype(np.float32), value):
+            value = value.astype(np.float32)
+        threshold = self.threshold
+        if threshold.dtype != np.float32:
+            threshold = _float32_floor(threshold)
+        return FlatTreeEnsemble(
+            self.kind,
+            self.feature.astype(np.int32), threshold,
+            self.left.astype(np.int32), self.right.astype(np.int32), self.missing.astype(np.int32),
+            value, self.roots.astype(np.int32), self.depth,
+            classes=self.classes, base_margin=self.base_margin, feature_names=self.feature_names_in_,
+        )
+
+    def save(self, directory, **meta):
+        """Write the compact arrays plus ``meta.json`` to ``directory``.
+
+        Files are written to a sibling temp directory and swapped in, so a
+        reader never sees half a store; processes that already mapped the old
+        files keep them until they reload. A failed write removes the temp
+        directory and leaves the previous store in place.
+        """
+        flat = self.compact()
+        tmp = f'{directory}.tmp-{os.getpid()}'
+        shutil.rmtree(tmp, ignore_errors=True)
+        try:
+            os.makedirs(tmp)
+            for name in ARRAYS:
+                np.save(os.path.join(tmp, f'{name}.npy'), getattr(flat, name))
+            classes = None if flat.classes is None else np.asarray(flat.classes)
+            names = flat.feature_names_in_
+            meta = dict(
+                meta,
+                format=STORE_FORMAT,
+                kind=flat.kind,
+                depth=int(flat.depth),
+                base_margin=float(flat.base_margin),
+                classes=None if classes is None else classes.tolist(),
+                classes_dtype=None if classes is None else classes.dtype.str,
+                feature_names=None if names is None else [str(n) for n in names],
+            )
+            with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+                json.dump(meta, f, indent=2)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+        old = f'{directory}.old-{os.getpid()}'
+        if os.path.exists(directory):
+            os.replace(directory, old)
+        try:
+            os.replace(tmp, directory)
+        except BaseException:
+            # Put the previous store back rather than leave none
+            if os.path.exists(old):
+                os.replace(old, directory)
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        shutil.rmtree(old, ignore_errors=True)
+        return flat
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Open a store written by ``save``; arrays are memory-mapped by default."""
+        meta = read_meta(directory)
+        if meta.get('format') != STORE_FORMAT:
+            raise ValueError(f"Unsupported tree store format in {directory}: {meta.get('format')!r}")
+
+        def array(name):
+            # Plain ndarray views over the mapping: no np.memmap subclass overhead
+            return np.asarray(np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode))
+
+        classes = meta.get('classes')
+        if classes is not None:
+            classes = np.asarray(classes, dtype=np.dtype(meta['classes_dtype']))
+        names = meta.get('feature_names')
+        return cls(
+            meta['kind'], *(array(name) for name in ARRAYS), meta['depth'],
+            classes=classes, base_margin=meta['base_margin'],
+            feature_names=None if names is None else np.asarray(names, dtype=object),
+        )
+
+    def leaves(self, X):
+        """Leaf index reached in every tree: array of shape (n_rows, n_trees)."""
+        n_rows = X.shape[0]
+        nodes = np.broadcast_to(self.roots, (n_rows, self.n_trees)).copy()
+        rows = np.arange(n_rows)[:, None]
+        # Only inputs with NaN pay for routing missing values
+        has_nan = bool(np.isnan(X).any())
+        for _ in range(self.depth):
+            x = X[rows, self.feature[nodes]]
+            if self.kind.startswith('xgb'):
+                go_left = x < self.threshold[nodes]
+            else:
+                go_left = x <= self.threshold[nodes]
+            nxt = np.where(go_left, self.left[nodes], self.right[nodes])
+            if has_nan:
+                nxt = np.where(np.isnan(x), self.missing[nodes], nxt)
+            nodes = nxt
+        return nodes
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[None, :]
+        # Both libraries compare on float32 inputs
+        X = X.astype(np.float32)
+        leaf_values = self.value[self.leaves(X)]
+        if self.kind == 'sklearn_regressor':
+            return _sequential_sum(leaf_values, 0.0, np.float64) / self.n_trees
+        if self.kind == 'sklearn_classifier':
+            proba = leaf_values.mean(axis=1)
+            return self.classes[np.argmax(proba, axis=1)]
+        margin = _sequential_sum(leaf_values, self.base_margin, np.float32)
+        if self.kind == 'xgb_regressor':
+            return margin
+        # xgb_binary: sigmoid(margin) > 0.5  <=>  margin > 0
+        return self.classes[(margin > 0).astype(np.intp)]
+
+
+def read_meta(directory):
+    with open(os.path.join(directory, 'meta.json')) as f:
+        return json.load(f)
+
+
+def _float32_floor(values):
+    """Largest float32 not above each float64 value."""
+    rounded = values.astype(np.float32)
+    over = rounded.astype(np.float64) > values
+    rounded[over] = np.nextafter(rounded[over], np.float32(-np.inf))
+    return rounded
+
+
+def _sequential_sum(leaf_values, start, dtype):
+    """Add the trees up one after another, as the libraries do.
+
+    ``sum`` uses pairwise summation, which can differ from ``predict`` in the
+    last bit; a running ``cumsum`` keeps the same order of additions.
+    """
+    start = np.full((leaf_values.shape[0], 1), start, dtype=dtype)
+    return np.cumsum(np.hstack([start, leaf_values.astype(dtype)]), axis=1, dtype=dtype)[:, -1]
+
+
+def _concat_trees(trees):
+    """Stack per-tree node arrays into one array set with global indices."""
+    offsets = np.cumsum([0] + [len(t['feature']) for t in trees])
+    feature = np.concatenate([t['feature'] for t in trees]).astype(np.intp)
+    threshold = np.concatenate([t['threshold'] for t in trees])
+    left = np.concatenate([t['left'] + off for t, off in zip(trees, offsets)]).astype(np.intp)
+    right = np.concatenate([t['right'] + off for t, off in zip(trees, offsets)]).astype(np.intp)
+    missing = np.concatenate([t['missing'] + off for t, off in zip(trees, offsets)]).astype(np.intp)
+    value = np.concatenate([t['value'] for t in trees])
+    roots = offsets[:-1].astype(np.intp)
+    depth = max(t['depth'] for t in trees)
+    return feature, threshold, left, right, missing, value, roots, depth
+
+
+def _sklearn_tree(tree, classifier):
+    n = tree.node_count
+    is_leaf = tree.children_left == -1
+    idx = np.arange(n)
+    # Leaves point at themselves so extra traversal steps are no-ops
+    left = np.where(is_leaf, idx, tree.children_left)
+    right = np.where(is_leaf, idx, tree.children_right)
+    # Trees from before sklearn 1.3 have no missing-value routing: NaN went right
+    missing_left = getattr(tree, 'missing_go_to_left', None)
+    missing = right if missing_left is None else np.where(missing_left.astype(bool), left, right)
+    if classifier:
+        counts = tree.value[:, 0, :]
+        value = counts / counts.sum(axis=1, keepdims=True)
+    else:
+        value = tree.value[:, 0, 0]
+    return {
+        'feature': np.where(is_leaf, 0, tree.feature),
+        'threshold': np.where(is_leaf, np.inf, tree.threshold),
+        'left': left,
+        'right': right,
+        'missing': missing,
+        'value': value,
+        'depth': tree.max_depth,
+    }
+
+
+def from_sklearn(model):
+    estimators = getattr(model, 'estimators_', None)
+    if estimators is None:
+        estimators = [model]
+    estimators = list(np.ravel(estimators))
+    classifier = hasattr(model, 'classes_')
+    if classifier and np.ndim(model.classes_) != 1:
+        return None  # multi-output
+    if any(getattr(est.tree_, 'n_outputs', 1) != 1 for est in estimators):
+        return None
+    trees = [_sklearn_tree(est.tree_, classifier) for est in estimators]
+    arrays = _concat_trees(trees)
+    kind = 'sklearn_classifier' if classifier else 'sklearn_regressor'
+    return FlatTreeEnsemble(kind, *arrays, classes=getattr(model, 'classes_', None),
+                            feature_names=getattr(model, 'feature_names_in_', None))
+
+
+def _xgb_tree(dump, feature_index):
+    nodes = {}
+
+    def walk(node, depth):
+        nodes[node['nodeid']] = node
+        node['_depth'] = depth
+        for child in node.get('children', []):
+            walk(child, depth + 1)
+
+    walk(json.loads(dump), 0)
+    n = max(nodes) + 1
+    feature = np.zeros(n, dtype=np.intp)
+    threshold = np.full(n, np.inf, dtype=np.float32)
+    left = np.arange(n)
+    right = np.arange(n)
+    missing = np.arange(n)
+    value = np.zeros(n, dtype=np.float32)
+    depth = 0
+    for nid, node in nodes.items():
+        if 'leaf' in node:
+            value[nid] = node['leaf']
+            depth = max(depth, node['_depth'])
+        else:
+            feature[nid] = feature_index(node['split'])
+            threshold[nid] = node['split_condition']
+            left[nid] = node['yes']
+            right[nid] = node['no']
+            missing[nid] = node['missing']
+    return {
+        'feature': feature, 'threshold': threshold, 'left': left, 'right': right,
+        'missing': missing, 'value': value, 'depth': depth,
+    }
+
+
+def _xgb_base_score(booster):
+    params = json.loads(booster.save_config())['learner']['learner_model_param']
+    return float(params['base_score'].strip('[]'))
+
+
+def from_xgboost(model):
+    booster = model.get_booster()
+    config = json.loads(booster.save_config())
+    objective = config['learner']['objective']['name']
+    if objective not in ('reg:squarederror', 'binary:logistic'):
+        return None
+    if getattr(model, 'best_iteration', None) is not None:
+        return None  # predict() would stop early; keep the native path
+
+    names = booster.feature_names
+    if names:
+        positions = {name: i for i, name in enumerate(names)}
+        feature_index = positions.__getitem__
+    else:
+        def feature_index(split):
+            return int(split[1:])
+
+    trees = [_xgb_tree(dump, feature_index) for dump in booster.get_dump(dump_format='json')]
+    arrays = _concat_trees(trees)
+    base_score = _xgb_base_score(booster)
+    feature_names = np.asarray(names, dtype=object) if names else None
+    if objective == 'binary:logistic':
+        base_margin = math.log(base_score / (1.0 - base_score))
+        return FlatTreeEnsemble('xgb_binary', *arrays, classes=np.asarray(model.classes_),
+                                base_margin=base_margin, feature_names=feature_names)
+    return FlatTreeEnsemble('xgb_regressor', *arrays, base_margin=base_score, feature_names=feature_names)
+
+
+def compile_estimator(model):
+    """Flatten ``model`` if it is a supported tree ensemble, else return None."""
+    if isinstance(model, FlatTreeEnsemble):
+        return model
+    module = type(model).__module__
+    if module.startswith('xgboost'):
+        return from_xgboost(model)
+    if module.startswith('sklearn.tree') or module.startswith('sklearn.ensemble._forest'):
+        if not hasattr(model, 'predict') or type(model).__name__ == 'RandomTreesEmbedding':
+            return None
+        return from_sklearn(model)
+    return None
@@ -1,6 +1,6 @@
 from django.urls import path
 from django.shortcuts import redirect
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('women_preference/', views.women_preference_view, name='women_preference'),
@@ -15,6 +15,10 @@ urlpatterns = [
     path('future_purchases/', views.future_purchases_view, name='future_purchases'),
     path('customer_clustering/', views.customer_clustering_view, name='customer_clustering'),
     path('regional_clustering/', views.regional_clustering_view, name='regional_clustering'),
+    path('api/models', api.models_api_view, name='api_models'),
+    path('api/<str:model_name>/predict', api.predict_api_view, name='api_predict'),
+    path('api/<str:model_name>/batch', api.batch_predict_view, name='batch_predict'),
+    path('health/ready', api.readiness_view, name='health_ready'),
     path('power_bi_dashboard/', views.power_bi_dashboard_view, name='power_bi_dashboard'),
     # Redirection temporaire pour l'ancienne URL
     path('regression_ghada/', lambda request: redirect('future_purchases', permanent=True)),
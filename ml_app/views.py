@@ -1,192 +1,182 @@
-from django.shortcuts import render
+from concurrent.futures import ThreadPoolExecutor, wait
+import contextvars
+import datetime
 from django.conf import settings
-import joblib
-import os
-import pandas as pd
+from django import shortcuts
+import functools
+import logging
 import math
+import threading
+
+from .feature_store import DEFAULT_CUSTOMER_FEATURES, get_customer_features
+from .registry import registry, get_model
+from .timing import stage, timed
+
+logger = logging.getLogger(__name__)
+
+render = timed('render')(shortcuts.render)
+
+# Segment names of classification_customer_behavior and customer_clustering
+SEGMENT_NAMES = {
+    0: 'Occasional Buyers',
+    1: 'Regular Loyalists',
+    2: 'Bargain Hunters',
+    3: 'VIP Shoppers',
+    4: 'Problem Customers'
+}
+
+
+def _model_result(name, config, pred, **extra):
+    return {name: {'result': pred, 'description': config['description'], 'type': config['type'], **extra}}
+
+
+def customer_lookup(model_name, template, present=_model_result):
+    """Answer form posts that only give a ``code_customer`` from the prediction table.
+
+    Other requests go to the wrapped view. ``present(model_name, config,
+    prediction)`` shapes the prediction into the template's ``predictions``.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request):
+            code = request.POST.get('code_customer', '').strip() if request.method == 'POST' else ''
+            if not code:
+                return view(request)
+            # Imported here: the prediction table pulls in pandas and the warehouse code
+            from .prediction_table import predict_customer
+            from .warehouse_db import WarehouseError
+
+            model_data = get_model(model_name)
+            lookup = {'code_customer': code}
+            predictions = {}
+            try:
+                pred, lookup['source'] = predict_customer(model_data, code)
+            except (LookupError, WarehouseError) as e:
+                lookup['error'] = str(e)
+            else:
+                predictions = present(model_name, model_data['config'], pred)
+            return render(request, template, {'predictions': predictions, 'lookup': lookup})
+        return wrapper
+    return decorator
+
+
+def _risk_result(name, config, pred):
+    return _model_result(name, config, 'High Risk' if pred == 1 else 'Low Risk')
+
+
+def _segment_result(name, config, pred):
+    return _model_result(name, config, SEGMENT_NAMES.get(pred, f'Class {pred}'), class_number=pred)
+
+
+def _cluster_result(name, config, pred):
+    cluster_num = int(pred)
+    return {
+        'cluster_number': cluster_num,
+        'cluster_name': SEGMENT_NAMES.get(cluster_num, f'Cluster {cluster_num}'),
+        'features': {},
+    }
 
-# Load models (lazy loading)
-_models = {}
 
 def load_models():
-    if not _models:
-        models_dir = os.path.join(settings.BASE_DIR, 'models')
-        
-        # List of models to load (add them gradually)
-        model_configs = {
-            'women_preference': {
-                'model_file': 'women_preference_model.pkl',
-                'encoders_file': 'women_preference_model_encoders.pkl',
-                'features': [
-                    "Age", "Gender", "Zip_code", "Preferred_size", "Overall_review",
-                    "Subscription Status", "Previous Purchases", "Payment Method", "Frequency of Purchases",
-                    "n_women_purchases", "n_orders", "n_unique_sku", "avg_price", "std_price",
-                    "min_price", "max_price", "avg_quantity", "n_unique_style", "n_unique_color"
-                ],
-                'cat_features': ["Gender", "Zip_code", "Preferred_size", "Subscription Status", "Payment Method", "Frequency of Purchases"],
-                'type': 'classification',
-                'description': 'Women Preference: Small accessories vs Nightwear'
-            },
-            'future_avg_basket': {
-                'model_file': 'future_avg_basket.pkl',
-                'encoders_file': None,  # No encoders for this model
-                'features': [
-                    'code_customer', 'hist_total_amount', 'hist_n_purchases', 'hist_avg_basket',
-                    'Age', 'Overall_review', 'Previous Purchases', 'avg_original_price',
-                    'avg_quantity', 'future_total_amount', 'future_n_purchases'
-                ],
-                'cat_features': [],  # No categorical features
-                'type': 'regression',
-                'description': 'Future Average Basket Prediction'
-            },
-            'classification_potential_region': {
-                'model_file': 'classification_potential_region.pkl',
-                'encoders_file': None,  # Manual one-hot encoding
-                'scaler_file': None,
-                'features': [
-                    'age_std', 'age_mean', 'freq_mean', 'freq_std', 'n_customers',
-                    'rev_norm', 'sub_norm', 'prev_norm', 'freq_consistency',
-                    'rev_x_prev', 'sub_x_age', 'rev_x_sub'
-                ],
-                'cat_features': [],  # Handled manually
-                'type': 'classification',
-                'description': 'Potential Region Classification'
-            },
-            'recommended_price': {
-                'model_file': 'regression_recommended_price.pkl',
-                'encoders_file': None,
-                'scaler_file': 'regression_recommended_price_scaler.pkl',
-                'features': [
-                    'SKU_encoded', 'num_purchases', 'quantity', 'date_flexibility', 'Estimated_Unit_Price',
-                    'price_quantity', 'purchases_flexibility', 'price_purchases'
-                ],
-                'cat_features': [],
-                'type': 'regression',
-                'description': 'Recommended Product Price Prediction'
-            },
-            'spending_level': {
-                'model_file': 'Classification_Spending_Level.pkl',
-                'encoders_file': 'Classification_Spending_Level_encoders.pkl',
-                'features': [
-                    'Gender', 'Age', 'Frequency of Purchases', 'Payment Method', 'discount_rate', 'log_quantity',
-                    'age_freq', 'discount_qty', 'Subscription_Status', 'avg_prev_per_age', 'avg_prev_by_freq', 'prev_per_age'
-                ],
-                'cat_features': ['Gender', 'Frequency of Purchases', 'Payment Method'],
-                'type': 'classification',
-                'description': 'Customer Spending Level Prediction'
-            },
-            'regression_failed_orders': {
-                'model_file': 'regression_failed_orders_pct.pkl',
-                'encoders_file': None,
-                'scaler_file': None,
-                'features': ['period_num'],
-                'cat_features': [],
-                'type': 'regression',
-                'description': 'Failed Orders Percentage Prediction'
-            },
-            'classification_high_risk_cancelling': {
-                'model_file': 'classification_high_risk_cancelling.pkl',
-                'encoders_file': None,
-                'scaler_file': 'classification_high_risk_cancelling_scaler.pkl',
-                'features': ['total_orders', 'total_cancelled', 'avg_quantity', 'avg_unit_price', 'unique_products', 'total_not_cancelled', 'age', 'gender_male'],
-                'cat_features': [],
-                'type': 'classification',
-                'description': 'High Risk Cancelling Customer Classification'
-            },
-            'regression_state_revenue': {
-                'model_file': 'regression_state_revenue.pkl',
-                'encoders_file': None,
-                'scaler_file': 'regression_state_revenue_scaler.pkl',
-                'features': ['nb_orders', 'nb_customers', 'avg_basket', 'return_rate_pct', 'avg_age', 'pct_male', 'total_qty_sold'],
-                'cat_features': [],
-                'type': 'regression',
-                'description': 'State Revenue Regression'
-            },
-            'classification_customer_behavior': {
-                'model_file': 'classification_customer_behavior.pkl',
-                'encoders_file': 'classification_customer_behavior_encoders.pkl',
-                'scaler_file': 'classification_customer_behavior_scaler.pkl',
-                'features': [
-                    'total_purchases', 'total_quantity', 'avg_unit_price', 'total_spent',
-                    'discount_rate', 'customer_lifetime_days', 'purchase_frequency',
-                    'avg_order_value', 'return_cancel_rate', 'Age', 'Overall_review',
-                    'Previous Purchases', 'Gender_encoded', 'Preferred_size_encoded',
-                    'Payment Method_encoded', 'Frequency of Purchases_encoded'
-                ],
-                'cat_features': ['Gender', 'Preferred_size', 'Payment Method', 'Frequency of Purchases'],
-                'type': 'classification',
-                'description': 'Customer Behavior Classification'
-            }
-            ,
-            'future_purchases': {
-                'model_file': 'ghada_regression_model.pkl',
-                'encoders_file': None,
-                'scaler_file': 'ghada_regression_scaler.pkl',
-                'features': [
-                    'freq_per_month', 'discount_rate', 'recency_days', 'tenure_days',
-                    'past_purchases', 'unique_products', 'total_spent', 'Overall_review',
-                    'is_subscribed', 'purchases_per_month', 'discount_sensitivity', 'variety_index',
-                    'monetary_intensity', 'recency_ratio', 'spend_per_product', 'discount_ratio',
-                    'activity_intensity', 'recent_purchases', 'recent_spent', 'recent_unique_products'
-                ],
-                'cat_features': [],
-                'type': 'regression',
-                'description': 'Future Purchases Prediction'
-            },
-            'customer_clustering': {
-                'model_file': 'clustering_customer_model.pkl',
-                'encoders_file': None,
-                'scaler_file': 'clustering_customer_scaler.pkl',
-                'features_file': 'clustering_customer_features.pkl',
-                'features': [
-                    'total_purchases', 'total_quantity', 'avg_unit_price', 'total_spent',
-                    'discount_rate', 'customer_lifetime_days', 'purchase_frequency',
-                    'avg_order_value', 'return_cancel_rate'
-                ],
-                'cat_features': [],
-                'type': 'clustering',
-                'description': 'Customer Clustering: 5 shopper segments'
-            },
-            'regional_clustering': {
-                'model_file': 'regional_clustering_model.pkl',
-                'encoders_file': None,
-                'scaler_file': 'regional_clustering_scaler.pkl',
-                'pca_file': 'regional_clustering_pca.pkl',
-                'features_file': 'regional_clustering_features.pkl',
-                'features': ['age', 'overall_review', 'previous_purchases', 'frequency_of_purchases', 'subscription_status', 'gender'],
-                'cat_features': ['subscription_status', 'gender', 'frequency_of_purchases'],
-                'type': 'clustering',
-                'description': 'Regional Clustering'
-            }
-        }
-        
-        for name, config in model_configs.items():
-            model_path = os.path.join(models_dir, config['model_file'])
-            encoders = None
-            scaler = None
-            pca = None
-            features = None
-            if config.get('encoders_file'):
-                encoders_path = os.path.join(models_dir, config['encoders_file'])
-                encoders = joblib.load(encoders_path)
-            if config.get('scaler_file'):
-                scaler_path = os.path.join(models_dir, config['scaler_file'])
-                scaler = joblib.load(scaler_path)
-            if config.get('pca_file'):
-                pca_path = os.path.join(models_dir, config['pca_file'])
-                pca = joblib.load(pca_path)
-            if config.get('features_file'):
-                features_path = os.path.join(models_dir, config['features_file'])
-                features = joblib.load(features_path)
-            _models[name] = {
-                'model': joblib.load(model_path),
-                'encoders': encoders,
-                'scaler': scaler,
-                'pca': pca,
-                'features': features,
-                'config': config
-            }
-    return _models
+    """Load every available model; kept for callers that want the whole set.
+
+    Views should prefer ``get_model(name)``, which only loads what it needs.
+    """
+    return registry.load_all()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# {model name: future} of calls still running after they missed the deadline
+_stalled = {}
+_stalled_lock = threading.Lock()
+
+
+def _fanout_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = getattr(settings, 'ML_FANOUT_WORKERS', 8)
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ml-fanout')
+    return _executor
+
+
+def _predict_one_model(name, input_data):
+    model_data = get_model(name)
+    config = model_data['config']
+    pred = model_data['pipeline'].predict_one(input_data)
+    result = {
+        'result': pred,
+        'description': config['description'],
+        'type': config['type']
+    }
+    # Post-process clustering results into readable names
+    if config.get('type') == 'clustering':
+        cluster_num = int(pred)
+        result['result'] = config.get('cluster_names', {}).get(cluster_num, f'Cluster {cluster_num}')
+        result['cluster_number'] = cluster_num
+    return result
+
+
+def predict_all(input_data):
+    """Score ``input_data`` with every configured model concurrently.
+
+    Models run on a bounded thread pool (sklearn/XGBoost release the GIL while
+    predicting), so the page costs roughly its slowest model. A model that
+    fails or misses the ``ML_MODEL_TIMEOUT`` deadline is reported on its own
+    instead of breaking the others.
+
+    The deadline only cuts the call off from the response: a running predict
+    cannot be interrupted. Until a timed-out call has returned, its model is
+    not submitted again (and reported as busy), so one hung model holds at
+    most the pool workers it already had instead of filling the pool.
+    """
+    timeout = getattr(settings, 'ML_MODEL_TIMEOUT', 5.0)
+    executor = _fanout_executor()
+    futures = {}
+    busy = []
+    with _stalled_lock:
+        for name in registry.names():
+            stalled = _stalled.get(name)
+            if stalled is not None and not stalled.done():
+                busy.append(name)
+                continue
+            _stalled.pop(name, None)
+            # Each task runs in a copy of the request context so ModelVersionMiddleware sees its model
+            futures[executor.submit(contextvars.copy_context().run, _predict_one_model, name, input_data)] = name
+    wait(futures, timeout=timeout)
+
+    predictions = {}
+    for name in busy:
+        predictions[name] = _unavailable(name, f'still running a call that timed out after {timeout:g}s')
+    for future, name in futures.items():
+        if not future.done():
+            if not future.cancel():
+                with _stalled_lock:
+                    _stalled[name] = future
+            error = f'timed out after {timeout:g}s'
+        elif future.exception() is not None:
+            exc = future.exception()
+            error = f'{type(exc).__name__}: {exc}'
+        else:
+            predictions[name] = future.result()
+            continue
+        predictions[name] = _unavailable(name, error)
+    return {name: predictions[name] for name in registry.names()}
+
+
+def _unavailable(name, error):
+    logger.warning("Model '%s' failed in predict_view: %s", name, error)
+    config = registry.configs[name]
+    return {
+        'result': 'Unavailable',
+        'error': error,
+        'description': config['description'],
+        'type': config['type']
+    }
+
 
 def predict_view(request):
     predictions = {}
@@ -246,114 +236,21 @@ def predict_view(request):
             # Add other fields as needed for future models
         }
 
-        # Calculate derived features for future_avg_basket model
+        # Look up precomputed historical features for future_avg_basket model
         if input_data["code_customer"]:
             try:
-                # Load data files (same as in the notebook)
-                data_dir = r"C:\Users\GSI\Desktop\DataWareHouse"
-                sales = pd.read_excel(os.path.join(data_dir, "Sales.xlsx"))
-                customers = pd.read_excel(os.path.join(data_dir, "Customers_f.xlsx"))
-                products = pd.read_excel(os.path.join(data_dir, "Products_f.xlsx"))
-                
-                # Convert sale_date to datetime
-                sales["sale_date"] = pd.to_datetime(sales["sale_date"])
-                
-                # Define cutoff date (70% historical, 30% future)
-                cutoff_date = sales["sale_date"].quantile(0.7)
-                
-                # Split into historical and future
-                historical = sales[sales["sale_date"] <= cutoff_date]
-                
-                # Calculate historical features for the specific customer
-                customer_code = input_data["code_customer"]
-                customer_hist = historical[historical["code_customer"] == customer_code]
-                
-                if not customer_hist.empty:
-                    # Calculate derived features
-                    input_data["hist_total_amount"] = customer_hist["Estimated_Unit_Price"].sum()
-                    input_data["hist_n_purchases"] = customer_hist["code_order"].nunique()
-                    input_data["hist_avg_basket"] = customer_hist["Estimated_Unit_Price"].mean()
-                    input_data["avg_original_price"] = customer_hist["Estimated_Unit_Price"].mean()
-                    input_data["avg_quantity"] = customer_hist["quantity"].mean()
-                else:
-                    # Default values if no historical data
-                    input_data["hist_total_amount"] = 0.0
-                    input_data["hist_n_purchases"] = 0
-                    input_data["hist_avg_basket"] = 0.0
-                    input_data["avg_original_price"] = 50.0
-                    input_data["avg_quantity"] = 1.0
-                    
+                with stage('features'):
+                    input_data.update(get_customer_features(input_data["code_customer"]))
             except Exception as e:
-                # If data loading fails, use default values
-                print(f"Error calculating derived features: {e}")
-                input_data["hist_total_amount"] = 0.0
-                input_data["hist_n_purchases"] = 0
-                input_data["hist_avg_basket"] = 0.0
-                input_data["avg_original_price"] = 50.0
-                input_data["avg_quantity"] = 1.0
-
-        models = load_models()
-        for name, model_data in models.items():
-            model = model_data['model']
-            encoders = model_data['encoders']
-            config = model_data['config']
-            
-            # Select relevant features for this model
-            model_features = config['features']
-
-            df_input = pd.DataFrame([{k: input_data[k] for k in model_features if k in input_data}], columns=model_features)
-            
-            # Encode categorical features
-            cat_cols = config.get('cat_features', [])
-            for col in cat_cols:
-                if encoders and col in encoders:
-                    le = encoders[col]
-                    df_input[col] = le.transform(df_input[col].astype(str))
-            
-            # Apply scaler if available (for clustering or models expecting scaled inputs)
-            scaler_obj = model_data.get('scaler')
-            try:
-                if scaler_obj is not None and not df_input.empty:
-                    # ensure numeric
-                    df_input = df_input.astype(float)
-                    df_scaled = scaler_obj.transform(df_input)
-                    df_input = pd.DataFrame(df_scaled, columns=df_input.columns)
-            except Exception:
-                # If scaling fails, continue with original df_input
-                pass
-
-            # Predict
-            try:
-                pred = model.predict(df_input)[0]
-            except Exception:
-                # fallback: try predicting on raw values
-                pred = model.predict(pd.DataFrame(df_input.values, columns=df_input.columns))[0]
-
-            # Post-process clustering results into readable names
-            if config.get('type') == 'clustering':
-                cluster_num = int(pred)
-                cluster_names = {
-                    0: 'Occasional Buyers',
-                    1: 'Regular Loyalists',
-                    2: 'Bargain Hunters',
-                    3: 'VIP Shoppers',
-                    4: 'Problem Customers'
-                }
-                predictions[name] = {
-                    'result': cluster_names.get(cluster_num, f'Cluster {cluster_num}'),
-                    'cluster_number': cluster_num,
-                    'description': config['description'],
-                    'type': config['type']
-                }
-            else:
-                predictions[name] = {
-                    'result': pred,
-                    'description': config['description'],
-                    'type': config['type']
-                }
+                # If the feature store is unavailable, use default values
+                logger.warning("Error loading customer features: %s", e)
+                input_data.update(DEFAULT_CUSTOMER_FEATURES)
+
+        predictions = predict_all(input_data)
 
     return render(request, 'ml_app/predict.html', {'predictions': predictions})
 
+@customer_lookup('women_preference', 'ml_app/women_preference.html')
 def women_preference_view(request):
     predictions = {}
     if request.method == 'POST':
@@ -378,18 +275,9 @@ def women_preference_view(request):
             "n_unique_style": int(request.POST.get('n_unique_style', 1)),
             "n_unique_color": int(request.POST.get('n_unique_color', 1)),
         }
-        model_data = load_models()['women_preference']
-        model = model_data['model']
-        encoders = model_data['encoders']
+        model_data = get_model('women_preference')
         config = model_data['config']
-        model_features = config['features']
-        df_input = pd.DataFrame([{k: input_data[k] for k in model_features if k in input_data}], columns=model_features)
-        cat_cols = config.get('cat_features', [])
-        for col in cat_cols:
-            if encoders and col in encoders:
-                le = encoders[col]
-                df_input[col] = le.transform(df_input[col].astype(str))
-        pred = model.predict(df_input)[0]
+        pred = model_data['pipeline'].predict_one(input_data)
         predictions['women_preference'] = {
             'result': pred,
             'description': config['description'],
@@ -413,12 +301,9 @@ def future_avg_basket_view(request):
             "future_total_amount": float(request.POST.get('future_total_amount', 0)),
             "future_n_purchases": int(request.POST.get('future_n_purchases', 0)),
         }
-        model_data = load_models()['future_avg_basket']
-        model = model_data['model']
+        model_data = get_model('future_avg_basket')
         config = model_data['config']
-        model_features = config['features']
-        df_input = pd.DataFrame([{k: input_data[k] for k in model_features if k in input_data}], columns=model_features)
-        pred = model.predict(df_input)[0]
+        pred = model_data['pipeline'].predict_one(input_data)
         predictions['future_avg_basket'] = {
             'result': pred,
             'description': config['description'],
@@ -443,12 +328,9 @@ def potential_region_view(request):
             "sub_x_age": float(request.POST.get('sub_x_age', 0)),
             "rev_x_sub": float(request.POST.get('rev_x_sub', 0)),
         }
-        model_data = load_models()['classification_potential_region']
-        model = model_data['model']
+        model_data = get_model('classification_potential_region')
         config = model_data['config']
-        model_features = config['features']
-        df_input = pd.DataFrame([{k: input_data[k] for k in model_features if k in input_data}], columns=model_features)
-        pred = model.predict(df_input)[0]
+        pred = model_data['pipeline'].predict_one(input_data)
         predictions['classification_potential_region'] = {
             'result': pred,
             'description': config['description'],
@@ -471,20 +353,9 @@ def recommended_price_view(request):
         input_data["purchases_flexibility"] = input_data["num_purchases"] * input_data["date_flexibility"]
         input_data["price_purchases"] = input_data["Estimated_Unit_Price"] * input_data["num_purchases"]
         
-        model_data = load_models()['recommended_price']
-        model = model_data['model']
-        scaler = model_data['scaler']
+        model_data = get_model('recommended_price')
         config = model_data['config']
-        model_features = config['features']
-        df_input = pd.DataFrame([{k: input_data[k] for k in model_features if k in input_data}], columns=model_features)
-        df_input = df_input.astype(float)
-        if hasattr(model, 'feature_names_in_'):
-            df_input = df_input[model.feature_names_in_]
-        # Apply scaling to numerical features
-        if scaler:
-            numerical_cols = [col for col in df_input.columns]
-            df_input[numerical_cols] = scaler.transform(df_input[numerical_cols])
-        pred = model.predict(df_input)[0]
+        pred = model_data['pipeline'].predict_one(input_data)
         # Assuming pred is the discount percentage
         estimated_price = input_data["Estimated_Unit_Price"]
         # Cap the discount percentage between 0 and 100
@@ -501,6 +372,7 @@ def recommended_price_view(request):
         }
     return render(request, 'ml_app/recommended_price.html', {'predictions': predictions})
 
+@customer_lookup('spending_level', 'ml_app/spending_level.html')
 def spending_level_view(request):
     predictions = {}
     if request.method == 'POST':
@@ -537,19 +409,9 @@ def spending_level_view(request):
         input_data["avg_prev_by_freq"] = avg_prev_by_freq
         input_data["prev_per_age"] = prev_per_age
         
-        model_data = load_models()['spending_level']
-        model = model_data['model']
-        encoders = model_data['encoders']
+        model_data = get_model('spending_level')
         config = model_data['config']
-        model_features = config['features']
-        df_input = pd.DataFrame([{k: input_data[k] for k in model_features if k in input_data}], columns=model_features)
-        cat_cols = config.get('cat_features', [])
-        if encoders and 'label_encoders' in encoders:
-            for col in cat_cols:
-                if col in encoders['label_encoders']:
-                    le = encoders['label_encoders'][col]
-                    df_input[col] = le.transform(df_input[col].astype(str))
-        pred = model.predict(df_input)[0]
+        pred = model_data['pipeline'].predict_one(input_data)
         predictions['spending_level'] = {
             'result': pred,
             'description': config['description'],
@@ -562,26 +424,18 @@ def regression_failed_orders_view(request):
     if request.method == 'POST':
         year = int(request.POST.get('year', 2025))
         # Compute period_num from year
-        period_num = pd.Timestamp(f'{year}-01-01').timestamp()
-        
-        print(f"Year: {year}, Period_num: {period_num}")
-        
+        period_num = datetime.datetime(year, 1, 1, tzinfo=datetime.timezone.utc).timestamp()
+        logger.debug("regression_failed_orders: year=%s period_num=%s", year, period_num)
+
         input_data = {
             "period_num": period_num
         }
         
-        model_data = load_models()['regression_failed_orders']
-        model = model_data['model']
+        model_data = get_model('regression_failed_orders')
         config = model_data['config']
-        model_features = config['features']
-        df_input = pd.DataFrame([{k: input_data[k] for k in model_features if k in input_data}], columns=model_features)
-        
-        print(f"Input DataFrame: {df_input}")
-        
-        pred = model.predict(df_input)[0]
-        
-        print(f"Prediction: {pred}")
-        
+        pred = model_data['pipeline'].predict_one(input_data)
+        logger.debug("regression_failed_orders: prediction=%s", pred)
+
         predictions['regression_failed_orders'] = {
             'result': pred,
             'year': year,
@@ -590,6 +444,7 @@ def regression_failed_orders_view(request):
         }
     return render(request, 'ml_app/regression_failed_orders.html', {'predictions': predictions})
 
+@customer_lookup('classification_high_risk_cancelling', 'ml_app/classification_high_risk_cancelling.html', _risk_result)
 def classification_high_risk_cancelling_view(request):
     predictions = {}
     if request.method == 'POST':
@@ -605,17 +460,9 @@ def classification_high_risk_cancelling_view(request):
         input_data["gender_male"] = 1 if gender == 'Male' else 0
         input_data["total_not_cancelled"] = input_data["total_orders"] - input_data["total_cancelled"]
         
-        model_data = load_models()['classification_high_risk_cancelling']
-        model = model_data['model']
-        scaler = model_data['scaler']
+        model_data = get_model('classification_high_risk_cancelling')
         config = model_data['config']
-        model_features = config['features']
-        df_input = pd.DataFrame([{k: input_data[k] for k in model_features if k in input_data}], columns=model_features)
-        df_input = df_input.astype(float)
-        if scaler:
-            numerical_cols = [col for col in df_input.columns]
-            df_input[numerical_cols] = scaler.transform(df_input[numerical_cols])
-        pred = model.predict(df_input)[0]
+        pred = model_data['pipeline'].predict_one(input_data)
         risk_label = "High Risk" if pred == 1 else "Low Risk"
         predictions['classification_high_risk_cancelling'] = {
             'result': risk_label,
@@ -636,17 +483,9 @@ def regression_state_revenue_view(request):
             "pct_male": float(request.POST.get('pct_male', 0)),
             "total_qty_sold": int(request.POST.get('total_qty_sold', 0)),
         }
-        model_data = load_models()['regression_state_revenue']
-        model = model_data['model']
-        scaler = model_data['scaler']
+        model_data = get_model('regression_state_revenue')
         config = model_data['config']
-        model_features = config['features']
-        df_input = pd.DataFrame([{k: input_data[k] for k in model_features if k in input_data}], columns=model_features)
-        df_input = df_input.astype(float)
-        if scaler:
-            numerical_cols = [col for col in df_input.columns]
-            df_input[numerical_cols] = scaler.transform(df_input[numerical_cols])
-        pred = model.predict(df_input)[0]
+        pred = model_data['pipeline'].predict_one(input_data)
         predictions['regression_state_revenue'] = {
             'result': pred,
             'description': config['description'],
@@ -654,6 +493,7 @@ def regression_state_revenue_view(request):
         }
     return render(request, 'ml_app/regression_state_revenue.html', {'predictions': predictions})
 
+@customer_lookup('classification_customer_behavior', 'ml_app/classification_customer_behavior.html', _segment_result)
 def classification_customer_behavior_view(request):
     predictions = {}
     if request.method == 'POST':
@@ -676,47 +516,13 @@ def classification_customer_behavior_view(request):
             "Frequency of Purchases": request.POST.get('frequency_of_purchases', ''),
         }
         
-        model_data = load_models()['classification_customer_behavior']
-        model = model_data['model']
-        encoders = model_data['encoders']
-        scaler = model_data['scaler']
+        model_data = get_model('classification_customer_behavior')
         config = model_data['config']
-        model_features = config['features']
-        
-        # Create DataFrame with numerical features first
-        numerical_features = [f for f in model_features if not f.endswith('_encoded')]
-        df_input = pd.DataFrame([{k: input_data[k] for k in numerical_features}], columns=numerical_features)
-        
-        # Encode categorical features and add to DataFrame
-        cat_cols = config.get('cat_features', [])
-        for col in cat_cols:
-            if encoders and col in encoders:
-                le = encoders[col]
-                encoded_col = col + '_encoded'
-                try:
-                    df_input[encoded_col] = le.transform([input_data[col]])
-                except ValueError:
-                    # If unseen label, use the first class
-                    df_input[encoded_col] = le.transform([le.classes_[0]])
-        
-        # Ensure all features are present
-        df_input = df_input.astype(float)
-        
-        # Apply scaling to all features
-        if scaler:
-            df_input = pd.DataFrame(scaler.transform(df_input), columns=df_input.columns, index=df_input.index)
-        
-        pred = model.predict(df_input)[0]
+        # Unseen categorical labels fall back to the encoder's first class
+        pred = model_data['pipeline'].predict_one(input_data, handle_unknown='first')
         
         # Map prediction to class name
-        class_names = {
-            0: 'Occasional Buyers',
-            1: 'Regular Loyalists',
-            2: 'Bargain Hunters',
-            3: 'VIP Shoppers',
-            4: 'Problem Customers'
-        }
-        class_name = class_names.get(pred, f'Class {pred}')
+        class_name = SEGMENT_NAMES.get(pred, f'Class {pred}')
         
         predictions['classification_customer_behavior'] = {
             'result': class_name,
@@ -727,12 +533,13 @@ def classification_customer_behavior_view(request):
     return render(request, 'ml_app/classification_customer_behavior.html', {'predictions': predictions})
 
 
+@customer_lookup('customer_clustering', 'ml_app/customer_clustering.html', _cluster_result)
 def customer_clustering_view(request):
     predictions = {}
     error = None
     model_data = None
     try:
-        model_data = load_models().get('customer_clustering')
+        model_data = get_model('customer_clustering')
     except Exception as e:
         error = str(e)
 
@@ -751,31 +558,12 @@ def customer_clustering_view(request):
                 except Exception:
                     input_data[f] = 0.0
 
-        df_input = pd.DataFrame([input_data], columns=features)
-        scaler = model_data.get('scaler')
-        try:
-            if scaler is not None:
-                df_input = pd.DataFrame(scaler.transform(df_input.astype(float)), columns=features)
-        except Exception:
-            pass
-
-        model = model_data['model']
-        try:
-            pred = model.predict(df_input)[0]
-        except Exception:
-            pred = model.predict(df_input.values.reshape(1, -1))[0]
+        pred = model_data['pipeline'].predict_one(input_data)
 
         cluster_num = int(pred)
-        cluster_names = {
-            0: 'Occasional Buyers',
-            1: 'Regular Loyalists',
-            2: 'Bargain Hunters',
-            3: 'VIP Shoppers',
-            4: 'Problem Customers'
-        }
         predictions = {
             'cluster_number': cluster_num,
-            'cluster_name': cluster_names.get(cluster_num, f'Cluster {cluster_num}'),
+            'cluster_name': SEGMENT_NAMES.get(cluster_num, f'Cluster {cluster_num}'),
             'features': input_data
         }
 
@@ -787,7 +575,7 @@ def regional_clustering_view(request):
     error = None
     model_data = None
     try:
-        model_data = load_models().get('regional_clustering')
+        model_data = get_model('regional_clustering')
     except Exception as e:
         error = str(e)
 
@@ -806,21 +594,8 @@ def regional_clustering_view(request):
                 except Exception:
                     input_data[f] = 0.0
 
-        df_input = pd.DataFrame([input_data], columns=features)
-        scaler = model_data.get('scaler')
-        pca = model_data.get('pca')
-        try:
-            if scaler is not None:
-                df_input = pd.DataFrame(scaler.transform(df_input.astype(float)), columns=features)
-            # Note: PCA not applied as model expects original features
-        except Exception:
-            pass
-
-        model = model_data['model']
-        try:
-            pred = model.predict(df_input)[0]
-        except Exception:
-            pred = model.predict(df_input.values.reshape(1, -1))[0]
+        # Note: PCA not applied as model expects original features
+        pred = model_data['pipeline'].predict_one(input_data)
 
         cluster_num = int(pred)
         cluster_names = {
@@ -839,17 +614,16 @@ def regional_clustering_view(request):
     return render(request, 'ml_app/regional_clustering.html', {'predictions': predictions, 'error': error})
 
 
+@customer_lookup('future_purchases', 'ml_app/future_purchases.html')
 def future_purchases_view(request):
     predictions = {}
     if request.method == 'POST':
         # Collect inputs for features (use 0 / reasonable defaults if missing)
-        model_data = load_models().get('future_purchases')
+        model_data = get_model('future_purchases')
         if not model_data:
             return render(request, 'ml_app/regression_model_y.html', {'error': 'Model not loaded'})
 
         config = model_data['config']
-        model = model_data['model']
-        scaler = model_data['scaler']
         features = config['features']
 
         # Build input dict from POST
@@ -865,18 +639,7 @@ def future_purchases_view(request):
                 except Exception:
                     input_data[feat] = 0.0
 
-        df_input = pd.DataFrame([input_data], columns=features)
-        # Apply scaler if present
-        if scaler:
-            try:
-                df_input = pd.DataFrame(scaler.transform(df_input), columns=df_input.columns, index=df_input.index)
-            except Exception:
-                # If scaler expects different ordering/cols, try numeric conversion
-                df_input = df_input.astype(float)
-        else:
-            df_input = df_input.astype(float)
-
-        pred = model.predict(df_input)[0]
+        pred = model_data['pipeline'].predict_one(input_data)
         predictions['future_purchases'] = {
             'result': pred,
             'description': config['description'],
@@ -887,4 +650,3 @@ def future_purchases_view(request):
     return render(request, 'ml_app/future_purchases.html', {'predictions': predictions})
 def power_bi_dashboard_view(request):
     return render(request, 'ml_app/power_bi.html')
-
@@ -0,0 +1,329 @@
+"""The warehouse exports as an indexed SQLite star schema.
+
+``manage.py build_warehouse`` loads the workbooks of ``data/`` (through
+``data_loader.load_table``) into one SQLite file (``settings.WAREHOUSE_DB``).
+Sales is the fact table, keyed by ``code_sale`` and indexed on
+``(code_customer, sale_date)``, ``code_order``, ``SKU`` and ``sale_date``.
+Every other workbook is a dimension keyed by its code. Fetching one
+customer's, order's, product's or state's rows, or a date range, is then an
+index lookup instead of reading and merging whole workbooks::
+
+    from ml_app.warehouse_db import warehouse_db
+    sales = warehouse_db.customer_sales([1042], start='2023-01-01')
+    context = warehouse_db.feature_context(state='Kentucky')
+    X = context.model_frame('future_purchases')
+
+Dates are stored as ISO text so range conditions use the indexes; the query
+helpers parse them back. Like ``data_loader``, this works inside Django and
+from the training notebooks.
+"""
+import datetime
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+from .data_loader import DATE_COLUMNS, _setting, data_dir, load_table, resolve_source
+
+# Bump when the schema changes
+WAREHOUSE_FORMAT = 1
+
+# table -> (primary key, indexes); rows repeating a key keep the first one,
+# as the notebooks' drop_duplicates does
+SCHEMA = {
+    'Sales': ('code_sale', [('code_customer', 'sale_date'), ('code_order',), ('SKU',), ('sale_date',)]),
+    'Customers_f': ('code_customer', [('Zip_code',)]),
+    'Orders': ('order_code', []),
+    'Products_f': ('SKU', [('section_no',), ('code_color',)]),
+    'Sections': ('section_no', []),
+    'Colors': ('code_color', []),
+    'Locations': ('zip_code', [('state',)]),
+    'Reviews': ('code_review_type', []),
+    'Payment_methods': ('code_payment_method', []),
+    'Pricing_strategies': ('code_pricing_strategy', []),
+    'Product_qualities': (None, [('sku',), ('code_review_type',)]),
+    'Shipping_types': ('ship_type_code', []),
+}
+
+# Declared (not enforced) references between the tables. The ship type,
+# pricing strategy and payment method codes of Sales do not match their
+# dimension tables in the exports, so they are not declared.
+REFERENCES = {
+    'Sales': {'code_customer': 'Customers_f', 'code_order': 'Orders', 'SKU': 'Products_f'},
+    'Customers_f': {'Zip_code': 'Locations'},
+    'Products_f': {'section_no': 'Sections', 'code_color': 'Colors'},
+    'Product_qualities': {'sku': 'Products_f', 'code_review_type': 'Reviews'},
+}
+
+_DATE_NAMES = {column for columns in DATE_COLUMNS.values() for column in columns}
+
+
+class WarehouseError(Exception):
+    """The warehouse database has not been built, or is from an older format."""
+
+
+def default_path():
+    path = _setting('WAREHOUSE_DB')
+    return Path(path) if path else data_dir() / 'warehouse.sqlite3'
+
+
+def source_fingerprint(names=SCHEMA):
+    """{name: [size, mtime]} of the workbooks; the build is stale once it changes."""
+    stamp = {}
+    for name in names:
+        st = resolve_source(name).stat()
+        stamp[name] = [st.st_size, st.st_mtime_ns]
+    return stamp
+
+
+def _sql_type(values):
+    if pd.api.types.is_integer_dtype(values) or pd.api.types.is_bool_dtype(values):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(values):
+        return 'REAL'
+    return 'TEXT'
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _create_table(name, frame):
+    key, _ = SCHEMA[name]
+    references = REFERENCES.get(name, {})
+    columns = []
+    for column in frame.columns:
+        definition = f'{_quote(column)} {_sql_type(frame[column])}'
+        if column == key:
+            definition += ' PRIMARY KEY'
+        if column in references:
+            parent = references[column]
+            definition += f' REFERENCES {_quote(parent)} ({_quote(SCHEMA[parent][0])})'
+        columns.append(definition)
+    return f'CREATE TABLE {_quote(name)} ({", ".join(columns)})'
+
+
+def _rows(frame):
+    columns = []
+    for column in frame.columns:
+        values = frame[column]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            values = values.dt.strftime('%Y-%m-%d %H:%M:%S')
+        columns.append(values.astype(object).where(values.notna(), None).tolist())
+    return zip(*columns)
+
+
+def build(path=None, tables=None, progress=None):
+    """Write the star schema to ``path``; returns ``{table: {'rows', 'duplicates'}}``.
+
+    ``tables`` maps table names to frames (default: every ``SCHEMA`` table,
+    through ``load_table``). The file is built next to ``path`` and swapped
+    in at the end, so readers never see a half-built warehouse.
+    ``progress(name, rows)`` is called after each table.
+    """
+    path = Path(path or default_path())
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    tmp.unlink(missing_ok=True)
+    fingerprint = source_fingerprint() if tables is None else None
+    if tables is None:
+        tables = {name: load_table(name) for name in SCHEMA}
+
+    # Scoring defaults, so lookups over a few customers use the global ones
+    from .features import FeatureContext
+    defaults = FeatureContext({'Sales': tables['Sales']}) if 'Sales' in tables else None
+
+    summary = {}
+    conn = sqlite3.connect(tmp)
+    try:
+        with conn:
+            for name, frame in tables.items():
+                if name not in SCHEMA:
+                    raise WarehouseError(f"No schema for table '{name}'")
+                # Locations' zip code column has a leading space in the export
+                frame = frame.rename(columns=str.strip)
+                key, indexes = SCHEMA[name]
+                duplicates = 0
+                if key is not None:
+                    duplicates = int(frame[key].duplicated().sum())
+                    frame = frame.drop_duplicates(key)
+                conn.execute(_create_table(name, frame))
+                placeholders = ', '.join('?' * len(frame.columns))
+                conn.executemany(f'INSERT INTO {_quote(name)} VALUES ({placeholders})', _rows(frame))
+                for columns in indexes:
+                    index = f'idx_{name}_{"_".join(columns)}'.lower()
+                    conn.execute(f'CREATE INDEX {_quote(index)} ON {_quote(name)} ({", ".join(map(_quote, columns))})')
+                summary[name] = {'rows': len(frame), 'duplicates': duplicates}
+                if progress is not None:
+                    progress(name, len(frame))
+            meta = {
+                'format': WAREHOUSE_FORMAT,
+                'built': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+                'sources': fingerprint,
+                'tables': summary,
+                'as_of': defaults.as_of.isoformat() if defaults else None,
+                'history_end': defaults.history_end.isoformat() if defaults else None,
+            }
+            conn.execute('CREATE TABLE warehouse_meta (key TEXT PRIMARY KEY, value TEXT)')
+            conn.executemany('INSERT INTO warehouse_meta VALUES (?, ?)',
+                             ((key, json.dumps(value)) for key, value in meta.items()))
+        # Statistics for the query planner
+        conn.execute('ANALYZE')
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+    return summary
+
+
+class WarehouseDatabase:
+    """Read-only query helpers over the built warehouse; every helper returns a DataFrame."""
+
+    def __init__(self, path=None):
+        self._path = path
+        self._local = threading.local()
+        if hasattr(os, 'register_at_fork'):
+            # SQLite connections must not be shared with a forked child
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    @property
+    def path(self):
+        return Path(self._path or default_path())
+
+    def _after_fork(self):
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if not self.path.exists():
+                raise WarehouseError(f'{self.path} does not exist; run manage.py build_warehouse')
+            conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def exists(self):
+        return self.path.exists()
+
+    def meta(self):
+        meta = {key: json.loads(value) for key, value in self._conn().execute('SELECT key, value FROM warehouse_meta')}
+        if meta.get('format') != WAREHOUSE_FORMAT:
+            raise WarehouseError(f'{self.path} has format {meta.get("format")}; rebuild it with manage.py build_warehouse')
+        return meta
+
+    def is_stale(self):
+        """True when the warehouse is missing, from an older format, or older than a workbook."""
+        if not self.exists():
+            return True
+        try:
+            meta = self.meta()
+        except (WarehouseError, sqlite3.DatabaseError):
+            return True
+        return meta['sources'] != source_fingerprint()
+
+    def query(self, sql, params=()):
+        """``sql`` as a DataFrame, with date columns parsed."""
+        frame = pd.read_sql_query(sql, self._conn(), params=params)
+        for column in _DATE_NAMES.intersection(frame.columns):
+            frame[column] = pd.to_datetime(frame[column])
+        return frame
+
+    def explain(self, sql, params=()):
+        """SQLite's query plan for ``sql``, one step per line."""
+        return [row[-1] for row in self._conn().execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+
+    def table(self, name):
+        if name not in SCHEMA:
+            raise KeyError(f"Unknown table '{name}'")
+        return self.query(f'SELECT * FROM {_quote(name)}')
+
+    # Row filters, as (SQL condition on code_customer, params)
+
+    @staticmethod
+    def _customers_in(codes):
+        # One JSON parameter instead of one per code: no bound-parameter limit
+        return 'code_customer IN (SELECT value FROM json_each(?))', (json.dumps([int(code) for code in codes]),)
+
+    @staticmethod
+    def _customers_of_state(state):
+        return ('code_customer IN (SELECT c.code_customer FROM Customers_f c '
+                'JOIN Locations l ON l.zip_code = c.Zip_code WHERE l.state = ?)', (state,))
+
+    def _customer_filter(self, codes=None, state=None):
+        if (codes is None) == (state is None):
+            raise ValueError('Pass either codes or state')
+        return self._customers_in(codes) if codes is not None else self._customers_of_state(state)
+
+    def customers(self, codes=None, state=None):
+        """Customers_f rows of ``codes``, or of the customers living in ``state``."""
+        condition, params = self._customer_filter(codes, state)
+        return self.query(f'SELECT * FROM Customers_f WHERE {condition} ORDER BY code_customer', params)
+
+    def customer_sales(self, codes=None, state=None, start=None, end=None):
+        """Sales of the customers (see ``customers``), with ``start <= sale_date < end`` when given."""
+        condition, params = self._customer_filter(codes, state)
+        where, params = [condition], list(params)
+        if start is not None:
+            where.append('sale_date >= ?')
+            params.append(pd.Timestamp(start).strftime('%Y-%m-%d %H:%M:%S'))
+        if end is not None:
+            where.append('sale_date < ?')
+            params.append(pd.Timestamp(end).strftime('%Y-%m-%d %H:%M:%S'))
+        return self.query(f'SELECT * FROM Sales WHERE {" AND ".join(where)} ORDER BY code_customer, sale_date', params)
+
+    def sales_between(self, start, end):
+        """Sales with ``start <= sale_date < end``."""
+        return self.query(
+            'SELECT * FROM Sales WHERE sale_date >= ? AND sale_date < ? ORDER BY sale_date',
+            (pd.Timestamp(start).strftime('%Y-%m-%d %H:%M:%S'), pd.Timestamp(end).strftime('%Y-%m-%d %H:%M:%S')),
+        )
+
+    def order_sales(self, order_code):
+        """The sale lines of one order, with its status."""
+        return self.query(
+            'SELECT s.*, o.status_label, o.reason FROM Sales s LEFT JOIN Orders o ON o.order_code = s.code_order '
+            'WHERE s.code_order = ?', (order_code,),
+        )
+
+    def product_sales(self, sku):
+        """Sales of one SKU, with its product, section and colour."""
+        return self.query(
+            'SELECT s.*, p.Style_code, p.code_color, p.section_no, sec.section_name, c.colour_group_name '
+            'FROM Sales s LEFT JOIN Products_f p ON p.SKU = s.SKU '
+            'LEFT JOIN Sections sec ON sec.section_no = p.section_no '
+            'LEFT JOIN Colors c ON c.code_color = p.code_color WHERE s.SKU = ?', (int(sku),),
+        )
+
+    def feature_context(self, codes=None, state=None, as_of=None):
+        """A ``features.FeatureContext`` over the customers of ``codes`` or ``state``.
+
+        Only their rows are read, with the orders and products they refer
+        to. ``as_of`` and the history cutoff default to the whole warehouse's
+        (as recorded at build time), so features match a full-table run.
+        """
+        from .features import FeatureContext
+
+        condition, params = self._customer_filter(codes, state)
+        meta = self.meta()
+        tables = {
+            'Customers_f': self.query(f'SELECT * FROM Customers_f WHERE {condition}', params),
+            'Sales': self.query(f'SELECT * FROM Sales WHERE {condition}', params),
+            'Orders': self.query(
+                f'SELECT * FROM Orders WHERE order_code IN (SELECT code_order FROM Sales WHERE {condition})', params),
+            'Products_f': self.query(
+                f'SELECT * FROM Products_f WHERE SKU IN (SELECT SKU FROM Sales WHERE {condition})', params),
+            'Sections': self.table('Sections'),
+        }
+        return FeatureContext(tables, as_of=as_of if as_of is not None else meta['as_of'],
+                              history_end=meta['history_end'])
+
+
+warehouse_db = WarehouseDatabase()
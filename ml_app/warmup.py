@@ -0,0 +1,113 @@
+"""Warm a worker's models before it takes traffic.
+
+The first prediction a fresh worker serves pays for unpickling the model,
+importing its library and the first-call allocations of NumPy, pandas and
+the estimator. Warmup pays those costs up front: it loads every configured
+model and scores one synthetic row per model (see
+``CompiledPipeline.warm``).
+
+Servers turn it on explicitly (``ML_WARMUP=1`` in their environment, see
+``settings.ML_WARMUP``); scripts, notebooks and tests that call
+``django.setup()`` never start it. A worker then starts warmup in a
+background thread on its first request (typically the load balancer's
+readiness probe), and ``/ml/health/ready`` answers 503 until it has
+finished, so only warm workers get traffic. ``manage.py warmup`` runs the
+same steps in the foreground.
+"""
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from .registry import registry
+
+logger = logging.getLogger(__name__)
+
+IDLE, WARMING, READY = 'idle', 'warming', 'ready'
+
+_lock = threading.Lock()
+_state = {'status': IDLE, 'started': None, 'finished': None, 'models': {}}
+
+
+def warmup_enabled():
+    return getattr(settings, 'ML_WARMUP', False)
+
+
+def warm_model(name):
+    """Load ``name`` and score a synthetic row; returns its timings."""
+    start = time.perf_counter()
+    entry = registry.get(name)
+    loaded = time.perf_counter()
+    entry['pipeline'].warm()
+    return {
+        'version': entry['version'],
+        'load_seconds': round(loaded - start, 4),
+        'predict_seconds': round(time.perf_counter() - loaded, 4),
+    }
+
+
+def run_warmup(names=None):
+    """Warm ``names`` (default: every configured model) and mark the worker ready.
+
+    A model that fails to load or score is recorded with its error and does
+    not hold readiness back: it would fail the same way on a real request.
+    """
+    names = registry.names() if names is None else names
+    with _lock:
+        _state.update(status=WARMING, started=time.time(), finished=None, models={})
+    for name in names:
+        try:
+            result = warm_model(name)
+        except FileNotFoundError as e:
+            result = {'error': f'not available: {e}'}
+        except Exception as e:
+            logger.exception("Warming model '%s' failed", name)
+            result = {'error': f'{type(e).__name__}: {e}'}
+        with _lock:
+            _state['models'][name] = result
+    with _lock:
+        _state.update(status=READY, finished=time.time())
+    logger.info('Warmup finished in %.2fs', _state['finished'] - _state['started'])
+    return state()
+
+
+def start_warmup():
+    """Run warmup in a background thread unless it already ran or is running."""
+    with _lock:
+        if _state['status'] != IDLE:
+            return False
+        _state['status'] = WARMING
+    threading.Thread(target=run_warmup, name='ml-warmup', daemon=True).start()
+    return True
+
+
+def on_request_started(sender, **kwargs):
+    """``request_started`` receiver: the first request of a worker starts its warmup."""
+    # One dict read per request once warmup has started
+    if _state['status'] == IDLE and warmup_enabled():
+        start_warmup()
+
+
+def state():
+    with _lock:
+        return dict(_state, models=dict(_state['models']))
+
+
+def is_ready():
+    """True once warmup finished; always True when warmup is disabled."""
+    return not warmup_enabled() or _state['status'] == READY
+
+
+def _after_fork():
+    # A forked worker has none of the parent's threads (the lock may have been
+    # held by one of them). It warms on its own, from its first request: no
+    # thread is started inside the fork hook.
+    global _lock
+    _lock = threading.Lock()
+    if _state['status'] != IDLE:
+        _state.update(status=IDLE, started=None, finished=None, models={})
+
+
+os.register_at_fork(after_in_child=_after_fork)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,6 +45,8 @@ INSTALLED_APPS = [
 # AUTH_USER_MODEL = 'accountsApp.User'
 
 MIDDLEWARE = [
+    'ml_app.middleware.MetricsMiddleware',
+    'ml_app.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,6 +54,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'ml_app.middleware.ModelVersionMiddleware',
 ]
 
 ROOT_URLCONF = 'plateforme.urls'
@@ -121,3 +125,56 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 
+
+# Data warehouse exports (Sales.xlsx, Customers_f.xlsx, ...), their columnar
+# cache and the precomputed per-customer feature store built from them
+DATA_DIR = BASE_DIR / 'data'
+DATA_CACHE_DIR = DATA_DIR / '.cache'
+CUSTOMER_FEATURE_STORE = DATA_DIR / 'customer_features.npz'
+
+# Per-customer predictions written by `manage.py score_customers`
+CUSTOMER_SCORES = DATA_DIR / 'customer_scores.sqlite3'
+
+# Materialized predictions the customer views answer code_customer lookups
+# from, kept current by `manage.py refresh_predictions`
+CUSTOMER_PREDICTIONS = DATA_DIR / 'customer_predictions.sqlite3'
+
+# Indexed SQLite star schema of the exports, built by `manage.py build_warehouse`
+WAREHOUSE_DB = DATA_DIR / 'warehouse.sqlite3'
+
+# Thread pool size and per-model deadline (seconds) for the all-models
+# predict_view fan-out
+ML_FANOUT_WORKERS = 8
+ML_MODEL_TIMEOUT = 5.0
+
+# Serve RandomForest/DecisionTree/XGBoost models with the flattened NumPy
+# evaluator in ml_app.tree_engine instead of the library's predict(). Opt-in:
+# enable it once the compiled models have been checked against predict()
+ML_TREE_ENGINE = False
+
+# Memory-mapped tree stores written by `manage.py compile_models`
+ML_MODEL_STORE = BASE_DIR / 'models' / 'compiled'
+
+# Single-file model bundles written by `manage.py package_models`
+ML_BUNDLE_DIR = BASE_DIR / 'models' / 'bundles'
+
+# Seconds between checks of models/ for changed artifacts (0 disables hot reload)
+ML_RELOAD_INTERVAL = 5
+
+# Upper bound in bytes on the models kept loaded per worker; least recently
+# used models are evicted beyond it (None keeps everything loaded)
+ML_MEMORY_BUDGET = None
+
+# Load every model and score a synthetic row in the background from a server
+# worker's first request; /ml/health/ready answers 503 until that has finished.
+# Servers opt in with ML_WARMUP=1 in their environment, so scripts, notebooks
+# and tests that set Django up never start the warmup thread.
+ML_WARMUP = os.environ.get('ML_WARMUP') == '1'
+
+# Time parse/load/encode/scale/predict/render stages of each request and
+# report them in a Server-Timing response header (off removes the middleware)
+ML_SERVER_TIMING = True
+
+# Count and time requests, predictions and model loads, served at /metrics
+# in the Prometheus text format (off removes the middleware and the endpoint)
+ML_METRICS = True
@@ -17,8 +17,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from ml_app.api import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path("accounts/", include("accountsApp.urls")),
     path('ml/', include('ml_app.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]